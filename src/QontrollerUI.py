@@ -7,7 +7,6 @@ from PyQt5.QtWidgets import QProgressBar, QCheckBox, QRadioButton, QComboBox, QS
 from PyQt5.QtCore import pyqtSignal, QThread
 import os
 from . import qontroller
-import json
 import datetime as dt
 import time
 import subprocess
@@ -27,16 +26,28 @@ import getpass
 #from .device import Device, DeviceInstaller
 #from .picam_settings import PicamSettings
 
-from .device_manager import DeviceManager
+from .device_manager import DeviceManager, device_label
+from .device import CONNECTED, OFFLINE
 
-from .dialog_windows import showdialogInfo
+from .dialog_windows import showdialogInfo, showdialogWarning
 from .config_wizard import ConfigWizard, load_config, save_config, is_config_outdated
 from src.diagnostic_tools.diagnostic_window import SelfCheckWindow
+from .mosaic_view import MosaicWindow, TILE_SIZE
+from .async_bridge import AsyncBridge
+from .log_panel import LogPanel
+from .metrics_panel import MetricsPanel
+from . import tracing
 
 
 IR_PIN = 17
 OG_PIN = 18
 
+# Period of the background refresh of the device list status (running devices in italic)
+DEVICE_STATUS_INTERVAL_MS = 15000
+# Minimum time between two live view polls of the device, longer while the frame does not change
+LIVE_VIEW_MIN_INTERVAL = 0.25
+LIVE_VIEW_IDLE_INTERVAL = 1.0
+
 
 def get_device_updatable_status(device):
     return not device.is_uptodate
@@ -117,15 +128,20 @@ class Worker(QtCore.QObject):
         QtCore.QObject.__init__(self, parent=parent)
         self.continue_run = True  # provide a bool run condition for the class
         self.main_window = main_window
+        self._wake = threading.Event()  # Interrupts the wait between two polls on stop
 
     def do_work(self):
         while self.continue_run:  # give the loop a stoppable condition
-            #QtCore.QThread.sleep(1)
-            self.main_window.refresh_view()
+            start = time.monotonic()
+            new_frame = self.main_window.refresh_view()
+            # An unchanged frame costs only a stat: do not poll the device in a tight loop
+            interval = LIVE_VIEW_MIN_INTERVAL if new_frame else LIVE_VIEW_IDLE_INTERVAL
+            self._wake.wait(max(0.0, interval - (time.monotonic() - start)))
         self.finished.emit()  # emit the finished signal when the loop is done
 
     def stop(self):
         self.continue_run = False  # set the run condition to false on stop
+        self._wake.set()
 
 class ContextmenuDevice(QtWidgets.QMenu):
     def __init__(self):
@@ -138,6 +154,9 @@ class ContextmenuDevice(QtWidgets.QMenu):
 
 class QontrollerUI(QtWidgets.QMainWindow, qontroller.Ui_MainWindow):
     stop_signal = QtCore.pyqtSignal()
+    frame_status_signal = QtCore.pyqtSignal(str)  # Emitted from the live view thread, shown in the status bar
+    frame_ready_signal = QtCore.pyqtSignal(object, QtGui.QImage)  # Frame and its decoded image, from any thread
+    stream_closed_signal = QtCore.pyqtSignal()
 
     def __init__(self, parent=None):
         super(QontrollerUI, self).__init__(parent)
@@ -163,6 +182,8 @@ class QontrollerUI(QtWidgets.QMainWindow, qontroller.Ui_MainWindow):
 
 
         self.setupUi(self)
+        self.setup_preview_size_widgets()
+        self.setup_menu_actions()
 
         #self.resize(QtWidgets.QDesktopWidget().availableGeometry(self).size() * 0.8)
         self.centerandresize()
@@ -187,6 +208,11 @@ class QontrollerUI(QtWidgets.QMainWindow, qontroller.Ui_MainWindow):
         self.stop_count = 0
 
         self.full_pixmap = None
+        self.full_pixmap_is_scaled = False  # True when only a reduced-size decode of the frame is displayed
+        self.current_frame = None
+        self.full_frame_pending = False
+        self.view_size = self.scrollArea.size()  # Kept up to date from the GUI thread, read by the workers
+        self.scrollArea.installEventFilter(self)
         self.zoom_value = self.sliderZoom.value()
         self.fit_view_status = self.btnFitView.isChecked()
 
@@ -198,7 +224,10 @@ class QontrollerUI(QtWidgets.QMainWindow, qontroller.Ui_MainWindow):
         # sel default value for comboCurrent to 37.5mA
         self.comboCurrent.setCurrentIndex(3)
 
-        self.dm = DeviceManager()
+        self.dm = DeviceManager(use_agent=self.config.get("use_remote_agent", False),
+                                snapshot_ttl=self.config.get("snapshot_ttl", 2.0),
+                                connect_parallelism=self.config.get("connect_parallelism", 16),
+                                key_filename=self.config.get("ssh_key_file"))
 
         # Signals
 
@@ -224,6 +253,25 @@ class QontrollerUI(QtWidgets.QMainWindow, qontroller.Ui_MainWindow):
 
         self.btnStopRecord.clicked.connect(self.uncheck_live_view)
 
+        self.frame_status_signal.connect(self.statusbar.showMessage)
+        self.frame_ready_signal.connect(self.show_frame)
+        self.stream_closed_signal.connect(self.on_frame_stream_closed)
+        self.frame_stream = None
+        self.mosaic_window = None
+        self.log_panel = None
+        self.metrics_panel = None
+
+        # Fleet-wide status checks run on an asyncio loop, results come back on the GUI thread
+        self.async_bridge = AsyncBridge(self)
+        self.device_status_pending = False
+        self.device_status_timer = QtCore.QTimer(self)
+        self.device_status_timer.timeout.connect(self.refresh_device_status)
+        self.device_status_timer.start(DEVICE_STATUS_INTERVAL_MS)
+
+        # Connection state changes of the devices (lost, reconnecting, back online) are shown in the list
+        self.dm.signals.state_changed.connect(self.on_device_state_changed)
+        self.dm.start_monitor()
+
         # create context menu - not used anymore
         self.popMenu = QtWidgets.QMenu(self)
         self.popMenu.addAction(QtWidgets.QAction('test0', self, triggered=self.test_function))
@@ -267,11 +315,23 @@ class QontrollerUI(QtWidgets.QMainWindow, qontroller.Ui_MainWindow):
     def cleanup(self):
         print("Cleaning up")
 
+        self.stop_frame_stream()
+        self.device_status_timer.stop()
+        self.async_bridge.stop()
+
         # Set all sliders to 0 (which should represent the 'off' state)
-        # This is to ensure that the LEDs are turned off when the program is closed (it will call the switch_led function)
-        self.slider_switch_led.setValue(0)
-        self.slider_switch_led_OG.setValue(0)
-        self.slider_switch_led_blue.setValue(0)
+        # This is to ensure that the LEDs are turned off when the program is closed. The event loop is stopped,
+        # so switch_led is called directly and waits for the devices
+        for color, slider in (('IR', self.slider_switch_led), ('Orange', self.slider_switch_led_OG),
+                              ('Blue', self.slider_switch_led_blue)):
+            if slider.value() != 0:
+                slider.blockSignals(True)
+                slider.setValue(0)
+                slider.blockSignals(False)
+                self.switch_led(color, wait=True)
+
+        # Last: switch_led above runs on the executor of the device manager
+        self.dm.shutdown()
 
 
     def check_date(self):
@@ -302,6 +362,44 @@ class QontrollerUI(QtWidgets.QMainWindow, qontroller.Ui_MainWindow):
 
 
 
+    def setup_preview_size_widgets(self):
+        # Preview frames can be downscaled on the device before transfer (None: full resolution)
+        self.preview_sizes = {"Full": None, "1280 px": (1280, 960), "640 px": (640, 480)}
+
+        self.labelPreviewSize = QLabel("Preview size", self.scrollAreaWidgetContents_9)
+        self.comboPreviewSize = QComboBox(self.scrollAreaWidgetContents_9)
+        self.comboPreviewSize.addItems(self.preview_sizes.keys())
+        self.gridLayout_6.addWidget(self.labelPreviewSize, 9, 0, 1, 1)
+        self.gridLayout_6.addWidget(self.comboPreviewSize, 9, 1, 1, 1)
+
+    def setup_menu_actions(self):
+        self.actionDeviceLogs = QtWidgets.QAction("Device logs", self)
+        self.actionDeviceLogs.triggered.connect(self.show_log_panel)
+        self.menuView.addAction(self.actionDeviceLogs)
+
+        self.actionRemoteCallStatistics = QtWidgets.QAction("Remote call statistics", self)
+        self.actionRemoteCallStatistics.triggered.connect(self.show_metrics_panel)
+        self.menuView.addAction(self.actionRemoteCallStatistics)
+
+        self.actionPullRecordings = QtWidgets.QAction("Pull recordings...", self)
+        self.actionPullRecordings.triggered.connect(self.pull_recordings)
+        self.menutype_here.addAction(self.actionPullRecordings)
+
+        self.actionInstallSshKeys = QtWidgets.QAction("Install SSH keys", self)
+        self.actionInstallSshKeys.triggered.connect(self.install_ssh_keys)
+        self.menutype_here.addAction(self.actionInstallSshKeys)
+
+        self.actionSaveTrace = QtWidgets.QAction("Save trace...", self)
+        self.actionSaveTrace.triggered.connect(self.save_trace)
+        self.menutype_here.addAction(self.actionSaveTrace)
+
+    def preview_size(self):
+        """Preview resolution selected by the user, None for full resolution frames."""
+        # Zooming past 100% needs the full resolution
+        if not self.fit_view_status and self.sliderZoom.value() > 100:
+            return None
+        return self.preview_sizes[self.comboPreviewSize.currentText()]
+
     def centerandresize(self, rat=[0.75, 0.75]):
         geo = QtWidgets.QDesktopWidget().availableGeometry()
         w, h = geo.width(), geo.height()
@@ -347,6 +445,9 @@ class QontrollerUI(QtWidgets.QMainWindow, qontroller.Ui_MainWindow):
                                    "Otherwise, it will acquire a new frame.")
         self.sliderZoom.setToolTip("Adjust the zoom level of the displayed image.")
         self.btnFitView.setToolTip("Fit the image to the view area.")
+        self.comboPreviewSize.setToolTip("Resolution of the preview frames. Smaller previews are downscaled on the device "
+                                         "and are much faster to transfer. The full resolution frame is fetched when "
+                                         "zooming past 100%.")
         self.btnOriginalView.setToolTip("Reset the image to its original size.")
         self.btnLiveView.setToolTip("Toggle live view mode. When enabled, the view will automatically refresh every second. "
                                     "Avoid using on recording devices as it may slow down the recording process.")
@@ -417,7 +518,9 @@ class QontrollerUI(QtWidgets.QMainWindow, qontroller.Ui_MainWindow):
                 widget.installEventFilter(self)  # Install the event filter
 
     def eventFilter(self, source, event):
-        if event.type() == QtCore.QEvent.Enter:
+        if source is self.scrollArea and event.type() == QtCore.QEvent.Resize:
+            self.view_size = event.size()
+        elif event.type() == QtCore.QEvent.Enter:
             if isinstance(source, QtWidgets.QWidget):
                 help_text = source.toolTip()
                 self.label_help.setText(help_text)
@@ -454,59 +557,159 @@ class QontrollerUI(QtWidgets.QMainWindow, qontroller.Ui_MainWindow):
     def scan_devices(self):
         """Scan and display devices in the UI."""
         # Populate devices in DeviceManager
-        self.dm.scan_devices(filename=self.config["hosts_list_file"],username=self.config["username"])
+        scan_report = self.dm.scan_devices(filename=self.config["hosts_list_file"],username=self.config["username"])
+        message = f"Connected to {len(self.dm.host_list)}/{len(scan_report)} devices"
+        if self.dm.auth_failed_hosts:
+            message += f", SSH key refused by {len(self.dm.auth_failed_hosts)} (File > Install SSH keys)"
+        self.statusbar.showMessage(message)
 
         self.listBoxDevices.clear()
-        for device in self.dm.host_list:
+        snapshots = self.dm.snapshots(self.dm.host_list)
+        for device, snapshot in zip(self.dm.host_list, snapshots):
             new_item = QtWidgets.QListWidgetItem(device.name)
             new_item.setFlags(new_item.flags() | QtCore.Qt.ItemIsUserCheckable)
             new_item.setCheckState(QtCore.Qt.Checked)
 
             # If the device is running, make the text italic
-            if device.is_running:
+            if snapshot is not None and snapshot.is_running:
                 font = new_item.font()
                 font.setItalic(True)
                 new_item.setFont(font)
 
             self.listBoxDevices.addItem(new_item)
+            self.show_device_state(new_item, device)
+
+    @QtCore.pyqtSlot(object, str)
+    def on_device_state_changed(self, device, state):
+        if device in self.dm.host_list:
+            item = self.listBoxDevices.item(self.dm.host_list.index(device))
+            if item is not None:
+                self.show_device_state(item, device)
+        self.statusbar.showMessage(f"{device.name} is {state}")
+
+    def show_device_state(self, item, device):
+        """Show the connection state of a device in its list item, when it is not connected normally."""
+        state = device.state
+        item.setText(device.name if state == CONNECTED else f"{device.name} ({state})")
+        item.setForeground(QtGui.QBrush(QtCore.Qt.gray if state == OFFLINE else
+                                        self.listBoxDevices.palette().text().color()))
+
+    def refresh_device_status(self):
+        """Refresh the running status shown in the device list, without blocking the GUI."""
+        if self.device_status_pending or self.dm.is_empty:
+            return
+
+        devices = list(self.dm.host_list)
+        self.device_status_pending = True
+        self.async_bridge.submit(self.dm.run_on(devices, lambda device: device.snapshot(), timeout=10),
+                                 callback=lambda snapshots: self.update_device_status(devices, snapshots),
+                                 errback=self.on_device_status_failed)
+
+    def update_device_status(self, devices, snapshots):
+        self.device_status_pending = False
+        for row, (device, snapshot) in enumerate(zip(devices, snapshots)):
+            item = self.listBoxDevices.item(row)
+            # Skip failed devices, and results of a scan that has since been replaced
+            if isinstance(snapshot, Exception) or item is None or self.dm.get_device_by_id(row) is not device:
+                continue
+            font = item.font()
+            font.setItalic(snapshot.is_running)
+            item.setFont(font)
+
+    def on_device_status_failed(self, error):
+        self.device_status_pending = False
+        print(f"Could not refresh the device status: {error}")
 
     def refresh_view(self):
+        """:return: True if a new frame was displayed"""
         try:
             if self.currentDeviceID is not None:
                 # get the device currently selected
                 currentDevice = self.dm.get_device_by_id(self.currentDeviceID)
 
                 if currentDevice is None:
-                    return
-
-                config = self.generate_json_config_from_GUI_widgets(preview_mode=True)
-                file = self.save_json_config_file(config)
-
-                remote_path = currentDevice.receive_json_config_file(file)
-                os.remove(file)
+                    return False
 
-                self.full_pixmap = currentDevice.get_frame(remote_path)
-                # self.labelDisplay.setPixmap(self.full_pixmap)
-
-                self.display_frame_pixmap(self.full_pixmap)
+                with tracing.span("refresh_view", "refresh_view", device=currentDevice.name) as trace:
+                    return self.refresh_device_view(currentDevice, trace)
 
                 # self.switch_led_IR()
                 # self.switch_led_OG()
 
             else:
                 print("Please first select a device")
-        except paramiko.ssh_exception.SSHException:
-            print("Connection with devices lost, please rescan for devices")
+        except paramiko.ssh_exception.SSHException as e:
+            # Includes DeviceOfflineError: the device reconnects on its own, see Device.connection_lost
+            self.frame_status_signal.emit(f"Connection with the device lost, reconnecting automatically ({e})")
         except ConnectionResetError:
-            print("Connection with devices lost, please rescan for devices")
+            self.frame_status_signal.emit("Connection with the device lost, reconnecting automatically")
+        return False
+
+    def refresh_device_view(self, device, trace):
+        """
+        Stages of refresh_view, each in its own tracing span.
+        :return: True if a new frame was displayed
+        """
+        preview_size = self.preview_size()
+
+        with tracing.span("generate_config", "refresh_view"):
+            config = self.generate_json_config_from_GUI_widgets(preview_mode=True, preview_resolution=preview_size)
+        with tracing.span("push_config", "refresh_view"):
+            # Only uploaded if the parameters changed since the last frame
+            remote_path = device.push_config(config)
+
+        with tracing.span("get_frame", "refresh_view"):
+            frame = device.get_frame(remote_path, preview_size=preview_size)
+        if frame is None:
+            trace["result"] = "no frame"
+            return False
+
+        if frame.is_new or frame is not self.current_frame:
+            trace["result"] = "new frame"
+            frame.trace_flow = tracing.tracer.new_flow_id()
+            # Decode here, in the calling (worker) thread; the GUI thread only converts it to a pixmap
+            with tracing.span("decode", "refresh_view", flow=frame.trace_flow, flow_start=True, bytes=frame.size):
+                image = frame.decode(self.decode_target_size())
+            self.frame_ready_signal.emit(frame, image)
+            self.frame_status_signal.emit(f"{device.name}: new frame")
+            return True
+
+        trace["result"] = "frame unchanged"
+        # Nothing was downloaded, the displayed frame is still the latest one
+        self.frame_status_signal.emit(f"{device.name}: frame unchanged, {frame.age:.0f} s old")
+        return False
+
+    def decode_target_size(self):
+        """Size frames should be decoded to: the view size when fitting the view, None for full resolution."""
+        return QtCore.QSize(self.view_size) if self.fit_view_status else None
+
+    @QtCore.pyqtSlot(object, QtGui.QImage)
+    def show_frame(self, frame, image):
+        """Display a frame decoded by a worker thread. Only the QImage to QPixmap conversion happens here."""
+        with tracing.span("show_frame", "refresh_view", flow=frame.trace_flow):
+            self.current_frame = frame
+            self.full_pixmap = QtGui.QPixmap.fromImage(image)
+            self.full_pixmap_is_scaled = image.width() < frame.image_size().width()
+            self.display_frame_pixmap(self.full_pixmap)
+
+    def full_resolution_pixmap(self):
+        """Return the current frame at full resolution, decoding it now if only a reduced-size decode is available."""
+        if self.full_pixmap_is_scaled and self.current_frame is not None:
+            self.full_pixmap = QtGui.QPixmap.fromImage(self.current_frame.decode())
+            self.full_pixmap_is_scaled = False
+        return self.full_pixmap
 
     def display_frame_pixmap(self, pxm):
         if pxm is not None:
             if self.fit_view_status:
-                self.labelDisplay.setPixmap(pxm.scaled(self.scrollArea.size(), QtCore.Qt.KeepAspectRatio))
+                target_size = pxm.size().scaled(self.scrollArea.size(), QtCore.Qt.KeepAspectRatio)
+                # Frames decoded at the view size can be shown as is
+                self.labelDisplay.setPixmap(pxm if pxm.size() == target_size else
+                                            pxm.scaled(target_size, QtCore.Qt.KeepAspectRatio))
             else:
-                self.labelDisplay.setPixmap(pxm.scaled(self.full_pixmap.size() * self.sliderZoom.value() / 100,
-                                                                    QtCore.Qt.KeepAspectRatio))
+                full_pixmap = self.full_resolution_pixmap()
+                self.labelDisplay.setPixmap(full_pixmap.scaled(full_pixmap.size() * self.sliderZoom.value() / 100,
+                                                               QtCore.Qt.KeepAspectRatio))
 
     def auto_refresh(self):
         while self.do_auto_refresh:
@@ -518,7 +721,34 @@ class QontrollerUI(QtWidgets.QMainWindow, qontroller.Ui_MainWindow):
 
 
     def zoom(self):
-        self.labelDisplay.setPixmap(self.full_pixmap.scaled(self.full_pixmap.size()*self.sliderZoom.value()/100, QtCore.Qt.KeepAspectRatio))
+        if self.sliderZoom.value() > 100 and self.current_frame is not None and self.current_frame.is_preview:
+            self.request_full_resolution_frame()
+
+        full_pixmap = self.full_resolution_pixmap()
+        if full_pixmap is None:
+            return
+        self.labelDisplay.setPixmap(full_pixmap.scaled(full_pixmap.size()*self.sliderZoom.value()/100, QtCore.Qt.KeepAspectRatio))
+
+    def request_full_resolution_frame(self):
+        """Fetch the full resolution version of the displayed preview, in the background."""
+        if self.full_frame_pending or self.currentDeviceID is None:
+            return
+
+        device = self.dm.get_device_by_id(self.currentDeviceID)
+        if device is None:
+            return
+
+        def fetch():
+            try:
+                frame = device.read_last_frame()
+                self.frame_ready_signal.emit(frame, frame.decode())
+            except (paramiko.ssh_exception.SSHException, IOError) as e:
+                print(f"Could not fetch the full resolution frame: {e}")
+            finally:
+                self.full_frame_pending = False
+
+        self.full_frame_pending = True
+        threading.Thread(target=fetch, daemon=True).start()
 
     def fit_view(self, pxm):
         if self.fit_view_status:
@@ -532,9 +762,10 @@ class QontrollerUI(QtWidgets.QMainWindow, qontroller.Ui_MainWindow):
         # Return timeout in seconds
         return self.spinTimeout.value() * (60 ** self.comboTimeoutUnit.currentIndex())
 
-    def generate_json_config_from_GUI_widgets(self, preview_mode):
+    def generate_json_config_from_GUI_widgets(self, preview_mode, preview_resolution=None):
         """
         :param preview_mode: bool, if true, only one frame is captured
+        :param preview_resolution: optional (width, height) of the preview frames, in preview mode only
         :return: dictionary containing all the GUI input
         """
 
@@ -571,30 +802,23 @@ class QontrollerUI(QtWidgets.QMainWindow, qontroller.Ui_MainWindow):
         if preview_mode:
             json_dict["timeout"] = 0
             json_dict["use_samba"] = False
+            if preview_resolution is not None:
+                json_dict["preview_resolution"] = list(preview_resolution)
             #json_dict["local_tmp_dir"] = json_dict["local_tmp_dir"]
 
         #return f'"{json.dumps(json_dict)}"'
         return json_dict
 
-    def save_json_config_file(self, json_config, filename=None):
-        """
-        :param json_config: dictionary of the configuration
-        :param filename: output filename to save the file containing the json configuration
-        :return: the output filename
-        """
-        if filename is None:
-            filename = f'wormstation_{dt.datetime.now().strftime("%Y%m%d_%H%M")}.json'
-        with open(filename, 'w') as jfile:
-            json.dump(json_config, jfile, indent=4)
-
-        return filename
-
-
-
-
     @QtCore.pyqtSlot(QtWidgets.QListWidgetItem, QtWidgets.QListWidgetItem)
     def current_item_changed(self, d0,d1):
         self.currentDeviceID = self.listBoxDevices.currentRow()
+
+        # A frame stream is bound to one device: move live view to the new one
+        if self.frame_stream is not None:
+            self.stop_frame_stream()
+            if self.btnLiveView.isChecked() and not self.start_frame_stream():
+                self.start_live_view_worker()
+
         self.refresh_view()
 
 
@@ -644,7 +868,6 @@ class QontrollerUI(QtWidgets.QMainWindow, qontroller.Ui_MainWindow):
         devices_marked_for_recording = self.get_devices_selected_devices()
 
         config = self.generate_json_config_from_GUI_widgets(preview_mode=False)
-        file = self.save_json_config_file(config)
 
         # Check if all devices are up-to-date
         updatable_devices = self.on_btnCheckUpdates_clicked(devices_marked_for_recording)
@@ -665,7 +888,6 @@ class QontrollerUI(QtWidgets.QMainWindow, qontroller.Ui_MainWindow):
             if dialog.clickedButton() == cancel_button:
                 # User chose to cancel
                 print("Recording canceled by user.")
-                os.remove(file)
                 return
 
             elif dialog.clickedButton() == run_anyway_button:
@@ -677,12 +899,48 @@ class QontrollerUI(QtWidgets.QMainWindow, qontroller.Ui_MainWindow):
                 print("Updating devices before recording.")
                 self.dm.update_all_devices()
 
-        # If no updates are needed or user chose to proceed, start the recording
-        for d in devices_marked_for_recording:
-            remote_path = d.receive_json_config_file(file)
-            d.record(remote_path)
+        # If no updates are needed or user chose to proceed, prepare all devices, then start them at the same time
+        self.btnRecord.setEnabled(False)
+        self.statusbar.showMessage(f"Preparing {len(devices_marked_for_recording)} devices for recording...")
+        self.async_bridge.run_in_background(self.dm.prepare_recordings, devices_marked_for_recording, config,
+                                            callback=self.on_recording_prepared,
+                                            errback=self.on_recording_start_failed)
+
+    def on_recording_prepared(self, result):
+        not_ready = result.failed + result.timed_out
+        details = "\n".join(f"{device_label(outcome.device)}: {outcome.error or 'no answer'}" for outcome in not_ready)
+
+        if not result.succeeded:
+            self.btnRecord.setEnabled(True)
+            showdialogWarning("No device is ready to record.", details)
+            return
+
+        if not_ready:
+            answer = QMessageBox.question(self, "Devices not ready",
+                                          f"{len(not_ready)} devices are not ready to record:\n\n{details}\n\n"
+                                          f"Start the recording on the {len(result.succeeded)} other devices?")
+            if answer != QMessageBox.Yes:
+                self.btnRecord.setEnabled(True)
+                return
 
-        os.remove(file)
+        self.statusbar.showMessage(f"Starting the recording on {len(result.succeeded)} devices at the same time...")
+        self.async_bridge.run_in_background(self.dm.commit_recordings, result.succeeded,
+                                            callback=self.on_recording_started,
+                                            errback=self.on_recording_start_failed)
+
+    def on_recording_started(self, result):
+        self.btnRecord.setEnabled(True)
+        spread = self.dm.start_spread(result)
+        self.statusbar.showMessage(result.summary() if spread is None else
+                                   f"{result.summary()}, start spread {spread * 1000:.0f} ms")
+        self.refresh_device_status()
+
+        if result.failed or result.timed_out:
+            showdialogWarning("Some devices did not start recording.", self.dm.start_report(result))
+
+    def on_recording_start_failed(self, error):
+        self.btnRecord.setEnabled(True)
+        showdialogWarning("The recording could not be started.", str(error))
 
 
     def start_timer(self):
@@ -711,8 +969,11 @@ class QontrollerUI(QtWidgets.QMainWindow, qontroller.Ui_MainWindow):
             self.stop_count = 0
 
 
-    def switch_led(self, color, current='37.5mA', all_devices=False):
-        """Switch the specified LED on or off based on slider value."""
+    def switch_led(self, color, current='37.5mA', all_devices=False, wait=False):
+        """
+        Switch the specified LED on or off based on slider value, on the devices that are not running.
+        :param wait: wait for the devices instead of switching them in the background
+        """
         # Determine the correct slider for the color
         slider = {
             'IR': self.slider_switch_led,
@@ -729,29 +990,136 @@ class QontrollerUI(QtWidgets.QMainWindow, qontroller.Ui_MainWindow):
         current = self.comboCurrent.currentText()
 
         # Get the devices that should have their LEDs controlled
-        device_list = self.host_list if all_devices else self.get_devices_selected_devices()
-
-        # Filter out running devices
-        device_list = [d for d in device_list if not d.is_running]
+        device_list = self.host_list if all_devices else self.get_devices_selected_devices(exclude_running=False)
 
-        self.dm.switch_led(color, status, current, device_list)
+        # Running devices are filtered out by the device manager: their status takes a round trip to each device
+        if wait:
+            self.dm.switch_led(color, status, current, device_list, True)
+        else:
+            self.async_bridge.run_in_background(self.dm.switch_led, color, status, current, device_list, True)
 
     def get_devices_selected_devices(self, exclude_running=True):
         """Get devices marked for recording based on list box selections, optionally excluding running devices."""
-        selected_devices = []
         list_box = self.listBoxDevices
-        for i in range(list_box.count()):
-            item = list_box.item(i)
-            if item.checkState():
-                device = self.dm.host_list[i]
-                if not (exclude_running and device.is_running):
-                    selected_devices.append(device)
-        return selected_devices
+        checked_devices = [self.dm.host_list[i] for i in range(list_box.count()) if list_box.item(i).checkState()]
+
+        if not exclude_running:
+            return checked_devices
+
+        # Refresh the status of all checked devices in parallel
+        snapshots = self.dm.snapshots(checked_devices)
+        # Devices that did not answer are left out as well
+        return [device for device, snapshot in zip(checked_devices, snapshots)
+                if snapshot is not None and not snapshot.is_running]
+
+
+
 
 
 
+    @QtCore.pyqtSlot()
+    def on_actionMosaic_triggered(self):
+        """Show the thumbnails of all checked devices side by side."""
+        devices = self.get_devices_selected_devices(exclude_running=False)
+        if not devices:
+            showdialogInfo("Please check the devices to display in the mosaic.")
+            return
+
+        if self.mosaic_window is not None:
+            self.mosaic_window.close()
+
+        self.mosaic_window = MosaicWindow(self.dm, devices, lambda: self.generate_json_config_from_GUI_widgets(
+            preview_mode=True, preview_resolution=TILE_SIZE), parent=self)
+        self.mosaic_window.show()
+
+    def pull_recordings(self):
+        """Download the recordings left on the devices, e.g. when the NAS was not available."""
+        if not self.dm.host_list:
+            showdialogInfo("No device connected.")
+            return
+        destination = QFileDialog.getExistingDirectory(self, "Pull recordings to")
+        if not destination:
+            return
+
+        # Optional cap in Mbit/s, so the transfer does not saturate the network during a recording
+        max_bandwidth_mbps = self.config.get("max_download_mbps")
+        max_bandwidth = max_bandwidth_mbps * 1e6 / 8 if max_bandwidth_mbps else None
+        last_update = [0.0]
+
+        def on_progress(device, remote_file, bytes_done):
+            # Called from the download threads, for every window read
+            if time.monotonic() - last_update[0] > 0.5:
+                last_update[0] = time.monotonic()
+                self.frame_status_signal.emit(f"Pulling recordings: {device.name}: {remote_file.relative_path} "
+                                              f"{bytes_done / 1024 ** 2:.0f}/{remote_file.size / 1024 ** 2:.0f} MB")
+
+        self.actionPullRecordings.setEnabled(False)
+        self.statusbar.showMessage(f"Pulling recordings from {len(self.dm.host_list)} devices...")
+        self.async_bridge.run_in_background(self.dm.pull_recordings, self.config, destination, None, max_bandwidth,
+                                            on_progress, callback=self.on_recordings_pulled,
+                                            errback=self.on_recordings_pull_failed)
+
+    def on_recordings_pulled(self, result):
+        self.actionPullRecordings.setEnabled(True)
+        self.statusbar.showMessage(f"Recordings pulled: {result.summary()}")
+
+        details = "\n".join(f"{device_label(outcome.device)}: {outcome.value if outcome.ok else outcome.error}"
+                            for outcome in result)
+        incomplete = result.failed + [outcome for outcome in result.succeeded if outcome.value.errors]
+        if incomplete:
+            showdialogWarning("Some recordings could not be pulled, run it again to resume.", details)
+        else:
+            showdialogInfo(f"Recordings pulled.\n\n{details}")
+
+    def on_recordings_pull_failed(self, error):
+        self.actionPullRecordings.setEnabled(True)
+        showdialogWarning("The recordings could not be pulled.", str(error))
+
+    def show_log_panel(self):
+        """Show the output of the devices, starting with the selected one."""
+        if self.log_panel is not None:
+            self.log_panel.close()
+
+        current_device = self.dm.get_device_by_id(self.currentDeviceID) if self.currentDeviceID is not None else None
+        self.log_panel = LogPanel(list(self.dm.host_list), current_device, parent=self)
+        self.log_panel.show()
+
+    def install_ssh_keys(self):
+        """Install the SSH key on the devices that refused it at the last scan, asking for their passwords in turn."""
+        hosts = list(self.dm.auth_failed_hosts)
+        if not hosts:
+            showdialogInfo("All devices of the last scan accepted the SSH key.")
+            return
+
+        showdialogInfo(f"The SSH key will be installed on {len(hosts)} devices, one at a time. "
+                       f"Enter the password of each device in the terminal when asked.")
+        installed = self.dm.install_ssh_keys(hosts, self.config["username"])
+        if installed:
+            self.scan_devices()
+        if len(installed) < len(hosts):
+            showdialogWarning(f"The SSH key could not be installed on {len(hosts) - len(installed)} devices.",
+                              "\n".join(host for host in hosts if host not in installed))
+
+    def save_trace(self):
+        """Save the recent tracing spans (frame refreshes, remote calls) for a trace viewer such as ui.perfetto.dev."""
+        spans = len(tracing.tracer.spans)
+        if not spans:
+            showdialogInfo("Nothing was traced yet: refresh a frame or start live view first.")
+            return
+
+        name = f"wormstation_trace_{dt.datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
+        path, _ = QFileDialog.getSaveFileName(self, "Save trace", name, "Chrome trace (*.json)")
+        if path:
+            tracing.tracer.save(path)
+            self.statusbar.showMessage(f"{spans} spans saved to {path}")
 
+    def show_metrics_panel(self):
+        """Show the latency, errors and bytes of the remote calls to the devices."""
+        if self.metrics_panel is not None:
+            self.metrics_panel.close()
 
+        self.metrics_panel = MetricsPanel(parent=self)
+        self.metrics_panel.show()
 
     @QtCore.pyqtSlot(bool)
     def on_btnFitView_clicked(self, checked):
@@ -769,28 +1137,75 @@ class QontrollerUI(QtWidgets.QMainWindow, qontroller.Ui_MainWindow):
 
     @QtCore.pyqtSlot()
     def on_btnOriginalView_clicked(self):
-        self.labelDisplay.setPixmap(self.full_pixmap)
+        self.labelDisplay.setPixmap(self.full_resolution_pixmap())
 
     @QtCore.pyqtSlot(bool)
     def on_btnLiveView_clicked(self, checked):
         self.do_auto_refresh = checked
         if checked:
-            self.thread = QtCore.QThread()
-            self.worker = Worker(self)
-            self.stop_signal.connect(self.worker.stop)  # connect stop signal to worker stop method
-            self.worker.moveToThread(self.thread)
-
-            self.worker.finished.connect(self.thread.quit)  # connect the workers finished signal to stop thread
-            self.worker.finished.connect(self.worker.deleteLater)  # connect the workers finished signal to clean up worker
-            self.thread.finished.connect(self.thread.deleteLater)  # connect threads finished signal to clean up thread
-
-            self.thread.started.connect(self.worker.do_work)
-            self.thread.finished.connect(self.worker.stop)
-            # self.auto_refresh()
-            self.thread.start()
+            # Prefer frames pushed by the device, poll if it cannot stream
+            if not self.start_frame_stream():
+                self.start_live_view_worker()
         else:
+            self.stop_frame_stream()
             self.stop_thread()
 
+    def start_live_view_worker(self):
+        """Poll the current device for frames in a loop, from a worker thread."""
+        self.thread = QtCore.QThread()
+        self.worker = Worker(self)
+        self.stop_signal.connect(self.worker.stop)  # connect stop signal to worker stop method
+        self.worker.moveToThread(self.thread)
+
+        self.worker.finished.connect(self.thread.quit)  # connect the workers finished signal to stop thread
+        self.worker.finished.connect(self.worker.deleteLater)  # connect the workers finished signal to clean up worker
+        self.thread.finished.connect(self.thread.deleteLater)  # connect threads finished signal to clean up thread
+
+        self.thread.started.connect(self.worker.do_work)
+        self.thread.finished.connect(self.worker.stop)
+        # self.auto_refresh()
+        self.thread.start()
+
+    def start_frame_stream(self):
+        """Subscribe to the frames pushed by the current device. Return False if polling is needed instead."""
+        if self.currentDeviceID is None:
+            return False
+
+        device = self.dm.get_device_by_id(self.currentDeviceID)
+
+        # Only a recording device writes new frames by itself
+        if device is None or device.snapshot().recording_status != 'Recording is ongoing':
+            return False
+
+        def on_frame(frame):
+            # Called from the stream reader thread, where the frame is decoded
+            frame.trace_flow = tracing.tracer.new_flow_id()
+            with tracing.span("decode", "frame_stream", device=device.name, flow=frame.trace_flow, flow_start=True,
+                              bytes=frame.size):
+                image = frame.decode(self.decode_target_size())
+            self.frame_ready_signal.emit(frame, image)
+            self.frame_status_signal.emit(f"{device.name}: frame pushed at {dt.datetime.now().strftime('%H:%M:%S')}")
+
+        self.frame_stream = device.open_frame_stream(on_frame, self.stream_closed_signal.emit,
+                                                     preview_size=self.preview_size())
+        if self.frame_stream is None:
+            return False
+
+        self.statusbar.showMessage(f"{device.name}: waiting for frames pushed by the device")
+        return True
+
+    def stop_frame_stream(self):
+        if self.frame_stream is not None:
+            self.frame_stream.stop()
+            self.frame_stream = None
+
+    @QtCore.pyqtSlot()
+    def on_frame_stream_closed(self):
+        # The recording ended or the connection dropped: keep live view going by polling
+        self.frame_stream = None
+        if self.btnLiveView.isChecked():
+            self.start_live_view_worker()
+
     @QtCore.pyqtSlot()
     def uncheck_live_view(self):
         if self.btnLiveView.isChecked():
@@ -820,7 +1235,7 @@ class QontrollerUI(QtWidgets.QMainWindow, qontroller.Ui_MainWindow):
     @QtCore.pyqtSlot()
     def on_btnClearTmpFolder_clicked(self):
         devices_list = self.get_devices_selected_devices()
-        self.dm.clear_tmp_folders(devices_list)
+        self.dm.clear_tmp_folders(devices_list, self.config)
 
     @QtCore.pyqtSlot()
     def on_btnRunInstall_clicked(self):
@@ -871,11 +1286,10 @@ class QontrollerUI(QtWidgets.QMainWindow, qontroller.Ui_MainWindow):
     @QtCore.pyqtSlot()
     def on_btnSelfCheck_clicked(self):
 
-        # generate the json config file
+        # The configuration is pushed to the devices from memory by the diagnostics
         config = self.generate_json_config_from_GUI_widgets(preview_mode=False)
-        remote_config_file = self.save_json_config_file(config)
 
-        diagnostic_dialog = SelfCheckWindow(remote_config_file)
+        diagnostic_dialog = SelfCheckWindow(config)
         diagnostic_dialog.exec_()  # ✅ This makes it modal (blocks until closed)
 
     ### TAB 2
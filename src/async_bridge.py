@@ -0,0 +1,63 @@
+import asyncio
+import threading
+
+from PyQt5 import QtCore
+
+
+class AsyncBridge(QtCore.QObject):
+    """
+    asyncio event loop running in a background thread, usable from the Qt GUI.
+
+    Coroutines (e.g. DeviceManager.run_on) are submitted from the GUI thread and their result is
+    delivered back on the GUI thread through a queued signal, so callbacks can update widgets directly.
+    """
+
+    _finished = QtCore.pyqtSignal(object, object, object, object)  # callback, errback, result, error
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self._run_loop, name="asyncio", daemon=True)
+        self.thread.start()
+        self._finished.connect(self._deliver)
+
+    def _run_loop(self):
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_forever()
+
+    def submit(self, coroutine, callback=None, errback=None):
+        """
+        Schedule a coroutine on the event loop.
+        :param callback: called on the GUI thread with the result of the coroutine
+        :param errback: called on the GUI thread with the exception if the coroutine failed
+        :return: concurrent.futures.Future of the coroutine, can be cancelled
+        """
+        future = asyncio.run_coroutine_threadsafe(coroutine, self.loop)
+
+        def on_done(done_future):
+            if done_future.cancelled():
+                return
+            error = done_future.exception()
+            result = None if error is not None else done_future.result()
+            self._finished.emit(callback, errback, result, error)
+
+        future.add_done_callback(on_done)
+        return future
+
+    def run_in_background(self, func, *args, callback=None, errback=None):
+        """Run a blocking function off the GUI thread, its result being delivered like with submit."""
+        return self.submit(asyncio.to_thread(func, *args), callback, errback)
+
+    @QtCore.pyqtSlot(object, object, object, object)
+    def _deliver(self, callback, errback, result, error):
+        if error is not None:
+            if errback is not None:
+                errback(error)
+            else:
+                print(f"Background task failed: {error}")
+        elif callback is not None:
+            callback(result)
+
+    def stop(self):
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join(timeout=2)
@@ -8,56 +8,558 @@ import select
 import time
 import signal
 import json
+import hashlib
+import io
+import random
+import re
+import shlex
+from dataclasses import dataclass, field
+from typing import Optional
 
 from PyQt5 import QtCore, QtGui
 
+from .remote_agent import RemoteAgent, AgentError, AgentCallError, AGENT_SCRIPT_NAME, AGENT_SCRIPT_LOCAL_PATH
+from .frame_stream import FrameStream, COPY_COMMAND, STREAMED_FRAME
+from .device_log import DeviceLog
+from . import metrics
+from . import tracing
+from .tmp_inventory import TmpInventory
+from .reachability import split_address
+
+PREVIEW_JPEG_QUALITY = 70
+PREVIEW_UNSUPPORTED_STATUS = 3  # Exit status of the agent thumbnail command when PIL is missing on the device
+
+# Configurations pushed to the devices are named after the digest of their content, see push_config
+PUSHED_CONFIG_NAME = re.compile(r"wormstation_([0-9a-f]{16})\.json")
+CONFIGS_KEPT_ON_DEVICE = 4  # Last pushed configurations left on a device, older ones are deleted
+
+# Seconds after which a remote command is abandoned, so that a hung device cannot block its caller forever
+COMMAND_TIMEOUT = 120
+
+# Start picam detached from the SSH channel (output in ~/tmp/picam.log) and print its PID
+DETACHED_START_COMMAND = "mkdir -p {home}/tmp && nohup picam {config_file} > {home}/tmp/picam.log 2>&1 < /dev/null & echo $!"
+START_CONFIRM_TIMEOUT = 20  # Seconds picam has to report the recording in status.txt after a detached start
+
+# Start picam at a given device time through the helper script, which writes the actual start time to a stamp file
+SCHEDULED_START_COMMAND = (
+    "mkdir -p {home}/tmp && rm -f {stamp_file} && "
+    "nohup python3 {agent} launch_at {start_time:.6f} {stamp_file} picam {config_file} "
+    "> {home}/tmp/picam.log 2>&1 < /dev/null & echo $!"
+)
+START_STAMP_FILE = "picam_started_at"  # In ~/tmp, written by the helper script when it starts picam
+MIN_FREE_GB_TO_RECORD = 5  # Same limit as the disk space self-check
+
+# Connection states
+CONNECTED = "connected"
+DEGRADED = "degraded"  # Still connected, but the device answered late or a command timed out
+RECONNECTING = "reconnecting"
+OFFLINE = "offline"  # Reconnection keeps failing; still retried in the background
+
+KEEPALIVE_INTERVAL = 5  # Seconds between SSH keepalive messages, keeps NAT and VPN mappings open
+KEEPALIVE_TIMEOUT = 5  # Seconds the device has to answer a connection check
+MAX_MISSED_KEEPALIVES = 2  # Unanswered connection checks after which the connection is considered lost
+RECONNECT_BASE_DELAY = 1
+RECONNECT_MAX_DELAY = 60
+RECONNECT_ATTEMPTS_BEFORE_OFFLINE = 5
+
+# Gather everything needed for a status check in a single remote call, one "key=value" per line
+SNAPSHOT_COMMAND = (
+    'echo "pid=$(pgrep -o picam)"; '
+    'echo "status=$(head -n 1 {home}/tmp/status.txt 2>/dev/null)"; '
+    'echo "disk_free_kb=$(df -Pk {home} | awk \'NR==2 {{print $4}}\')"; '
+    'echo "revision=$(git -C {home}/piworm rev-parse --short HEAD 2>/dev/null)"'
+)
+
+
+def encode_config(config):
+    """
+    Serialize a configuration dictionary to canonical JSON.
+    :return: tuple (digest, payload) where digest identifies the content of the configuration
+    """
+    payload = json.dumps(config, sort_keys=True, separators=(',', ':')).encode('utf-8')
+    digest = hashlib.sha256(payload).hexdigest()[:16]
+    return digest, payload
+
+
+@dataclass
+class DeviceSnapshot:
+    """State of a device at a given time, as returned by Device.snapshot()."""
+
+    pid: Optional[int] = None
+    status: str = ''
+    disk_free_gb: Optional[float] = None
+    revision: Optional[str] = None
+    timestamp: float = field(default_factory=time.time)
+
+    @classmethod
+    def from_output(cls, output):
+        values = {}
+        for line in output.splitlines():
+            key, _, value = line.strip().partition('=')
+            values[key] = value.strip()
+
+        pid = values.get('pid', '')
+        disk_free_kb = values.get('disk_free_kb', '')
+
+        return cls(pid=int(pid) if pid.isdigit() else None,
+                   status=values.get('status', ''),
+                   disk_free_gb=int(disk_free_kb) / 1024 ** 2 if disk_free_kb.isdigit() else None,
+                   revision=values.get('revision') or None)
+
+    @property
+    def age(self):
+        return time.time() - self.timestamp
+
+    @property
+    def is_running(self):
+        return self.pid is not None
+
+    @property
+    def recording_status(self):
+        if self.status == 'Recording':
+            return 'Recording is ongoing'
+        elif self.status == 'Paused':
+            return 'Recording is paused'
+        elif self.status == 'Not Running':
+            return 'Recording is not running'
+        else:
+            return 'Unknown status'
+
+
+def jpeg_reader(data):
+    buffer = QtCore.QBuffer()
+    buffer.setData(QtCore.QByteArray(data))
+    buffer.open(QtCore.QIODevice.ReadOnly)
+    reader = QtGui.QImageReader(buffer, b"JPG")
+    reader.buffer = buffer  # The reader does not own its device, keep it alive
+    return reader
+
+
+def decode_jpeg(data, target_size=None):
+    """
+    Decode JPEG bytes into a QImage. Safe to call from worker threads, unlike QPixmap.
+    :param target_size: optional QSize; the JPEG is then decoded directly at reduced size
+                        (keeping the aspect ratio), which is much faster than decoding it fully
+    """
+    reader = jpeg_reader(data)
+
+    if target_size is not None and reader.size().isValid():
+        scaled_size = reader.size().scaled(target_size, QtCore.Qt.KeepAspectRatio)
+        if scaled_size.width() < reader.size().width():  # Never upscale
+            reader.setScaledSize(scaled_size)
+
+    return reader.read()
+
+
+@dataclass
+class Frame:
+    """A frame read from a device. is_new is False when the remote file did not change since the last fetch."""
+
+    data: bytes
+    mtime: Optional[float]
+    size: int
+    is_new: bool
+    is_preview: bool = False  # Downscaled on the device, see Device.read_preview_frame
+    trace_flow: Optional[int] = None  # Links the tracing spans of this frame in the different threads
+    received_at: float = field(default_factory=time.time)
+
+    @property
+    def age(self):
+        """Seconds since this frame content was first received by the controller."""
+        return time.time() - self.received_at
+
+    def decode(self, target_size=None):
+        """Decode the frame into a QImage, at reduced size if target_size is given."""
+        return decode_jpeg(self.data, target_size)
+
+    def image_size(self):
+        """Full resolution of the frame, read from the JPEG header without decoding it."""
+        return jpeg_reader(self.data).size()
+
+
+class DeviceOfflineError(paramiko.ssh_exception.SSHException):
+    """Raised immediately by calls on a device whose connection is down, while it reconnects in the background."""
+
+
+class RecordingStartError(Exception):
+    """Raised when a recording could not be prepared, or could not be confirmed after a detached start."""
+
+
+@dataclass
+class PreparedRecording:
+    """A device ready to start recording, see Device.prepare_recording."""
+
+    config_path: str
+    clock_offset: float  # Device clock minus controller clock, in seconds
+    clock_rtt: float  # Round trip time of the measurement the offset comes from
+
+
+@dataclass
+class StartedRecording:
+    snapshot: DeviceSnapshot
+    started_at: Optional[float] = None  # Actual start time of picam in controller clock, for synchronized starts
+
+
 class Device:
 
-    def __init__(self, name, username, uptodate=None):
+    def __init__(self, name, username, uptodate=None, use_agent=False, snapshot_ttl=2.0, key_filename=None):
+        """
+        :param name: host name or address of the device, optionally followed by ":port"
+        :param key_filename: private key used to log in, in addition to the default keys and the SSH agent
+        """
         self.name = name
+        self.host, self.port = split_address(name)
+        self.key_filename = key_filename
         #self.id = id
         self.uptodate = uptodate
         self.username = username
         self.ssh = paramiko.SSHClient()
         self.ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
         self.connected = False
+        self.use_agent = use_agent
+        self.agent = None
+        self._agent_script_path = None
+        self.preview_supported = True  # Set to False if the device cannot generate previews (no PIL)
+        self.snapshot_ttl = snapshot_ttl  # Seconds during which a snapshot is reused
+        self._snapshot = None
+        self._snapshot_lock = threading.Lock()
+        self._sftp = None
+        self._sftp_lock = threading.RLock()
+        self._remote_folders = set()  # Remote folders known to exist, so they are not created again
+        self._pushed_configs = {}  # Digests of the configurations present on the device, in the order they were pushed
+        self._frame_cache = {}  # Last frame fetched for each remote path
+        self.sftp_sessions_opened = 0
+        self.sftp_sessions_reused = 0
+        self._state = OFFLINE
+        self._state_lock = threading.Lock()
+        self._state_listeners = []
+        self._missed_keepalives = 0
+        self._reconnect_thread = None
+        self._closed = threading.Event()
+        self.log = DeviceLog(name)  # Remote output and connection events, shown in the log panel
+        self.metrics = metrics.registry.device(name)  # Latency and size of the remote calls, per operation
+        self._tmp_inventories = {}  # Remote folder -> TmpInventory
         self.ssh_connect()
 
+        if self.connected and self.use_agent:
+            self.start_agent()
+
     def __del__(self):
+        # Possibly at interpreter exit: no logging nor listeners, only release the connection
+        self.close(notify=False)
+
+    def close(self, notify=True):
+        """
+        Close the remote agent, the SFTP session and the SSH connection.
+        :param notify: report the offline state to the log and the state listeners
+        """
+        with self._state_lock:
+            self._closed.set()  # Stops reconnecting, see reconnect
+            if not notify:
+                self._state = OFFLINE
+        if notify:
+            self.set_state(OFFLINE)
+        if self.agent is not None:
+            self.agent.close()
+            self.agent = None
+        self.close_sftp()
         self.ssh.close()
+        self.connected = False
+
+    def is_transport_active(self):
+        """
+        Local check that the SSH transport is still open, without a round trip to the device.
+        A half-open connection (device rebooted or out of the VPN) still passes, see is_alive.
+        """
+        transport = self.ssh.get_transport()
+        return transport is not None and transport.is_active()
+
+    def is_alive(self, timeout=KEEPALIVE_TIMEOUT):
+        """Check that the device still answers on the SSH connection, by opening and closing a channel."""
+        if not self.is_transport_active():
+            return False
+        try:
+            self.ssh.get_transport().open_session(timeout=timeout).close()
+            return True
+        except (paramiko.SSHException, OSError, EOFError):
+            return False
+
+    @property
+    def state(self):
+        return self._state
+
+    def add_state_listener(self, listener):
+        """Register listener(device, state), called from any thread on each connection state change."""
+        self._state_listeners.append(listener)
+
+    def set_state(self, state):
+        with self._state_lock:
+            # A closed device stays offline, even if a reconnection completes meanwhile
+            if state == self._state or (self._closed.is_set() and state != OFFLINE):
+                return
+            self._state = state
+        print(f"Device {self.name} is {state}")
+        self.log.append(f"Connection {state}")
+        for listener in list(self._state_listeners):
+            listener(self, state)
+
+    def ensure_online(self):
+        """Fail fast instead of waiting for SSH timeouts while the connection is down."""
+        if self._state in (RECONNECTING, OFFLINE):
+            raise DeviceOfflineError(f"Device {self.name} is {self._state}")
+
+    def check_connection(self, timeout=KEEPALIVE_TIMEOUT):
+        """
+        Check that the device still answers, by opening and closing a channel.
+        The state becomes degraded when the device answers late, and the device is reconnected
+        after MAX_MISSED_KEEPALIVES checks without answer or if the transport is closed.
+        :return: connection state
+        """
+        if self._state not in (CONNECTED, DEGRADED):
+            return self._state
+        if not self.is_transport_active():
+            self.connection_lost()
+            return self._state
+
+        try:
+            self.ssh.get_transport().open_session(timeout=timeout).close()
+            self._missed_keepalives = 0
+            self.set_state(CONNECTED)
+        except (paramiko.SSHException, OSError, EOFError):
+            self._missed_keepalives += 1
+            if self._missed_keepalives >= MAX_MISSED_KEEPALIVES:
+                self.connection_lost()
+            else:
+                self.set_state(DEGRADED)
+        return self._state
+
+    def on_call_failed(self, error):
+        """Update the connection state after a failed remote call."""
+        if not self.is_transport_active():
+            self.connection_lost()
+        elif isinstance(error, TimeoutError):
+            self.set_state(DEGRADED)
+
+    def connection_lost(self):
+        """Start reconnecting in the background, unless already reconnecting or closed."""
+        with self._state_lock:
+            if self._closed.is_set() or self._reconnect_thread is not None:
+                return
+            self._reconnect_thread = threading.Thread(target=self._reconnect_loop, daemon=True)
+            self._reconnect_thread.start()
+        self.set_state(RECONNECTING)
+
+    def _reconnect_loop(self):
+        attempt = 0
+        try:
+            while not self._closed.is_set():
+                # Exponential backoff; the jitter spreads the reconnections of devices that dropped together
+                delay = min(RECONNECT_MAX_DELAY, RECONNECT_BASE_DELAY * 2 ** attempt)
+                if self._closed.wait(random.uniform(delay / 2, delay)):
+                    return
+                attempt += 1
+                if self.reconnect():
+                    return
+                if attempt >= RECONNECT_ATTEMPTS_BEFORE_OFFLINE:
+                    self.set_state(OFFLINE)
+        finally:
+            with self._state_lock:
+                self._reconnect_thread = None
+
+    def reconnect(self):
+        """Replace the SSH connection by a new one, dropping everything tied to the old one. Return True on success."""
+        ssh = paramiko.SSHClient()
+        ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+        try:
+            ssh.load_system_host_keys()
+            ssh.connect(self.host, port=self.port, username=self.username, timeout=3, key_filename=self.key_filename)
+        except (paramiko.SSHException, OSError) as e:
+            print(f"Reconnection to {self.name} failed: {e}")
+            return False
+        ssh.get_transport().set_keepalive(KEEPALIVE_INTERVAL)
+
+        with self._state_lock:
+            # The device may have been closed (e.g. removed from the hosts file) while connecting
+            closed = self._closed.is_set()
+            if not closed:
+                old_ssh, self.ssh = self.ssh, ssh
+        if closed:
+            ssh.close()
+            return False
+
+        if self.agent is not None:
+            self.agent.close()
+            self.agent = None
+        self.close_sftp()
+        old_ssh.close()
+
+        self.connected = True
+        self._agent_script_path = None
+        self._remote_folders.clear()
+        self._pushed_configs.clear()
+        self._missed_keepalives = 0
+        self.invalidate_snapshot()
+        self.set_state(CONNECTED)
+
+        if self.use_agent:
+            self.start_agent()
+        return True
+
+    def start_agent(self):
+        """Upload and start the remote agent. Commands fall back to exec_command if it fails."""
+        try:
+            script_path = self.ensure_agent_script()
+        except (IOError, paramiko.ssh_exception.SSHException) as e:
+            print(f"Could not upload remote agent to {self.name}: {e}")
+            return False
+
+        agent = RemoteAgent(self.ssh, script_path)
+        if agent.start():
+            self.agent = agent
+            return True
+
+        print(f"Remote agent unavailable on {self.name}, using one SSH channel per command")
+        return False
+
+    def ensure_agent_script(self):
+        """Upload the device-side helper script once per connection and return its remote path."""
+        if self._agent_script_path is None:
+            self._agent_script_path = self.upload_agent_script()
+        return self._agent_script_path
+
+    def upload_agent_script(self):
+        remote_folder = f"/home/{self.username}/.config/wormstation"
+        remote_path = f"{remote_folder}/{AGENT_SCRIPT_NAME}"
+
+        def upload(sftp):
+            self.ensure_remote_folder(sftp, remote_folder)
+            sftp.put(AGENT_SCRIPT_LOCAL_PATH, remote_path)
+
+        self.with_sftp(upload, op="upload_agent_script")
+        self.metrics.add_bytes("upload_agent_script", bytes_out=os.path.getsize(AGENT_SCRIPT_LOCAL_PATH))
+        return remote_path
+
+    @property
+    def sftp_stats(self):
+        return {"opened": self.sftp_sessions_opened, "reused": self.sftp_sessions_reused}
+
+    def get_sftp(self):
+        """Return the SFTP client of the device, opening it on first use or if its channel was closed."""
+        with self._sftp_lock:
+            if self._sftp is not None and not self._sftp.get_channel().closed:
+                self.sftp_sessions_reused += 1
+                return self._sftp
+
+            self.close_sftp()
+            self._sftp = self.ssh.open_sftp()
+            self.sftp_sessions_opened += 1
+            return self._sftp
+
+    def close_sftp(self):
+        with self._sftp_lock:
+            if self._sftp is not None:
+                try:
+                    self._sftp.close()
+                except Exception:
+                    pass
+            self._sftp = None
+
+    def with_sftp(self, operation, op="sftp"):
+        """
+        Run operation(sftp) on the shared SFTP session. Calls are serialized, and the
+        session is reopened once if it dropped in the meantime.
+        :param op: name of the call in the metrics and the trace of the device
+        """
+        with self.metrics.timed(op), tracing.span(op, "sftp", device=self.name):
+            self.ensure_online()
+            with self._sftp_lock:
+                try:
+                    return operation(self.get_sftp())
+                except (EOFError, ConnectionResetError, paramiko.ssh_exception.SSHException) as e:
+                    print(f"SFTP session with {self.name} lost ({e}), reopening it")
+                    self.close_sftp()
+                    try:
+                        return operation(self.get_sftp())
+                    except (EOFError, OSError, paramiko.ssh_exception.SSHException) as e:
+                        self.on_call_failed(e)
+                        raise
+
+    def ensure_remote_folder(self, sftp, remote_folder):
+        if remote_folder in self._remote_folders:
+            return
+        try:
+            sftp.mkdir(remote_folder)
+        except IOError:
+            pass  # Folder already exists
+        self._remote_folders.add(remote_folder)
+
+    def run_command(self, command, timeout=COMMAND_TIMEOUT, op="run_command"):
+        """
+        Run a command on the device, through the remote agent if available.
+        :param timeout: seconds after which the command is abandoned, None to wait forever
+        :param op: name of the call in the metrics and the trace of the device
+        :return: tuple (exit_status, output), stderr being merged into the output
+        """
+        with self.metrics.timed(op) as call, tracing.span(op, "ssh", device=self.name):
+            call.bytes_out = len(command)
+            self.ensure_online()
+
+            if self.agent is not None:
+                try:
+                    status, output = self.agent.call(command, timeout=timeout)
+                    call.bytes_in = len(output)
+                    return status, output
+                except AgentCallError as e:
+                    # The command may have run: running it again could start or delete things twice
+                    print(f"Remote agent error on {self.name} while running {command!r}: {e}")
+                    if not self.agent.alive:
+                        self.agent = None
+                    raise
+                except AgentError as e:
+                    print(f"Remote agent error on {self.name}: {e}. Falling back to exec_command")
+                    if not self.agent.alive:
+                        self.agent = None
+
+            try:
+                stdin, stdout, stderr = self.ssh.exec_command(command, get_pty=True, timeout=timeout)
+                data = stdout.read()
+                call.bytes_in = len(data)
+                return stdout.channel.recv_exit_status(), data.decode('utf-8', errors='replace')
+            except (paramiko.ssh_exception.SSHException, EOFError, OSError) as e:
+                self.on_call_failed(e)
+                raise
+
+    def snapshot(self, max_age=None):
+        """
+        Get the process state, status.txt, picam PID, free disk space and software revision.
+        :param max_age: maximum age in seconds of a cached snapshot, defaults to snapshot_ttl
+        :return: DeviceSnapshot
+        """
+        max_age = self.snapshot_ttl if max_age is None else max_age
+        with self._snapshot_lock:
+            if self._snapshot is None or self._snapshot.age > max_age:
+                status, output = self.run_command(SNAPSHOT_COMMAND.format(home=f"/home/{self.username}"), op="snapshot")
+                self._snapshot = DeviceSnapshot.from_output(output)
+            return self._snapshot
+
+    def invalidate_snapshot(self):
+        with self._snapshot_lock:
+            self._snapshot = None
 
     @property
     def is_running(self):
-        stdin, stdout, stderr = self.ssh.exec_command("pgrep picam", get_pty=True)
-        return stdout.readline() != ''
+        return self.snapshot().is_running
 
     @property
     def recording_status(self):
         """Check the status of the recording over SSH."""
-        try:
-            # Try to read the status file
-            stdin, stdout, stderr = self.ssh.exec_command(f"cat /home/{self.username}/tmp/status.txt", get_pty=True)
-            status = stdout.readline().strip()
-
-            print(f"DEBUG : Device {self.name} status: {status}")
-
-            if status == 'Recording':
-                return 'Recording is ongoing'
-            elif status == 'Paused':
-                return 'Recording is paused'
-            elif status == 'Not Running':
-                return 'Recording is not running'
-            else:
-                return 'Unknown status'
-        except FileNotFoundError:
-            # If the file does not exist, handle the error gracefully
-            return 'Status file not found, recording might not have started'
+        return self.snapshot().recording_status
 
     @property
     def is_uptodate(self):
         # TODO: The file path is hardcoded. Make it configurable.
-        stdin, stdout, stderr = self.ssh.exec_command(f"cd /home/{self.username}/piworm && git fetch --dry-run", get_pty=True)
-        if stdout.readline() == '':
+        status, output = self.run_command(f"cd /home/{self.username}/piworm && git fetch --dry-run", op="is_uptodate")
+        if output.strip() == '':
             print(self.name + " up to date")
             return True
         else:
@@ -69,178 +571,450 @@ class Device:
         if self.is_running:
             print("Device %s is running : update skipped" % self.name)
         else:
-            stdin, stdout, stderr = self.ssh.exec_command(f"cd /home/{self.username}/piworm && git pull", get_pty=True)
-            for line in iter(stdout.readline, ""):
-                print(line, end="")
+            status, output = self.run_command(f"cd /home/{self.username}/piworm && git pull", op="update")
+            self.log.write(output)
             print("Device %s updated" % self.name)
 
 
     def ssh_connect(self):
+        """
+        Connect to the device, without any user interaction: runs in parallel from worker threads.
+        If the key of the user is refused, auth_failed is set and install_ssh_key can be called.
+        """
         self.connected = False
+        self.auth_failed = False
+        self.connect_error = None
         i = 0
         while (not self.connected and i < 3):
             try:
                 self.ssh.load_system_host_keys()
-                self.ssh.connect(self.name, port=22, username=self.username, timeout=3)
+                with self.metrics.timed("connect"):
+                    self.ssh.connect(self.host, port=self.port, username=self.username, timeout=3,
+                                     key_filename=self.key_filename)
+                self.ssh.get_transport().set_keepalive(KEEPALIVE_INTERVAL)
                 self.connected = True
+                self.connect_error = None
+                self.set_state(CONNECTED)
             except paramiko.ssh_exception.SSHException as e:
+                self.connect_error = e
+                # The SSH session was established but no key was accepted. paramiko reports the last error met
+                # while trying the keys, which is not always an AuthenticationException
+                transport = self.ssh.get_transport()
+                if isinstance(e, paramiko.ssh_exception.AuthenticationException) or (
+                        transport is not None and transport.is_active() and not transport.is_authenticated()):
+                    # Trying again will not help, the key has to be installed first
+                    print(f"Authentication to {self.name} failed: {e}")
+                    self.auth_failed = True
+                    self.ssh.close()
+                    break
                 print(e)
-                if os.name == 'nt':
-                    subprocess.run([r'type', r'%userprofile%\.ssh\id_rsa.pub', '|', 'ssh', f'{self.username}@{self.name}', r"cat >> .ssh/authorized_keys"], shell=True)
-                else:
-                    os.system(f"ssh-copy-id {self.username}@{self.name}")
                 i += 1
             except paramiko.ssh_exception.NoValidConnectionsError as e:
                 print(e)
                 print(f'Device {self.name} is unreachable.')
+                self.connect_error = e
                 i += 1
         return self.connected
 
+    def install_ssh_key(self):
+        """
+        Install the public key of the user on the device with ssh-copy-id, which asks for the password
+        on the terminal, then connect again. Interactive: call it for one device at a time.
+        :return: True if connected
+        """
+        if os.name == 'nt':
+            subprocess.run([r'type', r'%userprofile%\.ssh\id_rsa.pub', '|', 'ssh', '-p', str(self.port),
+                            f'{self.username}@{self.host}', r"cat >> .ssh/authorized_keys"], shell=True)
+        else:
+            os.system(f"ssh-copy-id -p {self.port} {self.username}@{self.host}")
+        return self.ssh_connect()
+
     def receive_json_config_file(self, file):
-        with self.ssh.open_sftp() as sftp:
-            remote_folder = f"/home/{self.username}/.config/wormstation"
-            remote_path = f'{remote_folder}/{os.path.basename(file)}'
-            try:
-                sftp.mkdir(remote_folder)
-            except IOError:
-                pass  # Folder already exists
+        remote_folder = f"/home/{self.username}/.config/wormstation"
+        remote_path = f'{remote_folder}/{os.path.basename(file)}'
+
+        def upload(sftp):
+            self.ensure_remote_folder(sftp, remote_folder)
             sftp.put(file, remote_path)
+
+        self.with_sftp(upload, op="receive_json_config_file")
+        self.metrics.add_bytes("receive_json_config_file", bytes_out=os.path.getsize(file))
+        return remote_path
+
+    def push_config(self, config, encoded=None):
+        """
+        Upload a configuration named after the hash of its content, unless the device already has it.
+        The configuration is streamed from memory, nothing is written to the local disk.
+        :param config: configuration dictionary
+        :param encoded: optional (digest, payload) from encode_config, to serialize only once for many devices
+        :return: remote path of the configuration file
+        """
+        digest, payload = encoded if encoded is not None else encode_config(config)
+        remote_folder = f"/home/{self.username}/.config/wormstation"
+        remote_path = f"{remote_folder}/wormstation_{digest}.json"
+
+        if digest in self._pushed_configs:
+            return remote_path
+
+        def upload(sftp):
+            self.ensure_remote_folder(sftp, remote_folder)
+            sftp.putfo(io.BytesIO(payload), remote_path)
+            self._pushed_configs[digest] = None
+            self.prune_configs(sftp, remote_folder)
+
+        self.with_sftp(upload, op="push_config")
+        self.metrics.add_bytes("push_config", bytes_out=len(payload))
         return remote_path
 
+    def prune_configs(self, sftp, remote_folder):
+        """
+        Delete the pushed configurations other than the CONFIGS_KEPT_ON_DEVICE last ones, including those left
+        by previous sessions: each change of parameters adds a file.
+        """
+        kept = list(self._pushed_configs)[-CONFIGS_KEPT_ON_DEVICE:]
+        for name in sftp.listdir(remote_folder):
+            match = PUSHED_CONFIG_NAME.fullmatch(name)
+            if match is not None and match.group(1) not in kept:
+                try:
+                    sftp.remove(f"{remote_folder}/{name}")
+                except FileNotFoundError:
+                    pass  # Already deleted
+        self._pushed_configs = dict.fromkeys(kept)
+
     def remove_json_config_file(self, file):
-        with self.ssh.open_sftp() as sftp:
-            try:
-                remote_path = f'/home/{self.username}/.config/wormstation/{os.path.basename(file)}'
-                sftp.remove(remote_path)
-                print(f"File {file} removed from device {self.name}")
-            except FileNotFoundError:
-                print(f"File {file} not found on device {self.name}")
+        try:
+            remote_path = f'/home/{self.username}/.config/wormstation/{os.path.basename(file)}'
+            self.with_sftp(lambda sftp: sftp.remove(remote_path), op="remove_json_config_file")
+            self._pushed_configs.pop(os.path.splitext(os.path.basename(file))[0].replace('wormstation_', '', 1), None)
+            print(f"File {file} removed from device {self.name}")
+        except FileNotFoundError:
+            print(f"File {file} not found on device {self.name}")
 
 
-    def get_frame(self, settings_remote_path):
-        status = self.recording_status
+    def get_frame(self, settings_remote_path, preview_size=None):
+        """
+        :param settings_remote_path: configuration used if a new frame has to be acquired
+        :param preview_size: optional (width, height); the frame is then downscaled on the device before transfer
+        :return: Frame or None
+        """
+        snapshot = self.snapshot()
+        status = snapshot.recording_status
 
         #print(f"DEBUG : Device {self.name} status: {status}")
-        if self.is_running:
+        if snapshot.is_running:
             if status == 'Recording is ongoing':
                 # If the recording is ongoing, import the last frame
-                return self.import_last_frame_from_device()
+                return self.import_last_frame_from_device(preview_size)
             elif status == 'Recording is paused':
                 # If the recording is paused, send signal to get a new frame and then import it
                 self.send_signal_to_server(signal.SIGUSR1)
-                time.sleep(2)  # Wait a little for the server to capture the new frame
-                return self.import_last_frame_from_device()
+                with tracing.span("wait_for_capture", "refresh_view"):
+                    time.sleep(2)  # Wait a little for the server to capture the new frame
+                return self.import_last_frame_from_device(preview_size)
             elif status == 'Recording is not running':
                 # If recording is not running, acquire a new frame
-                return self.acquire_new_frame(settings_remote_path)
+                return self.acquire_new_frame(settings_remote_path, preview_size)
             else:
                 print("Unknown recording status. Cannot get frame.")
                 return None
 
         else:
-            return self.acquire_new_frame(settings_remote_path)
+            return self.acquire_new_frame(settings_remote_path, preview_size)
 
     def send_signal_to_server(self, signal_type):
         """Send a signal to the server to trigger a new frame capture."""
         # Get the PID of the recording script on the server
-        stdin, stdout, stderr = self.ssh.exec_command("pgrep -f picam", get_pty=True)
-        pid = stdout.readline().strip()
+        pid = self.snapshot().pid
 
         if pid:
-            # Send the custom signal to the server process
-            self.ssh.exec_command(f"kill -{signal_type} {pid}")
+            # Send the custom signal to the server process, by name since numbers differ between OSes
+            signal_name = signal_type.name[3:] if isinstance(signal_type, signal.Signals) else signal_type
+            self.run_command(f"kill -{signal_name} {pid}", op="send_signal_to_server")
             print(f"Sent signal {signal_type} to server process {pid}.")
         else:
             print("Server recording script is not running.")
 
     def read_remote_frame(self, filename):
-        with self.ssh.open_sftp() as sftp:
-            frame_bytes = sftp.file(filename, mode='r').read()
-            ba = QtCore.QByteArray(frame_bytes)
-            new_pixmap = QtGui.QPixmap()
-            new_pixmap.loadFromData(ba, "JPG")
-        return new_pixmap
-
-    def import_last_frame_from_device(self):
+        """
+        Fetch a frame from the device. Like an HTTP ETag, the remote file is stat'ed first and
+        the cached frame is returned if its mtime and size did not change since the last fetch.
+        :return: Frame
+        """
+        cached = self._frame_cache.get(filename)
+
+        def read(sftp):
+            attributes = sftp.stat(filename)
+            if cached is not None and (cached.mtime, cached.size) == (attributes.st_mtime, attributes.st_size):
+                return attributes, None
+            with sftp.file(filename, mode='r') as remote_file:
+                remote_file.prefetch(attributes.st_size)
+                return attributes, remote_file.read()
+
+        attributes, frame_bytes = self.with_sftp(read, op="read_remote_frame")
+
+        if frame_bytes is None:
+            cached.is_new = False
+            return cached
+
+        self.metrics.add_bytes("read_remote_frame", bytes_in=len(frame_bytes))
+        frame = Frame(data=frame_bytes, mtime=attributes.st_mtime, size=attributes.st_size, is_new=True)
+        self._frame_cache[filename] = frame
+        return frame
+
+    def thumbnail_command(self, src, dst, preview_size):
+        width, height = preview_size
+        return f"python3 {self.ensure_agent_script()} thumbnail {src} {dst} {width} {height} {PREVIEW_JPEG_QUALITY}"
+
+    def read_preview_frame(self, preview_size):
+        """
+        Downscale the last frame on the device and fetch the result.
+        :param preview_size: (width, height) bounding box of the preview
+        :return: Frame, or None if no preview could be generated this time
+        """
+        tmp_folder = f"/home/{self.username}/tmp"
+        preview_path = f"{tmp_folder}/last_frame_preview.jpg"
+
+        command = self.thumbnail_command(f"{tmp_folder}/last_frame.jpg", preview_path, preview_size)
+        status, output = self.run_command(command, op="read_preview_frame")
+        if status == PREVIEW_UNSUPPORTED_STATUS:
+            print(f"Device {self.name} cannot generate previews, using full resolution frames: {output.strip()}")
+            self.preview_supported = False
+            return None
+        if status != 0:
+            # E.g. no frame written yet: only this frame falls back to full resolution
+            print(f"No preview from device {self.name}: {output.strip()}")
+            return None
+
+        frame = self.read_remote_frame(preview_path)
+        frame.is_preview = True
+        return frame
+
+    def read_last_frame(self, preview_size=None):
+        if preview_size is not None and self.preview_supported:
+            frame = self.read_preview_frame(preview_size)
+            if frame is not None:
+                return frame
+        return self.read_remote_frame(f"/home/{self.username}/tmp/last_frame.jpg")
+
+    def open_frame_stream(self, on_frame, on_closed=None, preview_size=None):
+        """
+        Subscribe to the frames pushed by the device each time last_frame.jpg is written.
+        :param on_frame: callback receiving each Frame, called from a reader thread
+        :param on_closed: optional callback called when the stream ends
+        :param preview_size: optional (width, height); frames are then downscaled on the device before being pushed
+        :return: the running FrameStream, or None if the device cannot stream (poll instead)
+        """
+        is_preview = preview_size is not None and self.preview_supported
+        copy_command = COPY_COMMAND
+        if is_preview:
+            copy_command = f"{{ {self.thumbnail_command('last_frame.jpg', STREAMED_FRAME, preview_size)} || {COPY_COMMAND}; }}"
+
+        def on_data(data):
+            on_frame(Frame(data=data, mtime=None, size=len(data), is_new=True, is_preview=is_preview))
+
+        stream = FrameStream(self.ssh, f"/home/{self.username}/tmp", on_data, on_closed, copy_command=copy_command)
+        return stream if stream.start() else None
+
+    def import_last_frame_from_device(self, preview_size=None):
         try:
             print("Device is running : getting last frame")
-            return self.read_remote_frame(f"/home/{self.username}/tmp/last_frame.jpg")
+            return self.read_last_frame(preview_size)
         except FileNotFoundError:
             print("No frame ready")
             return None
 
-    def acquire_new_frame(self, config_file):
+    def acquire_new_frame(self, config_file, preview_size=None):
         self.start(config_file, background_mode=False)
-        return self.read_remote_frame(f"/home/{self.username}/tmp/last_frame.jpg")
-
-    def record(self, config_file):
-        print(self.name)
-        if self.is_running:
-            print("WARNING : Device %s is already running. Recording ignored")
-        else:
-            self.start(config_file, background_mode=True)
+        return self.read_last_frame(preview_size)
+
+    def record(self, config_file, confirm_timeout=START_CONFIRM_TIMEOUT):
+        """
+        Start a recording detached from the SSH session and wait until it is confirmed.
+        :return: StartedRecording
+        :raise RecordingStartError: if the device is already running, or picam did not start recording
+        """
+        if self.snapshot(max_age=0).is_running:
+            raise RecordingStartError(f"Device {self.name} is already running, recording ignored")
+
+        self.launch_detached(config_file)
+        return StartedRecording(snapshot=self.confirm_recording(confirm_timeout))
+
+    def confirm_recording(self, confirm_timeout=START_CONFIRM_TIMEOUT):
+        """Wait for the recording to be reported and return its snapshot, raise RecordingStartError otherwise."""
+        snapshot = self.wait_for_recording(confirm_timeout)
+
+        if not snapshot.is_running:
+            status, log = self.run_command(f"tail -n 5 /home/{self.username}/tmp/picam.log", op="confirm_recording")
+            raise RecordingStartError(f"picam exited: {log.strip()}")
+        if snapshot.recording_status not in ('Recording is ongoing', 'Recording is paused'):
+            raise RecordingStartError(f"picam is running (PID {snapshot.pid}) but its status is '{snapshot.status}'")
+        return snapshot
+
+    def measure_clock_offset(self, samples=5):
+        """
+        Measure the offset of the device clock, keeping the sample with the shortest round trip (like NTP).
+        :return: tuple (offset, rtt) in seconds, offset being device clock minus controller clock
+        """
+        best = None
+        for _ in range(samples):
+            sent = time.time()
+            status, output = self.run_command("date +%s.%N", timeout=10, op="measure_clock_offset")
+            received = time.time()
+            try:
+                device_time = float(output.strip())
+            except ValueError:
+                continue
+            rtt = received - sent
+            if best is None or rtt < best[1]:
+                best = (device_time - (sent + received) / 2, rtt)
+
+        if best is None:
+            raise RecordingStartError(f"Could not read the clock of {self.name}")
+        return best
+
+    def prepare_recording(self, config, encoded=None, min_free_gb=MIN_FREE_GB_TO_RECORD):
+        """
+        First phase of a synchronized start: push the configuration, check the device can record,
+        warm the connection and the helper script, and measure the clock offset.
+        :return: PreparedRecording
+        :raise RecordingStartError: if the device cannot record
+        """
+        config_path = self.push_config(config, encoded=encoded)
+
+        snapshot = self.snapshot(max_age=0)
+        if snapshot.is_running:
+            raise RecordingStartError(f"Device {self.name} is already running")
+        if snapshot.disk_free_gb is not None and snapshot.disk_free_gb < min_free_gb:
+            raise RecordingStartError(f"Only {snapshot.disk_free_gb:.1f} GB free on {self.name}")
+        if not self.check_camera(config):
+            raise RecordingStartError(f"Camera check failed on {self.name}")
+
+        self.ensure_agent_script()
+        offset, rtt = self.measure_clock_offset()
+        return PreparedRecording(config_path=config_path, clock_offset=offset, clock_rtt=rtt)
+
+    def schedule_recording(self, prepared, start_at):
+        """
+        Second phase of a synchronized start: schedule picam at start_at, without waiting for it.
+        :param prepared: PreparedRecording returned by prepare_recording
+        :param start_at: start time in controller clock, converted to the device clock with the measured offset
+        :raise RecordingStartError: if picam could not be scheduled
+        """
+        home = f"/home/{self.username}"
+        self.invalidate_snapshot()
+        status, output = self.run_command(SCHEDULED_START_COMMAND.format(
+            home=home, stamp_file=f"{home}/tmp/{START_STAMP_FILE}", agent=self.ensure_agent_script(),
+            start_time=start_at + prepared.clock_offset, config_file=prepared.config_path), timeout=10,
+            op="schedule_recording")
+        if not output.strip().splitlines() or not output.strip().splitlines()[-1].isdigit():
+            raise RecordingStartError(f"Could not schedule picam: {output.strip()}")
+
+    def confirm_scheduled_recording(self, prepared, confirm_timeout=START_CONFIRM_TIMEOUT):
+        """
+        Last phase of a synchronized start, once the start time is reached: confirm the recording
+        and read the time picam actually started at.
+        :return: StartedRecording
+        """
+        snapshot = self.confirm_recording(confirm_timeout)
+
+        status, output = self.run_command(f"cat /home/{self.username}/tmp/{START_STAMP_FILE}",
+                                          op="confirm_scheduled_recording")
+        try:
+            started_at = float(output.strip()) - prepared.clock_offset
+        except ValueError:
+            raise RecordingStartError(f"Start time of {self.name} unknown: {output.strip()}")
+        return StartedRecording(snapshot=snapshot, started_at=started_at)
+
+    def launch_detached(self, config_file):
+        """Start picam in the background without keeping a channel open. Return the PID of the process."""
+        self.invalidate_snapshot()
+        status, output = self.run_command(DETACHED_START_COMMAND.format(home=f"/home/{self.username}",
+                                                                        config_file=config_file), timeout=10,
+                                          op="launch_detached")
+        try:
+            return int(output.strip().splitlines()[-1])
+        except (ValueError, IndexError):
+            raise RecordingStartError(f"Could not start picam: {output.strip()}")
+
+    def wait_for_recording(self, timeout=START_CONFIRM_TIMEOUT, poll_interval=0.5):
+        """Poll the device until picam runs and status.txt reports the recording, or picam exited. Return the last snapshot."""
+        start = time.monotonic()
+        while True:
+            snapshot = self.snapshot(max_age=0)
+            if snapshot.recording_status in ('Recording is ongoing', 'Recording is paused') and snapshot.is_running:
+                return snapshot
+            elapsed = time.monotonic() - start
+            # Not running after a short grace period (nohup executing picam): picam exited
+            if elapsed > timeout or (not snapshot.is_running and elapsed > 2):
+                return snapshot
+            time.sleep(poll_interval)
 
     def start(self, config_file, background_mode=False):
         rec_command = f'picam {config_file}'
         command = f'nohup {rec_command}' if background_mode else rec_command
-        print(command)
+        self.log.append(f"$ {command}")
+        self.invalidate_snapshot()
         try:
-            stdin, stdout, stderr = self.ssh.exec_command(command, get_pty=True)
-            for line in iter(stdout.readline, ""):
-                print(line, end="")
+            # Timed until picam exits, i.e. for the whole recording
+            with self.metrics.timed("start") as call, tracing.span("start", "ssh", device=self.name):
+                call.bytes_out = len(command)
+                stdin, stdout, stderr = self.ssh.exec_command(command, get_pty=True)
+                for line in iter(stdout.readline, ""):
+                    call.bytes_in += len(line)
+                    self.log.write(line)
         except paramiko.ssh_exception.SSHException as e:
             print(e)
             print(f"Connection with device {self.name} lost")
+            self.on_call_failed(e)
+        finally:
+            self.invalidate_snapshot()
 
     def stop(self):
-        stdin, stdout, stderr = self.ssh.exec_command("pkill picam", get_pty=True)
+        self.run_command("pkill picam", op="stop")
+        self.invalidate_snapshot()
         print("Device %s stopped" % self.name)
 
     def kill(self):
-        stdin, stdout, stderr = self.ssh.exec_command("pkill -9 picam", get_pty=True)
+        self.run_command("pkill -9 picam", op="kill")
+        self.invalidate_snapshot()
         print("Device %s killed" % self.name)
 
     def shutdown(self):
         print("shutting down %s" % self.name)
-        stdin, stdout, stderr = self.ssh.exec_command("sudo poweroff", get_pty=True)
+        with self.metrics.timed("shutdown"):
+            stdin, stdout, stderr = self.ssh.exec_command("sudo poweroff", get_pty=True)
         del self
 
     def reboot(self):
         print("Rebooting %s" % self.name)
-        stdin, stdout, stderr = self.ssh.exec_command("sudo reboot", get_pty=True)
+        with self.metrics.timed("reboot"):
+            stdin, stdout, stderr = self.ssh.exec_command("sudo reboot", get_pty=True)
         del self
 
     def turn_on_led(self, color, current='37.5mA'):
         """Turn on the LED of the specified color remotely."""
         # TODO: check if this function is used and fix it or delete it
-        self.ssh.exec_command(
-            f"python ~/piworm/led_switch.py --color {color} --state 1 --current {current}",
-            get_pty=True)
+        self.run_command(f"python ~/piworm/led_switch.py --color {color} --state 1 --current {current}",
+                         op="turn_on_led")
 
     def turn_off_led(self, color, current='37.5mA'):
         """Turn off the LED of the specified color remotely."""
-        self.ssh.exec_command(
-            f"python ~/piworm/led_switch.py --color {color} --state 0 --current {current}",
-            get_pty=True)
+        self.run_command(f"python ~/piworm/led_switch.py --color {color} --state 0 --current {current}",
+                         op="turn_off_led")
 
     def turn_on_led_gpio(self, pin):
         """Old PCB. Turn on the LED of the specified color remotely."""
         # TODO: path is hardcoded. Make it configurable.
-        self.ssh.exec_command(f"python ~/piworm/src/led_control/turn_on_led.py {pin}", get_pty=True)
+        self.run_command(f"python ~/piworm/src/led_control/turn_on_led.py {pin}", op="turn_on_led_gpio")
 
     def turn_off_led_gpio(self, pin):
-        self.ssh.exec_command(f"python ~/piworm/src/led_control/turn_off_led.py {pin}", get_pty=True)
+        self.run_command(f"python ~/piworm/src/led_control/turn_off_led.py {pin}", op="turn_off_led_gpio")
 
     def switch_led(self, color, state, current):
         """Switch the specified LED on or off with the specified current."""
-        # Execute the command and capture output
-        stdin, stdout, stderr = self.ssh.exec_command(
-            f"led_switch --color {color} --state {state} --current {current}",
-            get_pty=True
-        )
-
-        # Read output and error streams
-        error_message = stdout.read().decode()
+        # Execute the command and capture output (stderr is merged into it)
+        status, error_message = self.run_command(f"led_switch --color {color} --state {state} --current {current}",
+                                                 op="switch_led")
 
         # Check if there was an error related to the missing file
         if "No such file or directory" in error_message:
@@ -257,33 +1031,47 @@ class Device:
 
     def create_log_folder(self):
         log_folder = f"/home/{self.username}/log"
-        with self.ssh.open_sftp() as sftp:
-            try:
-                sftp.mkdir(log_folder)
-            except IOError:
-                pass  # Folder already exists
+        self.with_sftp(lambda sftp: self.ensure_remote_folder(sftp, log_folder), op="create_log_folder")
         return log_folder
 
-    def clear_tmp_folder(self):
-        print(f'Clear folder /home/{self.username}/wormstation_recordings/ on {self.name}')
-        self.ssh.exec_command(f"rm -rf /home/{self.username}/wormstation_recordings/*", get_pty=True)
+    def recording_folder(self, config):
+        """Folder of the device where picam writes its recordings, from the application or the picam configuration."""
+        folder = config.get('recording_folder') or config.get('local_tmp_dir') or 'wormstation_recordings'
+        return f"/home/{self.username}/{folder}"
 
+    def tmp_inventory(self, config=None):
+        """Inventory of the recording folder, kept between calls so that it is refreshed incrementally."""
+        folder = self.recording_folder(config or {})
+        if folder not in self._tmp_inventories:
+            self._tmp_inventories[folder] = TmpInventory(self, folder)
+        return self._tmp_inventories[folder]
 
+    def clear_tmp_folder(self, config=None):
+        """
+        Delete the content of the recording folder.
+        :return: number of bytes freed
+        """
+        inventory = self.tmp_inventory(config).refresh()
+        entries = inventory.top_level
+        if not entries:
+            return 0
 
+        print(f'Clear folder {inventory.folder}/ on {self.name}')
+        freed = inventory.total_bytes
+        paths = " ".join(shlex.quote(f"{inventory.folder}/{entry.path}") for entry in entries)
+        self.run_command(f"rm -rf {paths}", op="clear_tmp_folder")
+        inventory.forget([entry.path for entry in entries])
+        return freed
 
-    def get_NAS_status(self, config_file):
-        """Check NAS accessibility and mount status."""
-        remote_path = self.receive_json_config_file(config_file)
-        command = f"self_check NAS_status {remote_path}"
-        stdin, stdout, stderr = self.ssh.exec_command(command, get_pty=True)
 
-        # Read and decode the output
-        output = stdout.read().decode().strip()
-        error = stderr.read().decode().strip()
 
-        if error:
-            print(f"SSH Command Error: {error}")
-            return None  # Handle failure case
+
+    def get_NAS_status(self, config):
+        """Check NAS accessibility and mount status."""
+        remote_path = self.push_config(config)
+        command = f"self_check NAS_status {remote_path}"
+        status, output = self.run_command(command, op="get_NAS_status")
+        output = output.strip()
 
         try:
             # Parse the JSON output from self_check.py
@@ -294,19 +1082,12 @@ class Device:
             return None
 
 
-    def mount_NAS(self, config_file):
+    def mount_NAS(self, config):
         """Mount the NAS if it's accessible but not already mounted."""
-        remote_path = self.receive_json_config_file(config_file)
+        remote_path = self.push_config(config)
         command = f"self_check mount_NAS {remote_path}"
-        stdin, stdout, stderr = self.ssh.exec_command(command, get_pty=True)
-
-        # Read and decode the output
-        output = stdout.read().decode().strip()
-        error = stderr.read().decode().strip()
-
-        if error:
-            print(f"SSH Command Error: {error}")
-            return None
+        status, output = self.run_command(command, op="mount_NAS")
+        output = output.strip()
 
         try:
             # Parse the JSON output from self_check.py
@@ -316,19 +1097,12 @@ class Device:
             print(f"Invalid JSON output received: {output}")
             return None
 
-    def check_camera(self, config_file):
+    def check_camera(self, config):
         """Check if the camera is connected."""
-        remote_path = self.receive_json_config_file(config_file)
+        remote_path = self.push_config(config)
         command = f"self_check camera_status {remote_path}"
-        stdin, stdout, stderr = self.ssh.exec_command(command, get_pty=True)
-
-        # Read and decode the output
-        output = stdout.read().decode().strip()
-        error = stderr.read().decode().strip()
-
-        if error:
-            print(f"SSH Command Error: {error}")
-            return None
+        status, output = self.run_command(command, op="check_camera")
+        output = output.strip()
 
         try:
             # Parse the JSON output from self_check.py
@@ -339,19 +1113,12 @@ class Device:
             return None
 
 
-    def check_disk_space(self, config_file):
+    def check_disk_space(self, config):
         """Check the disk space on the device."""
-        remote_path = self.receive_json_config_file(config_file)
+        remote_path = self.push_config(config)
         command = f"self_check disk_space {remote_path}"
-        stdin, stdout, stderr = self.ssh.exec_command(command, get_pty=True)
-
-        # Read and decode the output
-        output = stdout.read().decode().strip()
-        error = stderr.read().decode().strip()
-
-        if error:
-            print(f"SSH Command Error: {error}")
-            return None
+        status, output = self.run_command(command, op="check_disk_space")
+        output = output.strip()
 
         try:
             # Parse the JSON output from self_check.py
@@ -361,25 +1128,18 @@ class Device:
             print(f"Invalid JSON output received: {output}")
             return None
 
-    def auto_LED_test(self, config_file):
+    def auto_LED_test(self, config):
         """Check if the LEDs are working."""
-        remote_path = self.receive_json_config_file(config_file)
+        remote_path = self.push_config(config)
         command = f"self_check auto_LED_test {remote_path}"
-        stdin, stdout, stderr = self.ssh.exec_command(command, get_pty=True)
-
-        # Read and decode the output
-        output = stdout.read().decode().strip()
-        error = stderr.read().decode().strip()
+        status, output = self.run_command(command, op="auto_LED_test")
+        output = output.strip()
 
         # filter out libcamera info messages
         lines = output.split("\n")
         # Discard lines starting with '['
         output = "\n".join([line for line in lines if not line.startswith("[")])
 
-        if error:
-            print(f"SSH Command Error: {error}")
-            return None
-
         try:
             # Parse the JSON output from self_check.py
             result = json.loads(output)
@@ -388,27 +1148,10 @@ class Device:
             print(f"Invalid JSON output received: {output}")
             return None
 
-    def get_tmp_files(self, config_file):
-        """Get the list of temporary files on the device."""
-        remote_path = self.receive_json_config_file(config_file)
-        command = f"self_check tmp_files {remote_path}"
-        stdin, stdout, stderr = self.ssh.exec_command(command, get_pty=True)
-
-        # Read and decode the output
-        output = stdout.read().decode().strip()
-        error = stderr.read().decode().strip()
-
-        if error:
-            print(f"SSH Command Error: {error}")
-            return None
-
-        try:
-            # Parse the JSON output from self_check.py
-            result = json.loads(output)
-            return result  # ✅ Return structured data
-        except json.JSONDecodeError:
-            print(f"Invalid JSON output received: {output}")
-            return None
+    def get_tmp_files(self, config):
+        """Get the list of temporary files and folders in the recording folder of the device."""
+        inventory = self.tmp_inventory(config).refresh()
+        return [entry.path for entry in inventory.top_level]
 
 
 
@@ -0,0 +1,60 @@
+import datetime as dt
+import threading
+from collections import deque
+from itertools import islice
+
+LOG_MAX_LINES = 5000  # Lines kept per device, older lines are dropped
+MAX_LINE_LENGTH = 4096
+
+
+class DeviceLog:
+    """
+    Output of a device (remote commands, installation, connection events), kept in a fixed-size ring buffer.
+    Appending is cheap and thread-safe, so worker threads never wait on console I/O.
+    """
+
+    def __init__(self, name, max_lines=LOG_MAX_LINES):
+        self.name = name
+        self.lines = deque(maxlen=max_lines)
+        self.total_lines = 0  # Lines ever appended, including the dropped ones
+        self._partial = ""  # Text received after the last newline
+        self._lock = threading.Lock()
+
+    def append(self, line):
+        """Append one line, prefixed with the current time."""
+        with self._lock:
+            self._append(line)
+
+    def write(self, text):
+        """Append raw output, which may contain several lines or end in the middle of a line."""
+        with self._lock:
+            *complete_lines, self._partial = (self._partial + text).split("\n")
+            for line in complete_lines:
+                self._append(line.rstrip("\r"))
+            # Output without newlines (e.g. progress bars) must not grow without bound either
+            if len(self._partial) > MAX_LINE_LENGTH:
+                self._append(self._partial)
+                self._partial = ""
+
+    def _append(self, line):
+        self.lines.append(f"{dt.datetime.now().strftime('%H:%M:%S')} {line}")
+        self.total_lines += 1
+
+    def lines_since(self, total_lines):
+        """
+        Lines appended since the log had total_lines lines.
+        :return: tuple (lines, total_lines, complete); complete is False if some of these lines were already dropped
+        """
+        with self._lock:
+            missed = self.total_lines - total_lines
+            new_count = min(missed, len(self.lines))
+            new_lines = list(islice(self.lines, len(self.lines) - new_count, None))
+            return new_lines, self.total_lines, missed <= len(self.lines)
+
+    def snapshot(self):
+        with self._lock:
+            return list(self.lines)
+
+    def save(self, path):
+        with open(path, "w", encoding="utf-8") as f:
+            f.write("\n".join(self.snapshot()) + "\n")
@@ -1,38 +1,248 @@
 #from concurrent.futures import ThreadPoolExecutor, as_completed
-from multiprocessing.pool import ThreadPool
+from concurrent.futures import ThreadPoolExecutor, wait
+from dataclasses import dataclass
+from typing import Optional
+import asyncio
+import threading
+import time
 
 from itertools import compress
 from PyQt5 import QtCore
 import getpass
-from .device import Device
-import os
-import subprocess
-import sys
+from .device import Device, encode_config, KEEPALIVE_INTERVAL
+from .reachability import ReachabilityProber
+from .recording_download import RecordingDownloader
 import select
 
+# Seconds after which a fleet operation stops waiting for the devices that did not answer
+FLEET_DEADLINE = 300
+
+
+@dataclass
+class DeviceOutcome:
+    """Result of an operation on one device."""
+
+    device: object
+    value: object = None
+    error: Optional[BaseException] = None
+    latency: Optional[float] = None  # Seconds, None if the operation did not finish before the deadline
+    timed_out: bool = False
+
+    @property
+    def ok(self):
+        return self.error is None and not self.timed_out
+
+
+@dataclass
+class FleetResult:
+    """Outcomes of an operation run on several devices, in device order."""
+
+    outcomes: list
+    elapsed: float
+
+    def __iter__(self):
+        return iter(self.outcomes)
+
+    def __len__(self):
+        return len(self.outcomes)
+
+    @property
+    def values(self):
+        """Value of each device, None for the devices that failed or timed out."""
+        return [outcome.value for outcome in self.outcomes]
+
+    @property
+    def succeeded(self):
+        return [outcome for outcome in self.outcomes if outcome.ok]
+
+    @property
+    def failed(self):
+        return [outcome for outcome in self.outcomes if outcome.error is not None]
+
+    @property
+    def timed_out(self):
+        return [outcome for outcome in self.outcomes if outcome.timed_out]
+
+    def summary(self):
+        return (f"{len(self.succeeded)} ok, {len(self.failed)} failed, {len(self.timed_out)} timed out "
+                f"in {self.elapsed:.1f} s")
+
+
+def device_label(device):
+    return getattr(device, "name", device)
+
+
+@dataclass
+class HostScan:
+    """Scan report entry of one host of the hosts file."""
+
+    host: str
+    reachable: bool
+    latency: Optional[float] = None  # Seconds to open a TCP connection to the SSH port
+    connected: bool = False
+    connect_time: Optional[float] = None  # Seconds spent establishing the SSH connection
+    error: Optional[BaseException] = None
+    reused: bool = False  # The SSH connection of the previous scan was still alive
+    auth_failed: bool = False  # The key of the user was refused, see DeviceManager.install_ssh_keys
+
+    def __str__(self):
+        if self.reused:
+            return f"{self.host}: connection reused"
+        if not self.reachable:
+            return f"{self.host}: unreachable"
+        if self.auth_failed:
+            return f"{self.host}: authentication failed, the SSH key of the user is not installed on the device"
+        if not self.connected:
+            return f"{self.host}: connection failed after {self.connect_time or 0:.1f} s {self.error or ''}".rstrip()
+        return f"{self.host}: connected in {self.connect_time:.1f} s (TCP {self.latency * 1000:.0f} ms)"
+
+
+class DeviceSignals(QtCore.QObject):
+    """Qt signals of the devices, emitted from any thread."""
+
+    state_changed = QtCore.pyqtSignal(object, str)  # Device and its new connection state
+
 
 class DeviceManager:
-    def __init__(self, host_list=None):
+    def __init__(self, host_list=None, use_agent=False, snapshot_ttl=2.0, max_workers=64, connect_parallelism=16,
+                 key_filename=None):
         self.host_list = host_list if host_list is not None else []
+        self.key_filename = key_filename  # Private key used to log in to the devices, besides the default ones
+        self.use_agent = use_agent  # Keep one remote agent channel per device instead of one channel per command
+        self.snapshot_ttl = snapshot_ttl
+        self.max_workers = max_workers
+        self.connect_parallelism = connect_parallelism  # Maximum number of SSH connections established at once
+        self.auth_failed_hosts = []  # Hosts of the last scan that refused the key of the user
+        self.prober = ReachabilityProber()
+        self.signals = DeviceSignals()
+        self._monitor_thread = None
+        self._monitor_stop = threading.Event()
+        self._executor = None
+
+    @property
+    def executor(self):
+        """Thread pool shared by all fleet operations, created on first use."""
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="fleet")
+        return self._executor
+
+    def start_monitor(self, interval=2 * KEEPALIVE_INTERVAL):
+        """Check the connection of all devices periodically in the background, see Device.check_connection."""
+        if self._monitor_thread is not None:
+            return
+        self._monitor_stop.clear()
+        self._monitor_thread = threading.Thread(target=self._monitor_connections, args=(interval,), daemon=True)
+        self._monitor_thread.start()
+
+    def _monitor_connections(self, interval):
+        while not self._monitor_stop.wait(interval):
+            self.run_fleet(lambda device: device.check_connection(), list(self.host_list), deadline=interval)
+
+    def stop_monitor(self):
+        self._monitor_stop.set()
+        self._monitor_thread = None
+
+    def shutdown(self):
+        """Stop the connection monitor and release the shared thread pool."""
+        self.stop_monitor()
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+
+    async def run_on(self, devices, op, concurrency=16, timeout=None):
+        """
+        Run op(device) on all devices from an asyncio event loop, with at most `concurrency` operations in flight.
+        The blocking device calls run on the shared executor, so hundreds of devices never need hundreds of threads.
+        :param op: blocking function called with each device
+        :param timeout: optional per-device timeout in seconds
+        :return: list of results in device order; a failed or timed out device gets its exception as result
+        """
+        loop = asyncio.get_running_loop()
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def run(device):
+            async with semaphore:
+                # On timeout the device call keeps its executor thread until it returns, it cannot be interrupted
+                return await asyncio.wait_for(loop.run_in_executor(self.executor, op, device), timeout)
+
+        return await asyncio.gather(*(run(device) for device in devices), return_exceptions=True)
+
+    def run_fleet(self, func, device_list, *args, deadline=FLEET_DEADLINE, max_in_flight=None, **kwargs):
+        """
+        Execute func(device, *args, **kwargs) on all devices in parallel on the shared executor.
+        A failing device does not affect the others, and devices still running after the deadline are
+        reported as timed out instead of being waited on.
+        :param deadline: overall deadline in seconds, None to wait for all devices
+        :param max_in_flight: optional maximum number of devices handled at the same time
+        :return: FleetResult
+        """
+        start = time.monotonic()
+
+        def remaining_time():
+            return None if deadline is None else max(0.0, start + deadline - time.monotonic())
+
+        def timed_call(device):
+            call_start = time.monotonic()
+            try:
+                return func(device, *args, **kwargs), None, time.monotonic() - call_start
+            except Exception as e:
+                return None, e, time.monotonic() - call_start
+
+        slots = threading.BoundedSemaphore(max_in_flight) if max_in_flight else None
+        futures = []
+        for device in device_list:
+            # Submit the next device only once a slot is free; devices not submitted before the deadline time out
+            if slots is not None and not slots.acquire(timeout=remaining_time()):
+                break
+            future = self.executor.submit(timed_call, device)
+            if slots is not None:
+                future.add_done_callback(lambda _: slots.release())
+            futures.append(future)
+
+        done, not_done = wait(futures, timeout=remaining_time())
+
+        outcomes = []
+        for device, future in zip(device_list, futures + [None] * (len(device_list) - len(futures))):
+            if future in done:
+                value, error, latency = future.result()
+                outcomes.append(DeviceOutcome(device, value=value, error=error, latency=latency))
+            else:
+                # Dropped if not started yet; a running call cannot be interrupted, its result is ignored
+                if future is not None:
+                    future.cancel()
+                outcomes.append(DeviceOutcome(device, timed_out=True))
+
+        return FleetResult(outcomes, elapsed=time.monotonic() - start)
 
     def execute_on_multiple_devices(self, func, device_list, *args, **kwargs):
-        """Execute a function on all devices in parallel using map."""
+        """Execute a function on all devices in parallel and return the values, None for failed devices."""
 
         #Check if device_list is empty
         if not device_list:
             print("No devices selected.")
             return
 
-        # Use ThreadPool to execute the function on all devices in parallel
-        with ThreadPool(len(device_list)) as pool:
-            # Prepare a list of partial functions with arguments for each device
-            results = pool.map(lambda device: func(device, *args, **kwargs), device_list)
+        result = self.run_fleet(func, device_list, *args, **kwargs)
+        self.report_failures(result)
+        return result.values
 
-        return results  # Collect and return results if needed
+    def report_failures(self, result, logger=print):
+        """Log the devices that failed or timed out in a FleetResult."""
+        for outcome in result.failed:
+            logger(f"Device {device_label(outcome.device)} failed: {outcome.error!r}")
+        for outcome in result.timed_out:
+            logger(f"Device {device_label(outcome.device)} did not answer before the deadline")
+
+    def connect_device(self, name, username):
+        """Create a device, which connects to it over SSH. The device is not added to the list."""
+        device = Device(name, username=username, use_agent=self.use_agent, snapshot_ttl=self.snapshot_ttl,
+                        key_filename=self.key_filename)
+        device.add_state_listener(self.signals.state_changed.emit)
+        return device
 
     def add_device(self, name, username):
         """Add a new device to the list if it is connected."""
-        new_device = Device(name, username=username)
+        new_device = self.connect_device(name, username)
         if new_device.connected:
             self.host_list.append(new_device)
             return new_device
@@ -44,16 +254,13 @@ class DeviceManager:
             return self.host_list[device_id]
         return None
 
+    def probe_hosts(self, hosts):
+        """Check concurrently which hosts accept SSH connections. Return a list of ProbeResult, in order."""
+        return self.prober.probe(hosts)
+
     def is_device_reachable(self, host):
-        """Check if a device is reachable via ping."""
-        try:
-            if os.name == 'nt':
-                subprocess.run(["ping", "-n", "1", "-w", "50", host], check=True)
-            else:
-                subprocess.run(["ping", "-c", "1", "-q", "-W", "0.05", host], check=True)
-            return True
-        except subprocess.CalledProcessError:
-            return False
+        """Check if a device accepts SSH connections."""
+        return self.probe_hosts([host])[0].reachable
 
     def add_reachable_device(self, host, username="default_user"):
         """Add a device if it is reachable."""
@@ -76,42 +283,131 @@ class DeviceManager:
             return None
 
     def scan_devices(self, filename, username):
-        """Scan and add devices from the host list file in the order they appear."""
-
-        # Clear the current device list
+        """
+        Scan and add devices from the host list file in the order they appear.
+        Devices of the previous scan whose SSH connection is still alive are kept, only new or dead hosts are
+        connected again, and devices removed from the file are disconnected.
+        :return: list of HostScan, one per host of the file, with the time spent connecting to each of them
+        """
+        start = time.monotonic()
+        previous_devices = {device.name: device for device in self.host_list}
         self.host_list.clear()
-        hosts = self.get_selected_devices(filename)
+        hosts = self.get_selected_devices(filename) or []
+
+        # ✅ Keep the live connections of the previous scan, checked with a round trip to each device in parallel
+        candidates = [previous_devices[host] for host in hosts
+                      if host in previous_devices and previous_devices[host].username == username]
+        alive = self.run_fleet(lambda device: device.is_alive(), candidates, deadline=None)
+        kept_devices = {outcome.device.name: outcome.device for outcome in alive if outcome.ok and outcome.value}
+        for name, device in previous_devices.items():
+            if name not in kept_devices:
+                device.close()
 
         # ✅ Handle empty file or no valid hosts
         if not hosts:
             print(f"Warning: The file '{filename}' is empty or contains only comments.")
-            return  # Exit the function
-
-        # ✅ Perform reachability check in parallel and collect results
-        reachability_results = self.execute_on_multiple_devices(self.is_device_reachable, hosts)
-
-        # ✅ Add reachable devices in the correct order
-        for host, is_reachable in zip(hosts, reachability_results):
-            if is_reachable:
-                self.add_device(host, username=username)
-
-    def clear_tmp_folders(self, device_list=None):
-        """Clear temporary folders on all selected devices in parallel."""
+            return []  # Exit the function
+
+        # ✅ Probe the other hosts at once and collect results
+        to_connect = [host for host in hosts if host not in kept_devices]
+        probes = {probe.host: probe for probe in self.probe_hosts(to_connect)}
+        report = []
+        for host in hosts:
+            if host in kept_devices:
+                report.append(HostScan(host, reachable=True, connected=True, reused=True))
+            else:
+                report.append(HostScan(host, reachable=probes[host].reachable, latency=probes[host].latency))
+        reachable = [entry for entry in report if entry.reachable and not entry.reused]
+
+        # ✅ Connect to the reachable devices in parallel, at most connect_parallelism at a time
+        connections = self.run_fleet(lambda entry: self.connect_device(entry.host, username), reachable,
+                                     deadline=None, max_in_flight=self.connect_parallelism)
+
+        new_devices = {}
+        for entry, outcome in zip(reachable, connections):
+            entry.connect_time = outcome.latency
+            entry.error = outcome.error if not outcome.ok else outcome.value.connect_error
+            entry.connected = outcome.ok and outcome.value.connected
+            entry.auth_failed = outcome.ok and outcome.value.auth_failed
+            if entry.connected:
+                new_devices[entry.host] = outcome.value
+
+        # ✅ Add connected devices in the order of the file
+        for host in hosts:
+            device = kept_devices.get(host) or new_devices.get(host)
+            if device is not None:
+                self.host_list.append(device)
+
+        for entry in report:
+            print(entry)
+        print(f"Connected to {len(self.host_list)}/{len(hosts)} devices ({len(kept_devices)} reused) "
+              f"in {time.monotonic() - start:.1f} s")
+        self.auth_failed_hosts = [entry.host for entry in report if entry.auth_failed]
+        if self.auth_failed_hosts:
+            print(f"Authentication failed on {len(self.auth_failed_hosts)} devices, install your SSH key on them "
+                  f"with File > Install SSH keys")
+        return report
+
+    def install_ssh_keys(self, hosts, username):
+        """
+        Install the SSH key of the user on the hosts with ssh-copy-id, one host at a time since
+        each of them asks for a password on the terminal. Scan again afterwards to add the devices.
+        :return: hosts on which the key works now
+        """
+        installed = []
+        for host in hosts:
+            print(f"Installing the SSH key of {username} on {host}")
+            device = self.connect_device(host, username)
+            if device.connected or device.install_ssh_key():
+                installed.append(host)
+            device.close()
+        return installed
+
+    def clear_tmp_folders(self, device_list=None, config=None):
+        """
+        Clear temporary folders on all selected devices in parallel.
+        :param config: application or picam configuration giving the recording folder, the default folder if None
+        :return: FleetResult of the number of bytes freed on each device
+        """
         # Use self.host_list as default if device_list is None (clear all devices)
         device_list = device_list or self.host_list
 
         print(f'Clearing tmp folders on {len(device_list)} devices')
-        self.execute_on_multiple_devices(lambda device: device.clear_tmp_folder(), device_list)
+        result = self.run_fleet(lambda device: device.clear_tmp_folder(config), device_list)
+        self.report_failures(result)
+        freed = sum(value for value in result.values if value)
+        print(f'{freed / 1024 ** 3:.2f} GB freed')
+        return result
+
+
+    def pull_recordings(self, config, destination, device_list=None, max_bandwidth=None, on_progress=None,
+                        max_in_flight=None):
+        """
+        Download the recordings left on the devices to destination/<device name>/, from all devices in parallel.
+        Files already downloaded are skipped and partial downloads are resumed, so this can simply be run again.
+        :param max_bandwidth: total download rate in bytes per second, None for no limit
+        :param on_progress: see RecordingDownloader
+        :return: FleetResult of DownloadReport
+        """
+        device_list = device_list or self.host_list
+        downloader = RecordingDownloader(destination, max_bandwidth=max_bandwidth, on_progress=on_progress)
 
+        print(f'Pulling recordings from {len(device_list)} devices to {destination}')
+        # Transfers can take hours, wait for all devices
+        result = self.run_fleet(lambda device: downloader.pull(device, device.recording_folder(config)), device_list,
+                                deadline=None, max_in_flight=max_in_flight)
+        self.report_failures(result)
+        return result
 
     def check_updates(self, device_list=None):
         """Check if devices need updates and return the updatable ones."""
         device_list = device_list or self.host_list
-        # Use execute_on_multiple_devices to check if each device is up to date
-        updatable_status = self.execute_on_multiple_devices(lambda device: not device.is_uptodate, device_list)
+        # Check if each device is up to date; devices that did not answer are not reported as updatable
+        result = self.run_fleet(lambda device: not device.is_uptodate, device_list)
+        self.report_failures(result)
 
         # Filter and return only devices that need updates
-        return list(compress(device_list, updatable_status))
+        return list(compress(device_list, result.values))
 
     def update_all_devices(self):
         """Update all updatable devices."""
@@ -136,27 +432,167 @@ class DeviceManager:
         """Run installation on all devices with sudo password."""
         if sudo_password is None:
             sudo_password = getpass.getpass(prompt='Enter your sudo password: ')
-        self.execute_on_multiple_devices(lambda device: DeviceInstaller(device, sudo_password).run_install_script(), self.host_list)
+        # The installation can take a long time, wait for all devices
+        self.execute_on_multiple_devices(lambda device: DeviceInstaller(device, sudo_password).run_install_script(),
+                                         self.host_list, deadline=None)
         print("\nInstallation complete.")
 
-    def switch_led(self, color, state, current, device_list):
-        """Switch the LED on or off on all or selected devices in parallel."""
-        self.execute_on_multiple_devices(lambda device: device.switch_led(color=color, state=state, current=current), device_list)
+    def switch_led(self, color, state, current, device_list, skip_running=False):
+        """
+        Switch the LED on or off on all or selected devices in parallel.
+        :param skip_running: leave the devices that are recording alone, their status being checked in parallel too
+        """
+        def switch(device):
+            if skip_running and device.is_running:
+                return
+            device.switch_led(color=color, state=state, current=current)
+
+        result = self.run_fleet(switch, device_list)
+        self.report_failures(result)
+        return result
+
+    def snapshots(self, device_list=None, max_age=None):
+        """Refresh the status snapshots of the devices in parallel and return them in order."""
+        device_list = self.host_list if device_list is None else device_list
+        if not device_list:
+            return []
+        return self.execute_on_multiple_devices(lambda device: device.snapshot(max_age=max_age), device_list)
 
     def running_devices(self):
         """Return a list of devices that are currently running."""
-        return [d for d in self.host_list if d.is_running]
+        snapshots = self.snapshots(self.host_list)
+        return [d for d, snapshot in zip(self.host_list, snapshots) if snapshot is not None and snapshot.is_running]
 
     def stop_devices(self, device_list):
         """Stop the specified devices."""
         for device in device_list:
             device.stop()
 
-    def record_devices(self, device_list, config_file):
-        """Start recording on the specified devices with the given config file."""
-        for device in device_list:
-            remote_path = device.receive_json_config_file(config_file)
-            device.record(remote_path)
+    def push_config(self, config, device_list=None):
+        """Serialize the configuration once and upload it to all devices in parallel. Return the remote paths."""
+        device_list = self.host_list if device_list is None else device_list
+        if not device_list:
+            return []
+        encoded = encode_config(config)
+        return self.execute_on_multiple_devices(lambda device: device.push_config(config, encoded=encoded), device_list)
+
+    def fetch_frames(self, device_list, config, on_frame, preview_size=None, max_in_flight=8):
+        """
+        Fetch a frame from each device concurrently, with at most max_in_flight fetches at a time.
+        :param config: preview configuration dictionary, used by the devices that have to acquire a new frame
+        :param on_frame: callback(index, device, frame, error) called from a worker thread as soon as a device
+                         answers, in completion order; frame is None if the device failed or had no frame
+        :param preview_size: optional (width, height); frames are then downscaled on the devices before transfer
+        """
+        if not device_list:
+            return
+
+        encoded = encode_config(config)
+        pushes = self.run_fleet(lambda device: device.push_config(config, encoded=encoded), device_list)
+
+        def fetch(job):
+            index, device, remote_path = job
+            try:
+                on_frame(index, device, device.get_frame(remote_path, preview_size=preview_size), None)
+            except Exception as e:
+                on_frame(index, device, None, e)
+
+        jobs = []
+        for index, outcome in enumerate(pushes):
+            if outcome.ok:
+                jobs.append((index, outcome.device, outcome.value))
+            else:
+                # Without its configuration the device cannot acquire a frame
+                error = outcome.error or TimeoutError(f"No answer from {device_label(outcome.device)} to the upload")
+                on_frame(index, outcome.device, None, error)
+        self.run_fleet(fetch, jobs, deadline=None, max_in_flight=max_in_flight)
+
+    def record_devices(self, device_list, config):
+        """
+        Start recording on the specified devices with the given configuration dictionary.
+        picam is launched detached on all devices concurrently, and each start is confirmed by its PID and status.txt.
+        :return: FleetResult whose values are StartedRecording
+        """
+        if not device_list:
+            print("No devices selected.")
+            return FleetResult([], elapsed=0.0)
+
+        encoded = encode_config(config)
+        result = self.run_fleet(lambda device: device.record(device.push_config(config, encoded=encoded)), device_list)
+        print(self.start_report(result))
+        return result
+
+    def prepare_recordings(self, device_list, config):
+        """
+        First phase of a synchronized start, on all devices in parallel: push the configuration, check camera
+        and disk, and measure the clock offsets (see Device.prepare_recording).
+        :return: FleetResult whose values are PreparedRecording
+        """
+        encoded = encode_config(config)
+        result = self.run_fleet(lambda device: device.prepare_recording(config, encoded=encoded), device_list)
+        self.report_failures(result)
+        return result
+
+    def commit_recordings(self, prepared, start_margin=2.0):
+        """
+        Second phase of a synchronized start: all devices start recording at the same time.
+        :param prepared: succeeded DeviceOutcome of prepare_recordings, holding the PreparedRecording of each device
+        :param start_margin: seconds left for the start order to reach the devices before the common start time
+        :return: FleetResult whose values are StartedRecording
+        """
+        devices = [outcome.device for outcome in prepared]
+        preparations = {id(outcome.device): outcome.value for outcome in prepared}
+        if not devices:
+            return FleetResult([], elapsed=0.0)
+
+        start = time.monotonic()
+        start_at = time.time() + start_margin + max(preparation.clock_rtt for preparation in preparations.values())
+
+        # Schedule all devices before waiting on any of them: with more devices than executor threads,
+        # waiting in each worker would delay the scheduling of the last devices past start_at
+        scheduled = self.run_fleet(lambda device: device.schedule_recording(preparations[id(device)], start_at),
+                                   devices)
+        if time.time() > start_at:
+            print(f"Scheduling took longer than the start margin of {start_margin} s, some devices start late")
+
+        # picam only appears once the scheduled time is reached
+        time.sleep(max(0.0, start_at - time.time()))
+        confirmed = self.run_fleet(lambda device: device.confirm_scheduled_recording(preparations[id(device)]),
+                                   [outcome.device for outcome in scheduled if outcome.ok])
+
+        confirmations = {id(outcome.device): outcome for outcome in confirmed}
+        result = FleetResult([confirmations.get(id(outcome.device), outcome) for outcome in scheduled],
+                             elapsed=time.monotonic() - start)
+        print(self.start_report(result))
+        return result
+
+    @staticmethod
+    def start_spread(result):
+        """Seconds between the first and the last actual start of a committed recording, None if unknown."""
+        start_times = [outcome.value.started_at for outcome in result.succeeded if outcome.value.started_at is not None]
+        return max(start_times) - min(start_times) if start_times else None
+
+    @staticmethod
+    def start_report(result):
+        """Summary of a fleet recording start, one line per device."""
+        lines = [f"Recording start: {result.summary()}"]
+        spread = DeviceManager.start_spread(result)
+        if spread is not None:
+            lines.append(f"Start spread across devices: {spread * 1000:.0f} ms")
+            first_start = min(outcome.value.started_at for outcome in result.succeeded)
+
+        for outcome in result:
+            name = device_label(outcome.device)
+            if outcome.ok and outcome.value.started_at is not None:
+                lines.append(f"{name}: started at +{(outcome.value.started_at - first_start) * 1000:.0f} ms "
+                             f"(PID {outcome.value.snapshot.pid})")
+            elif outcome.ok:
+                lines.append(f"{name}: started in {outcome.latency:.1f} s (PID {outcome.value.snapshot.pid})")
+            elif outcome.timed_out:
+                lines.append(f"{name}: no answer before the deadline")
+            else:
+                lines.append(f"{name}: failed after {outcome.latency:.1f} s: {outcome.error}")
+        return "\n".join(lines)
 
     @property
     def is_empty(self):
@@ -170,6 +606,7 @@ class DeviceInstaller:
         self.name = device.name
         self.username = device.username
         self.ssh = device.ssh
+        self.log = device.log  # The script output goes to the device log panel, not to the console
         self.sudo_password = sudo_password
 
     def run_install_script(self):
@@ -200,7 +637,7 @@ class DeviceInstaller:
                     if rl:
                         # Handle decoding errors gracefully
                         line = stdout.channel.recv(1024).decode('utf-8', errors='replace')
-                        sys.stdout.write(line)
+                        self.log.write(line)
                         if 'password' in line.lower():
                             stdin.write(f"{self.sudo_password}\n")
                             stdin.flush()
@@ -213,7 +650,7 @@ class DeviceInstaller:
 
         # Read any remaining output
         for line in iter(stdout.readline, ""):
-            print(line, end="")
+            self.log.write(line)
 
         # Ensure the channels are closed
         stdout.channel.close()
@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+"""
+Device-side helper for the WormStation controller.
+
+This script is uploaded by the controller to ~/.config/wormstation and started on a
+single long-lived SSH channel. It only relies on the Python standard library so it
+can run on any Raspberry Pi OS image; the thumbnail command additionally uses PIL
+(python3-pil, installed along with picamera2) and exits with status 3 without it.
+
+Usage:
+    qontroller_agent.py serve
+    qontroller_agent.py thumbnail SRC DST MAX_WIDTH MAX_HEIGHT QUALITY
+    qontroller_agent.py launch_at TIMESTAMP STAMP_FILE COMMAND [ARGS...]
+
+Protocol (line-delimited JSON on stdin/stdout):
+    -> {"id": 1, "cmd": "pgrep picam", "timeout": 10}
+    <- {"id": 1, "status": 0, "stdout": "1234\n"}
+"""
+
+import json
+import os
+import subprocess
+import sys
+import time
+
+PROTOCOL_VERSION = 1
+
+
+def send(message):
+    sys.stdout.write(json.dumps(message) + "\n")
+    sys.stdout.flush()
+
+
+def run_shell_command(command, timeout=None):
+    """Run a shell command, merging stderr into stdout like a PTY would."""
+    try:
+        completed = subprocess.run(
+            command,
+            shell=True,
+            executable=os.environ.get("SHELL", "/bin/sh"),
+            cwd=os.path.expanduser("~"),
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+            timeout=timeout,
+        )
+        return completed.returncode, completed.stdout.decode("utf-8", errors="replace")
+    except subprocess.TimeoutExpired as e:
+        output = (e.output or b"").decode("utf-8", errors="replace")
+        return 124, output
+
+
+def serve():
+    send({"ready": True, "version": PROTOCOL_VERSION, "pid": os.getpid()})
+
+    for line in sys.stdin:
+        line = line.strip()
+        if not line:
+            continue
+
+        try:
+            request = json.loads(line)
+        except json.JSONDecodeError as e:
+            send({"id": None, "error": f"Invalid request: {e}"})
+            continue
+
+        request_id = request.get("id")
+        try:
+            status, output = run_shell_command(request["cmd"], request.get("timeout"))
+            send({"id": request_id, "status": status, "stdout": output})
+        except Exception as e:
+            send({"id": request_id, "error": str(e)})
+
+
+def thumbnail(src, dst, max_width, max_height, quality):
+    """Write a downscaled copy of a JPEG frame, unless DST is already up to date. Exit status 3 if PIL is missing."""
+    try:
+        from PIL import Image
+    except ImportError:
+        sys.stderr.write("PIL is not installed\n")
+        return 3
+
+    if os.path.exists(dst) and os.stat(dst).st_mtime >= os.stat(src).st_mtime:
+        return 0
+
+    with Image.open(src) as image:
+        # Let the JPEG decoder downscale while decoding (DCT scaling), then finish the resize
+        image.draft("RGB", (max_width, max_height))
+        image.thumbnail((max_width, max_height))
+        tmp_path = dst + ".tmp"
+        image.save(tmp_path, "JPEG", quality=quality)
+    os.replace(tmp_path, dst)
+    return 0
+
+
+def launch_at(start_time, stamp_file, command):
+    """
+    Wait until start_time (seconds since epoch, device clock), write the actual time to STAMP_FILE
+    and replace this process by COMMAND, which keeps the PID.
+    """
+    # Sleep most of the delay, then spin for the last few milliseconds to start on time
+    delay = start_time - time.time()
+    if delay > 0.02:
+        time.sleep(delay - 0.02)
+    while time.time() < start_time:
+        pass
+
+    started = time.time()
+    with open(stamp_file, "w") as f:
+        f.write(f"{started:.6f}\n")
+    os.execvp(command[0], command)
+
+
+def main(argv):
+    if len(argv) == 2 and argv[1] == "serve":
+        serve()
+        return 0
+
+    if len(argv) == 7 and argv[1] == "thumbnail":
+        return thumbnail(argv[2], argv[3], int(argv[4]), int(argv[5]), int(argv[6]))
+
+    if len(argv) >= 5 and argv[1] == "launch_at":
+        launch_at(float(argv[2]), argv[3], argv[4:])
+
+    sys.stderr.write(__doc__)
+    return 2
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
@@ -9,10 +9,10 @@ from src.diagnostic_tools.task import Task
 class DiagnosticEnvironment:
     """Represents a diagnostic environment with a list of tasks."""
 
-    def __init__(self, remote_config_file=None):
+    def __init__(self, recording_config=None):
         self.config = None
         self.device_manager = None
-        self.remote_config_file = remote_config_file
+        self.recording_config = recording_config  # Configuration dictionary used by the self_check commands
 
 
 
@@ -23,11 +23,11 @@ class DiagnosticManager(QObject):
     status_update_signal = pyqtSignal(int, str)  # ✅ Signal for task status updates
 
 
-    def __init__(self, remote_config_file=None):
+    def __init__(self, recording_config=None):
         super().__init__()
         self.tasks = load_diagnostic_tasks()  # ✅ Load tasks internally
         self.logs = []
-        self.environment = DiagnosticEnvironment(remote_config_file)  # ✅ Initialize environment
+        self.environment = DiagnosticEnvironment(recording_config)  # ✅ Initialize environment
 
     def get_tasks(self):
         """Return the list of tasks."""
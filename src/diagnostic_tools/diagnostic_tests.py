@@ -8,6 +8,16 @@ from src.config_wizard import load_config
 from src.device_manager import DeviceManager
 
 def find_project_root(target_file='config.json'):
+    """
+    Path of target_file: as given if it is absolute (e.g. the hosts file of the simulator),
+    otherwise looked up by name in the folders above this one.
+    """
+    target_file = os.path.expanduser(target_file)
+    if os.path.isabs(target_file):
+        if not os.path.isfile(target_file):
+            raise FileNotFoundError(f"{target_file} not found.")
+        return target_file
+
     current_dir = os.path.abspath(__file__)
 
     # Get only the file name from the path
@@ -52,24 +62,31 @@ def connect_to_remote_devices(logger=None, environment=None):
     host_list_file = find_project_root(host_list_relative_path)
     logger(f"Host list file found at {host_list_file}.")
 
-    environment.device_manager = DeviceManager()
+    environment.device_manager = DeviceManager(use_agent=environment.config.get("use_remote_agent", False),
+                                               key_filename=environment.config.get("ssh_key_file"))
 
     list_of_devices_to_connect = environment.device_manager.get_selected_devices(host_list_file)
     logger(f"Devices to connect:")
     for device in list_of_devices_to_connect:
         logger(f" - {device}")
 
-    for device in list_of_devices_to_connect:
-        logger(f"Connecting to {device}...")
-        if environment.device_manager.is_device_reachable(device):
-            environment.device_manager.add_device(device, username=environment.config["username"])
+    # Probe all devices at once before connecting to the reachable ones
+    probes = environment.device_manager.probe_hosts(list_of_devices_to_connect)
+    for probe in probes:
+        logger(f"Connecting to {probe.host}...")
+        if probe.reachable:
+            environment.device_manager.add_device(probe.host, username=environment.config["username"])
         else:
-            unreachable_devices.append(device)
-            logger(f"Failed to connect to {device}.")
+            unreachable_devices.append(probe.host)
+            logger(f"Failed to connect to {probe.host}.")
 
     if environment.device_manager.is_empty:
         logger("Failed to connect to all devices.")
         return 0
+
+    if environment.recording_config is not None:
+        # Upload the configuration once, in parallel; the checks below reuse it
+        environment.device_manager.push_config(environment.recording_config)
     if unreachable_devices:
         logger(f"Failed to connect to {len(unreachable_devices)} devices.")
         return 2
@@ -100,8 +117,10 @@ def check_NAS_connection(logger=None, environment=None):
         connect_to_remote_devices(logger, environment)
 
     if not environment.device_manager.is_empty:
-        NAS_status = (
-            environment.device_manager.execute_on_multiple_devices(lambda device: device.get_NAS_status(environment.remote_config_file), environment.device_manager.host_list))
+        result = environment.device_manager.run_fleet(
+            lambda device: device.get_NAS_status(environment.recording_config), environment.device_manager.host_list)
+        environment.device_manager.report_failures(result, logger)
+        NAS_status = result.values
         if all(NAS_status):
             logger("All devices can reach the NAS.")
             return 1
@@ -126,10 +145,12 @@ def check_NAS_mount(logger=None, environment=None):
         return 0  # Fail if no devices are found
 
     # Run NAS mount check on all devices (Expecting a boolean return)
-    NAS_mount_status = environment.device_manager.execute_on_multiple_devices(
-        lambda device: device.mount_NAS(environment.remote_config_file),
+    result = environment.device_manager.run_fleet(
+        lambda device: device.mount_NAS(environment.recording_config),
         environment.device_manager.host_list
     )
+    environment.device_manager.report_failures(result, logger)
+    NAS_mount_status = result.values
 
     # Process results
     failed_devices = []
@@ -167,10 +188,11 @@ def check_camera(logger=None, environment=None):
     not_running_devices = get_non_running_devices(logger, environment)
 
     if not environment.device_manager.is_empty and not_running_devices:
-        camera_status = (
-            environment.device_manager.execute_on_multiple_devices(
-                lambda device: device.check_camera(environment.remote_config_file),
-                not_running_devices))
+        result = environment.device_manager.run_fleet(
+            lambda device: device.check_camera(environment.recording_config),
+            not_running_devices)
+        environment.device_manager.report_failures(result, logger)
+        camera_status = result.values
         # logger(camera_status)
         if all(camera_status):
             logger("All devices have a camera connected.")
@@ -178,7 +200,7 @@ def check_camera(logger=None, environment=None):
         else:
             logger("At least one device does not have a camera connected.")
             # find the devices that do not have a camera connected
-            unreachable_devices = [device for device, status in zip(environment.device_manager.host_list, camera_status) if not status]
+            unreachable_devices = [device for device, status in zip(not_running_devices, camera_status) if not status]
             for device in unreachable_devices:
                 logger(f"Device {device.name} does not have a camera connected.")
             return 0
@@ -199,10 +221,12 @@ def check_disk_space(logger=None, environment=None):
         return 0  # Fail if no devices are found
 
     # Run disk space check on all devices
-    disk_space_status = environment.device_manager.execute_on_multiple_devices(
-        lambda device: device.check_disk_space(environment.remote_config_file),
+    result = environment.device_manager.run_fleet(
+        lambda device: device.check_disk_space(environment.recording_config),
         environment.device_manager.host_list
     )
+    environment.device_manager.report_failures(result, logger)
+    disk_space_status = result.values
 
     # Process results
     all_devices_successful = True
@@ -261,10 +285,17 @@ def auto_LED_test(logger=None, environment=None):
 
     if not_running_devices:
         # ✅ Run LED test on all devices
-        led_results = environment.device_manager.execute_on_multiple_devices(
-            lambda device: device.auto_LED_test(environment.remote_config_file),
+        result = environment.device_manager.run_fleet(
+            lambda device: device.auto_LED_test(environment.recording_config),
             not_running_devices
         )
+        environment.device_manager.report_failures(result, logger)
+        led_results = result.values
+
+        # A device that did not answer cannot be considered as working
+        if not all(outcome.ok for outcome in result):
+            logger("Some devices did not complete the LED test.")
+            return 0
 
         # ✅ Process results
         all_leds_working = True  # Assume all LEDs work unless proven otherwise
@@ -309,27 +340,29 @@ def get_tmp_files(logger=None, environment=None):
         logger("No devices found.")
         return 0  # Fail if no devices are found
 
-    # Run temporary file check on all devices
-    tmp_file_status = environment.device_manager.execute_on_multiple_devices(
-        lambda device: device.get_tmp_files(environment.remote_config_file),
+    # Query the inventory of the recording folder of each device, refreshed with only the changes since the last run
+    result = environment.device_manager.run_fleet(
+        lambda device: device.tmp_inventory(environment.recording_config).refresh().recordings(),
         environment.device_manager.host_list
     )
+    environment.device_manager.report_failures(result, logger)
+    tmp_file_status = result.values
 
     # Process results
     all_devices_successful = True
     warning_devices = []
     failed_devices = []
 
-    for device, files in zip(environment.device_manager.host_list, tmp_file_status):
-        if not isinstance(files, list):  # Ensure valid file list
+    for device, recordings in zip(environment.device_manager.host_list, tmp_file_status):
+        if recordings is None:
             logger(f"Device {device.name}: Failed to retrieve temporary file list.")
             failed_devices.append(device.name)
             all_devices_successful = False
             continue
 
-        # **Classify files and folders based on extensions**
-        file_count = sum(1 for f in files if os.path.splitext(f)[1])  # Has an extension → file
-        folder_count = sum(1 for f in files if not os.path.splitext(f)[1])  # No extension → folder
+        # **Classify the top-level entries of the recording folder**
+        file_count = sum(1 for recording in recordings if not recording.is_dir)
+        folder_count = sum(1 for recording in recordings if recording.is_dir)
 
 
         if folder_count <= 1 and file_count <= 1:
@@ -343,7 +376,9 @@ def get_tmp_files(logger=None, environment=None):
             failed_devices.append(device.name)
             all_devices_successful = False
         logger(f"Device {device.name}: {file_count} files, {folder_count} folders")
-        logger(f"Device {device.name}: {files}")
+        for recording in recordings:
+            logger(f"Device {device.name}: {recording.name}: {recording.files} files, "
+                   f"{recording.bytes / 1024 ** 2:.1f} MB")
 
     # Final status return
     if failed_devices:
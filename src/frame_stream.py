@@ -0,0 +1,108 @@
+import socket
+import threading
+
+import paramiko
+
+# Exit status of the watch command when inotify-tools is not installed on the device
+WATCH_UNAVAILABLE = 127
+
+# Copy of the frame that is actually sent, so that the size sent always matches the bytes that follow
+STREAMED_FRAME = ".qontroller_frame.jpg"
+COPY_COMMAND = f"cp last_frame.jpg {STREAMED_FRAME}"
+
+# Device side: announce READY, push the current frame, then every new last_frame.jpg as "<size>\n<jpeg bytes>".
+WATCH_COMMAND = (
+    "command -v inotifywait >/dev/null 2>&1 || exit {unavailable}; "
+    "cd {tmp_dir} || exit 1; "
+    "send() {{ {copy_command} 2>/dev/null || return; "
+    "wc -c < {streamed_frame}; cat {streamed_frame}; }}; "
+    "echo READY; "
+    "[ -f last_frame.jpg ] && send; "
+    "inotifywait -m -q -e close_write,moved_to --format '%f' . | "
+    "while read -r name; do [ \"$name\" = last_frame.jpg ] && send; done"
+)
+
+
+class FrameStream:
+    """
+    Frames pushed by a device as soon as ~/tmp/last_frame.jpg is written, using inotify over
+    a single long-lived SSH channel. Nothing is transferred while no new frame is written.
+    """
+
+    def __init__(self, ssh, tmp_dir, on_frame, on_closed=None, copy_command=COPY_COMMAND, startup_timeout=5):
+        """
+        :param ssh: connected paramiko.SSHClient of the device
+        :param tmp_dir: remote folder containing last_frame.jpg
+        :param on_frame: callback receiving the JPEG bytes of each frame, called from the reader thread
+        :param on_closed: optional callback called when the stream ends
+        :param copy_command: command run in tmp_dir to produce STREAMED_FRAME from last_frame.jpg
+                             (e.g. to send a downscaled preview instead)
+        """
+        self.ssh = ssh
+        self.tmp_dir = tmp_dir
+        self.copy_command = copy_command
+        self.on_frame = on_frame
+        self.on_closed = on_closed
+        self.startup_timeout = startup_timeout
+        self.channel = None
+        self.stdout = None
+        self.thread = None
+        self.frames_received = 0
+        self._stopped = threading.Event()
+
+    @property
+    def running(self):
+        return self.thread is not None and self.thread.is_alive()
+
+    def start(self):
+        """Start watching the frame. Return False if the device cannot stream (e.g. inotify-tools missing)."""
+        try:
+            self.channel = self.ssh.get_transport().open_session()
+            self.channel.settimeout(self.startup_timeout)
+            self.channel.exec_command(WATCH_COMMAND.format(tmp_dir=self.tmp_dir, unavailable=WATCH_UNAVAILABLE,
+                                                           copy_command=self.copy_command,
+                                                           streamed_frame=STREAMED_FRAME))
+            self.stdout = self.channel.makefile("rb")
+
+            if self.stdout.readline().strip() != b"READY":
+                if self.channel.recv_exit_status() == WATCH_UNAVAILABLE:
+                    print("inotifywait is not installed on the device, frame streaming unavailable")
+                self.stop()
+                return False
+
+            self.channel.settimeout(None)
+        except (paramiko.SSHException, socket.timeout, OSError) as e:
+            print(f"Frame stream could not be started: {e}")
+            self.stop()
+            return False
+
+        self.thread = threading.Thread(target=self._read_frames, daemon=True)
+        self.thread.start()
+        return True
+
+    def _read_frames(self):
+        try:
+            while not self._stopped.is_set():
+                header = self.stdout.readline()
+                if not header:
+                    break
+                size = int(header)
+                data = self.stdout.read(size)
+                if len(data) < size:
+                    break
+                self.frames_received += 1
+                self.on_frame(data)
+        except (paramiko.SSHException, OSError, ValueError) as e:
+            if not self._stopped.is_set():
+                print(f"Frame stream interrupted: {e}")
+        finally:
+            if self.on_closed is not None and not self._stopped.is_set():
+                self.on_closed()
+
+    def stop(self):
+        self._stopped.set()
+        if self.channel is not None:
+            try:
+                self.channel.close()
+            except Exception:
+                pass
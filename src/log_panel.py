@@ -0,0 +1,114 @@
+from PyQt5 import QtCore, QtGui
+from PyQt5.QtWidgets import (
+    QDialog, QVBoxLayout, QHBoxLayout, QComboBox, QPlainTextEdit, QLineEdit, QPushButton, QFileDialog, QLabel
+)
+
+from .device_log import LOG_MAX_LINES
+
+# The panel is refreshed at most this often, however fast the devices write
+LOG_REFRESH_INTERVAL_MS = 250
+
+
+class LogPanel(QDialog):
+    """Output of one device at a time, appended as it arrives, with search and save to file."""
+
+    def __init__(self, devices, current_device=None, parent=None):
+        super().__init__(parent)
+        self.setWindowTitle("Device logs")
+        self.resize(900, 600)
+
+        self.devices = devices
+        self.shown_lines = 0  # DeviceLog.total_lines already displayed
+
+        self.init_ui()
+
+        if current_device in devices:
+            self.comboDevice.setCurrentIndex(devices.index(current_device))
+        self.show_device_log()
+
+        self.refresh_timer = QtCore.QTimer(self)
+        self.refresh_timer.timeout.connect(self.append_new_lines)
+        self.refresh_timer.start(LOG_REFRESH_INTERVAL_MS)
+
+    def init_ui(self):
+        self.comboDevice = QComboBox()
+        self.comboDevice.addItems([device.name for device in self.devices])
+        self.comboDevice.currentIndexChanged.connect(self.show_device_log)
+
+        self.textLog = QPlainTextEdit()
+        self.textLog.setReadOnly(True)
+        self.textLog.setMaximumBlockCount(LOG_MAX_LINES)  # Bounded like the device log itself
+        self.textLog.setFont(QtGui.QFontDatabase.systemFont(QtGui.QFontDatabase.FixedFont))
+
+        self.lineSearch = QLineEdit()
+        self.lineSearch.setPlaceholderText("Search")
+        self.lineSearch.returnPressed.connect(self.find_next)
+        self.btnFindNext = QPushButton("Find next")
+        self.btnFindNext.clicked.connect(self.find_next)
+        self.btnSave = QPushButton("Save to file...")
+        self.btnSave.clicked.connect(self.save_log)
+        self.labelSearchStatus = QLabel()
+
+        top_bar = QHBoxLayout()
+        top_bar.addWidget(self.comboDevice)
+        top_bar.addStretch()
+        top_bar.addWidget(self.btnSave)
+
+        search_bar = QHBoxLayout()
+        search_bar.addWidget(self.lineSearch)
+        search_bar.addWidget(self.btnFindNext)
+        search_bar.addWidget(self.labelSearchStatus)
+
+        layout = QVBoxLayout(self)
+        layout.addLayout(top_bar)
+        layout.addWidget(self.textLog)
+        layout.addLayout(search_bar)
+
+    def current_log(self):
+        index = self.comboDevice.currentIndex()
+        return self.devices[index].log if 0 <= index < len(self.devices) else None
+
+    def show_device_log(self):
+        self.textLog.clear()
+        self.shown_lines = 0
+        self.append_new_lines()
+
+    def append_new_lines(self):
+        log = self.current_log()
+        if log is None or log.total_lines == self.shown_lines:
+            return
+
+        lines, self.shown_lines, complete = log.lines_since(self.shown_lines)
+        if not complete:
+            self.textLog.appendPlainText("[... older lines dropped ...]")
+
+        # Only follow the output if the user did not scroll up
+        scroll_bar = self.textLog.verticalScrollBar()
+        at_bottom = scroll_bar.value() == scroll_bar.maximum()
+        self.textLog.appendPlainText("\n".join(lines))
+        if at_bottom:
+            scroll_bar.setValue(scroll_bar.maximum())
+
+    def find_next(self):
+        text = self.lineSearch.text()
+        if not text:
+            return
+        if not self.textLog.find(text):
+            # Wrap around to the beginning
+            self.textLog.moveCursor(QtGui.QTextCursor.Start)
+            if not self.textLog.find(text):
+                self.labelSearchStatus.setText("Not found")
+                return
+        self.labelSearchStatus.setText("")
+
+    def save_log(self):
+        log = self.current_log()
+        if log is None:
+            return
+        path, _ = QFileDialog.getSaveFileName(self, "Save log", f"{log.name}.log", "Log files (*.log *.txt)")
+        if path:
+            log.save(path)
+
+    def closeEvent(self, event):
+        self.refresh_timer.stop()
+        event.accept()
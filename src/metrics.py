@@ -0,0 +1,188 @@
+import json
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+
+# Upper bounds in seconds of the latency histogram buckets, the last bucket counts everything slower
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+METRIC_PREFIX = "wormstation_remote_call"
+
+
+@dataclass
+class OperationStats:
+    """Calls of one operation on one device: counts, latency histogram and bytes transferred."""
+
+    count: int = 0
+    errors: int = 0  # Calls that raised, e.g. lost connections and timeouts; a non-zero exit status is not an error
+    total_time: float = 0.0
+    max_time: float = 0.0
+    bytes_in: int = 0  # Received from the device
+    bytes_out: int = 0  # Sent to the device
+    buckets: list = field(default_factory=lambda: [0] * (len(LATENCY_BUCKETS) + 1))
+
+    def observe(self, duration, error=False, bytes_in=0, bytes_out=0):
+        self.count += 1
+        self.errors += bool(error)
+        self.total_time += duration
+        self.max_time = max(self.max_time, duration)
+        self.bytes_in += bytes_in
+        self.bytes_out += bytes_out
+        index = next((i for i, bound in enumerate(LATENCY_BUCKETS) if duration <= bound), len(LATENCY_BUCKETS))
+        self.buckets[index] += 1
+
+    @property
+    def mean_time(self):
+        return self.total_time / self.count if self.count else 0.0
+
+    def quantile(self, q):
+        """Latency under which a fraction q of the calls completed, to the resolution of the buckets."""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for bound, calls in zip(LATENCY_BUCKETS, self.buckets):
+            seen += calls
+            if seen >= rank:
+                return min(bound, self.max_time)
+        return self.max_time
+
+    def copy(self):
+        return OperationStats(self.count, self.errors, self.total_time, self.max_time, self.bytes_in, self.bytes_out,
+                              list(self.buckets))
+
+    def as_dict(self):
+        return {"count": self.count, "errors": self.errors, "total_time": round(self.total_time, 6),
+                "mean_time": round(self.mean_time, 6), "p50": self.quantile(0.5), "p95": self.quantile(0.95),
+                "max_time": round(self.max_time, 6), "bytes_in": self.bytes_in, "bytes_out": self.bytes_out,
+                "buckets": dict(zip([str(bound) for bound in LATENCY_BUCKETS] + ["+Inf"], self.buckets))}
+
+
+class CallTimer:
+    """Handed out by DeviceMetrics.timed, for the caller to report the bytes of the call."""
+
+    def __init__(self):
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.error = False
+
+
+class DeviceMetrics:
+    """Statistics of the remote calls to one device, per operation. Thread-safe."""
+
+    def __init__(self, name):
+        self.name = name
+        self.operations = {}  # Operation -> OperationStats
+        self._lock = threading.Lock()
+
+    def record(self, operation, duration, error=False, bytes_in=0, bytes_out=0):
+        with self._lock:
+            stats = self.operations.get(operation)
+            if stats is None:
+                stats = self.operations[operation] = OperationStats()
+            stats.observe(duration, error, bytes_in, bytes_out)
+
+    def add_bytes(self, operation, bytes_in=0, bytes_out=0):
+        """Add bytes to an operation already recorded, for calls whose size is only known by their caller."""
+        with self._lock:
+            stats = self.operations.get(operation)
+            if stats is not None:
+                stats.bytes_in += bytes_in
+                stats.bytes_out += bytes_out
+
+    @contextmanager
+    def timed(self, operation):
+        """Time the enclosed remote call; it counts as an error if it raises."""
+        call = CallTimer()
+        start = time.perf_counter()
+        try:
+            yield call
+        except BaseException:
+            call.error = True
+            raise
+        finally:
+            self.record(operation, time.perf_counter() - start, call.error, call.bytes_in, call.bytes_out)
+
+    def snapshot(self):
+        with self._lock:
+            return {operation: stats.copy() for operation, stats in self.operations.items()}
+
+    def reset(self):
+        with self._lock:
+            self.operations.clear()
+
+
+class MetricsRegistry:
+    """DeviceMetrics of all devices, kept by name so that they outlive reconnections and rescans."""
+
+    def __init__(self):
+        self.devices = {}  # Device name -> DeviceMetrics
+        self._lock = threading.Lock()
+
+    def device(self, name):
+        with self._lock:
+            metrics = self.devices.get(name)
+            if metrics is None:
+                metrics = self.devices[name] = DeviceMetrics(name)
+            return metrics
+
+    def snapshot(self):
+        """:return: {device name: {operation: OperationStats}}"""
+        with self._lock:
+            devices = list(self.devices.values())
+        return {metrics.name: metrics.snapshot() for metrics in devices}
+
+    def reset(self):
+        with self._lock:
+            devices = list(self.devices.values())
+        for metrics in devices:
+            metrics.reset()
+
+    def to_json(self):
+        snapshot = self.snapshot()
+        return json.dumps({"time": time.time(),
+                           "devices": {device: {operation: stats.as_dict() for operation, stats in operations.items()}
+                                       for device, operations in snapshot.items()}}, indent=2)
+
+    def to_prometheus(self):
+        """Prometheus text exposition format, e.g. for the textfile collector of node_exporter."""
+        lines = [f"# HELP {METRIC_PREFIX}_seconds Latency of the remote calls to the devices",
+                 f"# TYPE {METRIC_PREFIX}_seconds histogram"]
+        counters = {"errors_total": [], "bytes_received_total": [], "bytes_sent_total": []}
+
+        for device, operations in sorted(self.snapshot().items()):
+            for operation, stats in sorted(operations.items()):
+                labels = f'device="{escape_label(device)}",operation="{escape_label(operation)}"'
+                cumulative = 0
+                for bound, calls in zip(LATENCY_BUCKETS, stats.buckets):
+                    cumulative += calls
+                    lines.append(f'{METRIC_PREFIX}_seconds_bucket{{{labels},le="{bound}"}} {cumulative}')
+                lines.append(f'{METRIC_PREFIX}_seconds_bucket{{{labels},le="+Inf"}} {stats.count}')
+                lines.append(f"{METRIC_PREFIX}_seconds_sum{{{labels}}} {stats.total_time:.6f}")
+                lines.append(f"{METRIC_PREFIX}_seconds_count{{{labels}}} {stats.count}")
+                counters["errors_total"].append(f"{{{labels}}} {stats.errors}")
+                counters["bytes_received_total"].append(f"{{{labels}}} {stats.bytes_in}")
+                counters["bytes_sent_total"].append(f"{{{labels}}} {stats.bytes_out}")
+
+        descriptions = {"errors_total": "Remote calls that failed",
+                        "bytes_received_total": "Bytes received from the devices",
+                        "bytes_sent_total": "Bytes sent to the devices"}
+        for name, samples in counters.items():
+            lines.append(f"# HELP {METRIC_PREFIX}_{name} {descriptions[name]}")
+            lines.append(f"# TYPE {METRIC_PREFIX}_{name} counter")
+            lines.extend(f"{METRIC_PREFIX}_{name}{sample}" for sample in samples)
+        return "\n".join(lines) + "\n"
+
+    def save(self, path):
+        """Write the statistics to path, as JSON if it ends with .json and in the Prometheus format otherwise."""
+        text = self.to_json() if path.lower().endswith(".json") else self.to_prometheus()
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(text)
+
+
+def escape_label(value):
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+# Shared by all devices of the application
+registry = MetricsRegistry()
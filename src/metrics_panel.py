@@ -0,0 +1,127 @@
+from PyQt5 import QtCore
+from PyQt5.QtWidgets import (
+    QDialog, QVBoxLayout, QHBoxLayout, QComboBox, QTableWidget, QTableWidgetItem, QPushButton, QFileDialog, QLabel,
+    QHeaderView
+)
+
+from . import metrics
+
+METRICS_REFRESH_INTERVAL_MS = 1000
+ALL_DEVICES = "All devices"
+COLUMNS = ("Device", "Operation", "Calls", "Errors", "Mean (ms)", "p50 (ms)", "p95 (ms)", "Max (ms)",
+           "Total (s)", "Received (kB)", "Sent (kB)")
+
+
+class NumericItem(QTableWidgetItem):
+    """Table cell sorted by value rather than by text."""
+
+    def __init__(self, value, text):
+        super().__init__(text)
+        self.value = value
+        self.setTextAlignment(QtCore.Qt.AlignRight | QtCore.Qt.AlignVCenter)
+
+    def __lt__(self, other):
+        if isinstance(other, NumericItem):
+            return self.value < other.value
+        return super().__lt__(other)
+
+
+class MetricsPanel(QDialog):
+    """Latency, errors and bytes of the remote calls, per device and operation, with export to a file."""
+
+    def __init__(self, registry=None, parent=None):
+        super().__init__(parent)
+        self.setWindowTitle("Remote call statistics")
+        self.resize(1000, 600)
+
+        self.registry = registry or metrics.registry
+
+        self.init_ui()
+        self.refresh()
+
+        self.refresh_timer = QtCore.QTimer(self)
+        self.refresh_timer.timeout.connect(self.refresh)
+        self.refresh_timer.start(METRICS_REFRESH_INTERVAL_MS)
+
+    def init_ui(self):
+        self.comboDevice = QComboBox()
+        self.comboDevice.addItem(ALL_DEVICES)
+        self.comboDevice.currentIndexChanged.connect(self.refresh)
+
+        self.labelTotals = QLabel()
+        self.btnReset = QPushButton("Reset")
+        self.btnReset.clicked.connect(self.reset)
+        self.btnExport = QPushButton("Export...")
+        self.btnExport.clicked.connect(self.export)
+
+        self.table = QTableWidget(0, len(COLUMNS))
+        self.table.setHorizontalHeaderLabels(COLUMNS)
+        self.table.setEditTriggers(QTableWidget.NoEditTriggers)
+        self.table.setSelectionBehavior(QTableWidget.SelectRows)
+        self.table.verticalHeader().setVisible(False)
+        self.table.horizontalHeader().setSectionResizeMode(QHeaderView.ResizeToContents)
+        self.table.setSortingEnabled(True)
+        self.table.sortByColumn(COLUMNS.index("Total (s)"), QtCore.Qt.DescendingOrder)
+
+        top_bar = QHBoxLayout()
+        top_bar.addWidget(self.comboDevice)
+        top_bar.addWidget(self.labelTotals)
+        top_bar.addStretch()
+        top_bar.addWidget(self.btnReset)
+        top_bar.addWidget(self.btnExport)
+
+        layout = QVBoxLayout(self)
+        layout.addLayout(top_bar)
+        layout.addWidget(self.table)
+
+    def update_device_choices(self, devices):
+        known = {self.comboDevice.itemText(i) for i in range(self.comboDevice.count())}
+        for device in sorted(set(devices) - known):
+            self.comboDevice.addItem(device)
+
+    def refresh(self):
+        snapshot = self.registry.snapshot()
+        self.update_device_choices(snapshot)
+
+        selected = self.comboDevice.currentText()
+        rows = [(device, operation, stats) for device, operations in snapshot.items() for operation, stats in
+                operations.items() if selected in (ALL_DEVICES, device)]
+
+        # Sorting while filling the table would move the rows being written
+        self.table.setSortingEnabled(False)
+        self.table.setRowCount(len(rows))
+        for row, (device, operation, stats) in enumerate(rows):
+            cells = [
+                QTableWidgetItem(device),
+                QTableWidgetItem(operation),
+                NumericItem(stats.count, str(stats.count)),
+                NumericItem(stats.errors, str(stats.errors)),
+                NumericItem(stats.mean_time, f"{stats.mean_time * 1000:.1f}"),
+                NumericItem(stats.quantile(0.5), f"{stats.quantile(0.5) * 1000:.0f}"),
+                NumericItem(stats.quantile(0.95), f"{stats.quantile(0.95) * 1000:.0f}"),
+                NumericItem(stats.max_time, f"{stats.max_time * 1000:.1f}"),
+                NumericItem(stats.total_time, f"{stats.total_time:.2f}"),
+                NumericItem(stats.bytes_in, f"{stats.bytes_in / 1024:.1f}"),
+                NumericItem(stats.bytes_out, f"{stats.bytes_out / 1024:.1f}"),
+            ]
+            for column, cell in enumerate(cells):
+                self.table.setItem(row, column, cell)
+        self.table.setSortingEnabled(True)
+
+        calls = sum(stats.count for _, _, stats in rows)
+        errors = sum(stats.errors for _, _, stats in rows)
+        self.labelTotals.setText(f"{calls} calls, {errors} errors")
+
+    def reset(self):
+        self.registry.reset()
+        self.refresh()
+
+    def export(self):
+        path, _ = QFileDialog.getSaveFileName(self, "Export statistics", "wormstation_metrics.prom",
+                                              "Prometheus text file (*.prom);;JSON (*.json)")
+        if path:
+            self.registry.save(path)
+
+    def closeEvent(self, event):
+        self.refresh_timer.stop()
+        event.accept()
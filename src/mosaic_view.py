@@ -0,0 +1,183 @@
+import datetime as dt
+import math
+import threading
+
+from PyQt5 import QtCore, QtGui
+from PyQt5.QtWidgets import (
+    QDialog, QVBoxLayout, QHBoxLayout, QGridLayout, QWidget, QLabel, QPushButton, QCheckBox, QSpinBox, QScrollArea,
+    QFrame
+)
+
+# Frames are downscaled on the devices to the tile size before transfer
+TILE_SIZE = (320, 240)
+
+
+class MosaicTile(QFrame):
+    """Thumbnail of one device with the time its frame was received."""
+
+    def __init__(self, device_name, parent=None):
+        super().__init__(parent)
+        self.device_name = device_name
+        self.frame = None
+        self.error = None
+        self.setFrameShape(QFrame.StyledPanel)
+
+        self.image_label = QLabel("Waiting for frame...")
+        self.image_label.setAlignment(QtCore.Qt.AlignCenter)
+        self.image_label.setFixedSize(*TILE_SIZE)
+        self.caption_label = QLabel(device_name)
+
+        layout = QVBoxLayout(self)
+        layout.addWidget(self.image_label)
+        layout.addWidget(self.caption_label)
+
+    def set_frame(self, frame, image):
+        self.frame = frame
+        self.error = None
+        self.image_label.setPixmap(QtGui.QPixmap.fromImage(image))
+        self.update_caption()
+
+    def set_error(self, error):
+        # Keep the last frame displayed, only flag the failure
+        self.error = error
+        self.update_caption()
+
+    def update_caption(self):
+        caption = self.device_name
+        if self.frame is not None:
+            received = dt.datetime.fromtimestamp(self.frame.received_at).strftime('%H:%M:%S')
+            caption += f" - {received} ({self.frame.age:.0f} s ago)"
+        if self.error is not None:
+            caption += f" - {self.error}"
+        self.caption_label.setStyleSheet("color: red" if self.error is not None else "")
+        self.caption_label.setText(caption)
+
+
+class MosaicWindow(QDialog):
+    """Thumbnails of several devices, fetched concurrently and updated as each device answers."""
+
+    frame_ready = QtCore.pyqtSignal(int, object, QtGui.QImage)
+    frame_failed = QtCore.pyqtSignal(int, str)
+    fetch_finished = QtCore.pyqtSignal()
+
+    def __init__(self, dm, devices, config_provider, max_in_flight=8, parent=None):
+        """
+        :param dm: DeviceManager used to fetch the frames
+        :param devices: devices to display, in tile order
+        :param config_provider: callable returning the preview configuration dictionary
+        :param max_in_flight: maximum number of devices fetched at the same time
+        """
+        super().__init__(parent)
+        self.setWindowTitle("Mosaic")
+        self.resize(1200, 800)
+
+        self.dm = dm
+        self.devices = devices
+        self.config_provider = config_provider
+        self.max_in_flight = max_in_flight
+        self.fetch_pending = False
+
+        self.init_ui()
+
+        self.frame_ready.connect(self.on_frame_ready)
+        self.frame_failed.connect(self.on_frame_failed)
+        self.fetch_finished.connect(self.on_fetch_finished)
+
+        # Periodically refresh the frames and the ages shown in the captions
+        self.refresh_timer = QtCore.QTimer(self)
+        self.refresh_timer.timeout.connect(self.refresh)
+        self.caption_timer = QtCore.QTimer(self)
+        self.caption_timer.timeout.connect(self.update_captions)
+        self.caption_timer.start(1000)
+
+        self.refresh()
+
+    def init_ui(self):
+        self.btnRefresh = QPushButton("Refresh")
+        self.btnRefresh.clicked.connect(self.refresh)
+        self.checkAutoRefresh = QCheckBox("Auto refresh every (s)")
+        self.checkAutoRefresh.toggled.connect(self.set_auto_refresh)
+        self.spinRefreshInterval = QSpinBox()
+        self.spinRefreshInterval.setRange(2, 600)
+        self.spinRefreshInterval.setValue(10)
+        self.spinRefreshInterval.valueChanged.connect(lambda: self.set_auto_refresh(self.checkAutoRefresh.isChecked()))
+
+        controls = QHBoxLayout()
+        controls.addWidget(self.btnRefresh)
+        controls.addWidget(self.checkAutoRefresh)
+        controls.addWidget(self.spinRefreshInterval)
+        controls.addStretch()
+
+        # Roughly square grid, in the order of the device list
+        columns = max(1, math.ceil(math.sqrt(len(self.devices))))
+        tiles_widget = QWidget()
+        grid = QGridLayout(tiles_widget)
+        self.tiles = []
+        for index, device in enumerate(self.devices):
+            tile = MosaicTile(device.name)
+            grid.addWidget(tile, index // columns, index % columns)
+            self.tiles.append(tile)
+
+        scroll_area = QScrollArea()
+        scroll_area.setWidgetResizable(True)
+        scroll_area.setWidget(tiles_widget)
+
+        layout = QVBoxLayout(self)
+        layout.addLayout(controls)
+        layout.addWidget(scroll_area)
+
+    def set_auto_refresh(self, checked):
+        if checked:
+            self.refresh_timer.start(self.spinRefreshInterval.value() * 1000)
+        else:
+            self.refresh_timer.stop()
+
+    def refresh(self):
+        """Fetch new frames from all devices in the background. Skipped while the previous fetch is running."""
+        if self.fetch_pending:
+            return
+
+        self.fetch_pending = True
+        self.btnRefresh.setEnabled(False)
+        config = self.config_provider()
+        threading.Thread(target=self.fetch_frames, args=(config,), daemon=True).start()
+
+    def fetch_frames(self, config):
+        def on_frame(index, device, frame, error):
+            # Called from the fetch threads: decode there, the GUI thread only converts to a pixmap
+            if error is not None:
+                self.frame_failed.emit(index, str(error))
+            elif frame is None:
+                self.frame_failed.emit(index, "no frame")
+            elif frame.is_new or frame is not self.tiles[index].frame:
+                self.frame_ready.emit(index, frame, frame.decode(QtCore.QSize(*TILE_SIZE)))
+
+        try:
+            self.dm.fetch_frames(self.devices, config, on_frame, preview_size=TILE_SIZE,
+                                 max_in_flight=self.max_in_flight)
+        except Exception as e:
+            print(f"Mosaic refresh failed: {e}")
+        finally:
+            self.fetch_finished.emit()
+
+    @QtCore.pyqtSlot(int, object, QtGui.QImage)
+    def on_frame_ready(self, index, frame, image):
+        self.tiles[index].set_frame(frame, image)
+
+    @QtCore.pyqtSlot(int, str)
+    def on_frame_failed(self, index, error):
+        self.tiles[index].set_error(error)
+
+    @QtCore.pyqtSlot()
+    def on_fetch_finished(self):
+        self.fetch_pending = False
+        self.btnRefresh.setEnabled(True)
+
+    def update_captions(self):
+        for tile in self.tiles:
+            tile.update_caption()
+
+    def closeEvent(self, event):
+        self.refresh_timer.stop()
+        self.caption_timer.stop()
+        event.accept()
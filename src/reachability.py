@@ -0,0 +1,136 @@
+import asyncio
+import time
+from dataclasses import dataclass
+from typing import Optional
+
+SSH_PORT = 22
+
+
+def split_address(address, default_port=SSH_PORT):
+    """
+    Split a host list entry into host and port, e.g. "192.168.1.10" or "127.0.0.1:2201".
+    :return: tuple (host, port)
+    """
+    host, separator, port = address.rpartition(":")
+    if separator and port.isdigit() and ":" not in host:
+        return host, int(port)
+    return address, default_port
+
+
+@dataclass
+class ProbeResult:
+    """Reachability of one host."""
+
+    host: str
+    reachable: bool
+    latency: Optional[float] = None  # Seconds to establish the TCP connection
+    banner: Optional[str] = None  # SSH identification string, if read
+    error: Optional[BaseException] = None
+
+
+class RttEstimator:
+    """
+    Smoothed round-trip time of a host and the probe timeout derived from it,
+    computed like the TCP retransmission timeout (RFC 6298).
+    """
+
+    alpha = 1 / 8
+    beta = 1 / 4
+
+    def __init__(self, initial_timeout=1.0, min_timeout=0.5, max_timeout=5.0):
+        self.initial_timeout = initial_timeout
+        self.min_timeout = min_timeout
+        self.max_timeout = max_timeout
+        self.srtt = None
+        self.rttvar = None
+        self.backoff = 1
+
+    @property
+    def has_samples(self):
+        return self.srtt is not None
+
+    def add_sample(self, rtt):
+        if self.srtt is None:
+            self.srtt = rtt
+            self.rttvar = rtt / 2
+        else:
+            self.rttvar = (1 - self.beta) * self.rttvar + self.beta * abs(self.srtt - rtt)
+            self.srtt = (1 - self.alpha) * self.srtt + self.alpha * rtt
+        self.backoff = 1
+
+    def on_timeout(self):
+        # Give a slow host more time at the next probe
+        self.backoff = min(self.backoff * 2, 8)
+
+    @property
+    def timeout(self):
+        timeout = self.initial_timeout if self.srtt is None else self.srtt + 4 * self.rttvar
+        return min(max(timeout * self.backoff, self.min_timeout), self.max_timeout)
+
+
+class ReachabilityProber:
+    """
+    Probe many hosts at once with non-blocking TCP connections to the SSH port, from a single asyncio loop.
+    Hosts may give their own port as "host:port".
+    Timeouts adapt to the round-trip times observed on previous probes.
+    """
+
+    def __init__(self, port=SSH_PORT, read_banner=True, initial_timeout=1.0, min_timeout=0.5, max_timeout=5.0):
+        """
+        :param read_banner: also wait for the SSH identification string, to check that sshd answers
+        :param initial_timeout: timeout in seconds while no round-trip time has been observed
+        """
+        self.port = port
+        self.read_banner = read_banner
+        self.timeout_bounds = dict(initial_timeout=initial_timeout, min_timeout=min_timeout, max_timeout=max_timeout)
+        self.estimators = {}  # Per host, kept across probes
+        self.fleet_estimator = RttEstimator(**self.timeout_bounds)  # All samples, used for hosts never reached
+
+    def timeout_for(self, host):
+        estimator = self.estimators.get(host)
+        if estimator is not None and estimator.has_samples:
+            return estimator.timeout
+        # Never reached: use the round-trip times of the other hosts, longer after each timeout of this host
+        backoff = estimator.backoff if estimator is not None else 1
+        return min(self.fleet_estimator.timeout * backoff, self.timeout_bounds["max_timeout"])
+
+    async def probe_host(self, host):
+        estimator = self.estimators.setdefault(host, RttEstimator(**self.timeout_bounds))
+        timeout = self.timeout_for(host)
+        start = time.monotonic()
+        writer = None
+        try:
+            address, port = split_address(host, self.port)
+            reader, writer = await asyncio.wait_for(asyncio.open_connection(address, port), timeout)
+            latency = time.monotonic() - start
+            estimator.add_sample(latency)
+            self.fleet_estimator.add_sample(latency)
+
+            banner = None
+            if self.read_banner:
+                line = await asyncio.wait_for(reader.readline(), timeout)
+                banner = line.decode("ascii", errors="replace").strip()
+                if not banner.startswith("SSH-"):
+                    return ProbeResult(host, False, latency, banner, ConnectionError("Not an SSH server"))
+
+            return ProbeResult(host, True, latency, banner)
+        except asyncio.TimeoutError as e:
+            estimator.on_timeout()
+            return ProbeResult(host, False, error=e)
+        except OSError as e:
+            return ProbeResult(host, False, error=e)
+        finally:
+            if writer is not None:
+                writer.close()
+
+    async def probe_all(self, hosts):
+        return await asyncio.gather(*(self.probe_host(host) for host in hosts))
+
+    def probe(self, hosts):
+        """
+        Probe all hosts concurrently.
+        :return: list of ProbeResult, in the order of hosts
+        """
+        if not hosts:
+            return []
+        return asyncio.run(self.probe_all(hosts))
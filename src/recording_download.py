@@ -0,0 +1,220 @@
+import hashlib
+import os
+import shlex
+import stat
+import threading
+import time
+from dataclasses import dataclass, field
+
+import paramiko
+
+DOWNLOAD_WINDOW_SIZE = 32 * 1024 * 1024  # SSH channel window of the download sessions, keeps many reads in flight
+READ_WINDOW = 4 * 1024 * 1024  # Bytes requested at once with pipelined reads
+MAX_CONCURRENT_READS = 128  # Read requests in flight per file (32 KiB each)
+MIN_FILE_AGE = 60  # Seconds since the last modification, newer files may still be written by picam
+CHECKSUM_TIMEOUT = 900  # Seconds given to the device to hash a file, recordings can be several GB
+PARTIAL_SUFFIX = ".part"
+
+
+class BandwidthLimiter:
+    """Token bucket shared by all downloads, so that their total rate stays under a cap."""
+
+    def __init__(self, bytes_per_second=None, burst_seconds=1.0):
+        """
+        :param bytes_per_second: total rate allowed, None for no limit
+        :param burst_seconds: how long the full rate can be exceeded after an idle period
+        """
+        self.rate = bytes_per_second
+        self.capacity = bytes_per_second * burst_seconds if bytes_per_second else None
+        self.tokens = self.capacity
+        self.last_refill = time.monotonic()
+        self._lock = threading.Lock()
+
+    def consume(self, nbytes):
+        """Wait until nbytes may be transferred."""
+        if not self.rate:
+            return
+
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.last_refill) * self.rate)
+            self.last_refill = now
+            # Go into debt and wait for it to be paid back, so large requests are not starved by small ones
+            self.tokens -= nbytes
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0
+
+        if wait > 0:
+            time.sleep(wait)
+
+
+@dataclass
+class RemoteFile:
+    path: str
+    relative_path: str
+    size: int
+    mtime: float
+
+
+@dataclass
+class DownloadReport:
+    """Files pulled from one device."""
+
+    downloaded: int = 0
+    resumed: int = 0  # Among the downloaded files, those continued from a partial download
+    skipped: int = 0  # Already downloaded, or still being written
+    bytes: int = 0  # Transferred during this pull
+    errors: list = field(default_factory=list)  # (remote path, error) of the files that could not be pulled
+
+    def __str__(self):
+        text = (f"{self.downloaded} files downloaded ({self.resumed} resumed), {self.skipped} skipped, "
+                f"{self.bytes / 1024 ** 2:.1f} MB")
+        if self.errors:
+            text += f", {len(self.errors)} errors"
+        return text
+
+
+class RecordingDownloader:
+    """
+    Pull the recordings left on the devices, with one SFTP session per device.
+    Partial files are resumed, and every file is checked against its checksum on the device
+    before taking its final name.
+    """
+
+    def __init__(self, destination, max_bandwidth=None, min_file_age=MIN_FILE_AGE, on_progress=None):
+        """
+        :param destination: local folder, the files of each device go to destination/<device name>/
+        :param max_bandwidth: total download rate in bytes per second over all devices, None for no limit
+        :param on_progress: called from the download threads with (device, remote_file, bytes_done)
+        """
+        self.destination = destination
+        self.limiter = BandwidthLimiter(max_bandwidth)
+        self.min_file_age = min_file_age
+        self.on_progress = on_progress
+        self.bytes_transferred = 0  # Over all devices
+        self._lock = threading.Lock()
+
+    def open_sftp(self, device):
+        """Dedicated SFTP session with a large window, so downloads do not hold the shared session of the device."""
+        device.ensure_online()
+        return paramiko.SFTPClient.from_transport(device.ssh.get_transport(), window_size=DOWNLOAD_WINDOW_SIZE)
+
+    def list_files(self, sftp, folder, relative_folder=""):
+        files = []
+        for entry in sftp.listdir_attr(folder):
+            path = f"{folder}/{entry.filename}"
+            relative_path = os.path.join(relative_folder, entry.filename)
+            if stat.S_ISDIR(entry.st_mode):
+                files.extend(self.list_files(sftp, path, relative_path))
+            elif stat.S_ISREG(entry.st_mode):
+                files.append(RemoteFile(path, relative_path, entry.st_size, entry.st_mtime))
+        return files
+
+    def pull(self, device, remote_folder):
+        """
+        Download all files of remote_folder from the device.
+        :return: DownloadReport
+        """
+        report = DownloadReport()
+        local_folder = os.path.join(self.destination, device.name)
+
+        try:
+            sftp = self.open_sftp(device)
+        except (paramiko.ssh_exception.SSHException, EOFError) as e:
+            device.on_call_failed(e)
+            raise
+
+        try:
+            try:
+                with device.metrics.timed("list_recordings"):
+                    files = self.list_files(sftp, remote_folder)
+            except FileNotFoundError:
+                return report  # Nothing was ever recorded on this device
+
+            for remote_file in files:
+                local_path = os.path.join(local_folder, remote_file.relative_path)
+                if time.time() - remote_file.mtime < self.min_file_age:
+                    report.skipped += 1  # Still being recorded
+                    continue
+                if os.path.isfile(local_path) and os.path.getsize(local_path) == remote_file.size:
+                    report.skipped += 1  # Only complete, verified files take their final name
+                    continue
+
+                try:
+                    self.pull_file(device, sftp, remote_file, local_path, report)
+                except (OSError, ValueError) as e:
+                    print(f"Could not pull {remote_file.path} from {device.name}: {e}")
+                    report.errors.append((remote_file.path, e))
+        except (paramiko.ssh_exception.SSHException, EOFError) as e:
+            device.on_call_failed(e)
+            raise
+        finally:
+            sftp.close()
+
+        device.log.append(f"Recordings pulled to {local_folder}: {report}")
+        return report
+
+    def pull_file(self, device, sftp, remote_file, local_path, report):
+        partial_path = local_path + PARTIAL_SUFFIX
+        os.makedirs(os.path.dirname(local_path), exist_ok=True)
+
+        resumed = os.path.isfile(partial_path) and os.path.getsize(partial_path) <= remote_file.size
+        digest = self.download(device, sftp, remote_file, partial_path, resume=resumed, report=report)
+        expected = self.remote_checksum(device, remote_file.path)
+
+        if digest != expected and resumed:
+            # The partial file may come from a different or corrupted transfer, start over once
+            print(f"Checksum mismatch on resumed {remote_file.path} from {device.name}, downloading it again")
+            resumed = False
+            digest = self.download(device, sftp, remote_file, partial_path, resume=False, report=report)
+
+        if digest != expected:
+            os.remove(partial_path)
+            raise ValueError(f"checksum mismatch (device {expected}, downloaded {digest})")
+
+        os.replace(partial_path, local_path)
+        os.utime(local_path, (remote_file.mtime, remote_file.mtime))
+        report.downloaded += 1
+        report.resumed += resumed
+
+    def download(self, device, sftp, remote_file, partial_path, resume, report):
+        """
+        Download remote_file to partial_path, continuing after the bytes already there if resume is True.
+        :return: SHA-256 hex digest of the whole local file
+        """
+        sha256 = hashlib.sha256()
+        offset = 0
+        if resume:
+            with open(partial_path, "rb") as f:
+                for block in iter(lambda: f.read(1024 * 1024), b""):
+                    sha256.update(block)
+                    offset += len(block)
+
+        with device.metrics.timed("download_recording") as call, sftp.open(remote_file.path, "rb") as remote, \
+                open(partial_path, "ab" if resume else "wb") as local:
+            while offset < remote_file.size:
+                length = min(READ_WINDOW, remote_file.size - offset)
+                self.limiter.consume(length)
+                # readv pipelines the read requests of the whole window instead of waiting for each of them
+                data = next(remote.readv([(offset, length)], max_concurrent_prefetch_requests=MAX_CONCURRENT_READS))
+                if not data:
+                    raise ValueError(f"{remote_file.path} is shorter than expected")
+
+                local.write(data)
+                sha256.update(data)
+                offset += len(data)
+                report.bytes += len(data)
+                call.bytes_in += len(data)
+                with self._lock:
+                    self.bytes_transferred += len(data)
+                if self.on_progress is not None:
+                    self.on_progress(device, remote_file, offset)
+
+        return sha256.hexdigest()
+
+    def remote_checksum(self, device, path):
+        status, output = device.run_command(f"sha256sum {shlex.quote(path)}", timeout=CHECKSUM_TIMEOUT,
+                                            op="remote_checksum")
+        checksum = output.split()[0] if output.split() else ""
+        if status != 0 or len(checksum) != 64:
+            raise OSError(f"could not compute the checksum on the device: {output.strip()}")
+        return checksum
@@ -0,0 +1,125 @@
+import json
+import os
+import socket
+import threading
+
+import paramiko
+
+AGENT_SCRIPT_NAME = "qontroller_agent.py"
+AGENT_SCRIPT_LOCAL_PATH = os.path.join(os.path.dirname(__file__), "device_scripts", AGENT_SCRIPT_NAME)
+
+
+class AgentError(Exception):
+    """Raised when the remote agent is unavailable or returns an invalid answer."""
+
+
+class AgentCallError(AgentError, paramiko.SSHException):
+    """
+    Raised when the agent fails after the request was sent: the command may have run on the device,
+    so it must not be run again by other means.
+    """
+
+
+class RemoteAgent:
+    """
+    Long-lived helper process running on a device, driven over a single SSH channel.
+
+    Requests and answers are exchanged as line-delimited JSON (see device_scripts/qontroller_agent.py).
+    Calls are serialized: the agent handles one command at a time.
+    """
+
+    def __init__(self, ssh, script_path, startup_timeout=5):
+        self.ssh = ssh
+        self.script_path = script_path
+        self.startup_timeout = startup_timeout
+        self.channel = None
+        self.stdin = None
+        self.stdout = None
+        self.remote_pid = None
+        self._next_id = 0
+        self._lock = threading.Lock()
+
+    @property
+    def alive(self):
+        return self.channel is not None and not self.channel.closed and not self.channel.exit_status_ready()
+
+    def start(self):
+        """Start the agent on the device. Return True if it answered the handshake."""
+        try:
+            transport = self.ssh.get_transport()
+            self.channel = transport.open_session()
+            self.channel.settimeout(self.startup_timeout)
+            self.channel.exec_command(f"python3 -u {self.script_path} serve")
+            self.stdin = self.channel.makefile_stdin("wb")
+            self.stdout = self.channel.makefile("r")
+
+            handshake = json.loads(self.stdout.readline())
+            if not handshake.get("ready"):
+                raise AgentError(f"Unexpected handshake: {handshake}")
+
+            self.remote_pid = handshake.get("pid")
+            self.channel.settimeout(None)
+            return True
+        except (paramiko.SSHException, socket.timeout, OSError, ValueError, AgentError) as e:
+            print(f"Remote agent could not be started: {e}")
+            self.close()
+            return False
+
+    def call(self, command, timeout=None):
+        """
+        Run a shell command through the agent.
+        :param command: shell command to execute on the device
+        :param timeout: seconds after which the remote command is killed
+        :return: tuple (exit_status, output)
+        """
+        with self._lock:
+            if not self.alive:
+                raise AgentError("Agent is not running")
+
+            self._next_id += 1
+            request = {"id": self._next_id, "cmd": command, "timeout": timeout}
+
+            try:
+                # Give the channel a bit more time than the remote command itself
+                self.channel.settimeout(timeout + 5 if timeout else None)
+                # The agent only handles complete lines: if this fails, the command did not run
+                self.stdin.write(json.dumps(request) + "\n")
+                self.stdin.flush()
+            except (paramiko.SSHException, socket.timeout, OSError) as e:
+                self.close()
+                raise AgentError(f"Agent channel failed: {e}")
+
+            try:
+                line = self.stdout.readline()
+            except (paramiko.SSHException, socket.timeout, OSError) as e:
+                self.close()
+                raise AgentCallError(f"No answer from agent to {command!r}: {e}")
+
+            if not line:
+                self.close()
+                raise AgentCallError(f"Agent closed the channel while running {command!r}")
+
+            try:
+                answer = json.loads(line)
+            except json.JSONDecodeError:
+                self.close()
+                raise AgentCallError(f"Invalid answer from agent: {line!r}")
+
+            if answer.get("id") != request["id"]:
+                self.close()
+                raise AgentCallError(f"Mismatched answer from agent: {answer}")
+
+            if "error" in answer:
+                raise AgentCallError(answer["error"])
+
+            return answer["status"], answer["stdout"]
+
+    def close(self):
+        if self.channel is not None:
+            try:
+                self.channel.close()
+            except Exception:
+                pass
+        self.channel = None
+        self.stdin = None
+        self.stdout = None
@@ -0,0 +1,611 @@
+"""
+Simulated WormStation devices, to exercise the controller against many stations without Raspberry Pis.
+
+Each station is an SSH and SFTP server on a localhost port. Commands run in a real shell, with the home folder
+of the station instead of /home/<user> and fake picam, pgrep, pkill, led_switch, self_check and git
+scripts (see bin/) first in the PATH. Network latency, bandwidth and failures can be injected.
+
+Usage:
+    python -m src.simulator.fake_station --count 200 --base-port 2200 --latency-ms 20
+
+then set "hosts_list_file" and "ssh_key_file" in config.json to the files printed at startup.
+"""
+
+import argparse
+import errno
+import json
+import logging
+import os
+import posixpath
+import queue
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from dataclasses import dataclass, asdict
+from typing import Optional
+
+import paramiko
+
+SIMULATOR_FOLDER = os.path.dirname(os.path.abspath(__file__))
+BIN_FOLDER = os.path.join(SIMULATOR_FOLDER, "bin")
+FRAME_FILE = os.path.join(os.path.dirname(os.path.dirname(SIMULATOR_FOLDER)), "blank.jpg")
+DEFAULT_ROOT = os.path.join(tempfile.gettempdir(), "fake_wormstations")
+DEFAULT_BASE_PORT = 2200
+PROFILE_FILE = ".fake_station.json"  # In the home folder of each station, read by the fake scripts
+
+# Logger of the server side of the connections, silent: probes closing the connection right away are expected
+SERVER_LOG_CHANNEL = "fake_station.transport"
+logging.getLogger(SERVER_LOG_CHANNEL).addHandler(logging.NullHandler())
+logging.getLogger(SERVER_LOG_CHANNEL).propagate = False
+
+# Delay between the end of a command (exit status and EOF sent) and the closing of its channel. The server
+# answers the exec request only after starting the command, and a channel closed before that answer fails.
+CLOSE_DELAY = 1.0
+
+
+@dataclass
+class LinkProfile:
+    """Network between the controller and a station."""
+
+    latency: float = 0.0  # One-way delay in seconds, in both directions
+    jitter: float = 0.0  # Random additional one-way delay, up to this many seconds
+    bandwidth: Optional[float] = None  # Bytes per second from the station to the controller, None for no limit
+
+    @property
+    def is_ideal(self):
+        return not self.latency and not self.jitter and not self.bandwidth
+
+
+@dataclass
+class FailureProfile:
+    """
+    Probabilities of the failures injected by a station. Command failures apply to the commands executed on
+    their own channel, not to those sent to a remote agent already running.
+    """
+
+    refuse_connection: float = 0.0  # Per connection: closed as soon as it is accepted
+    drop_connection: float = 0.0  # Per command: the whole SSH connection is dropped
+    hang: float = 0.0  # Per command: never answered
+    fail_command: float = 0.0  # Per command: exit status 255 with an error message
+
+    def pick_command_failure(self):
+        draw = random.random()
+        for failure in ("drop_connection", "hang", "fail_command"):
+            draw -= getattr(self, failure)
+            if draw < 0:
+                return failure
+        return None
+
+
+@dataclass
+class StationProfile:
+    """Hardware of a station, as reported by the fake picam and self_check scripts."""
+
+    name: str = ""
+    camera: bool = True
+    nas: bool = True
+    leds: bool = True
+    free_gb: Optional[float] = None  # Free disk space reported by self_check, the actual one if None
+    frame_interval: Optional[float] = None  # Seconds between frames, time_interval of the configuration if None
+
+
+class DelayLine:
+    """One direction of an emulated link: what is received on src is sent to dst after a delay, at a limited rate."""
+
+    def __init__(self, src, dst, latency=0.0, jitter=0.0, bandwidth=None, on_sent=None, on_closed=None):
+        """
+        :param on_sent: called with the number of bytes after each send
+        :param on_closed: called once nothing more can be sent
+        """
+        self.src = src
+        self.dst = dst
+        self.latency = latency
+        self.jitter = jitter
+        self.bandwidth = bandwidth
+        self.on_sent = on_sent
+        self.on_closed = on_closed
+        self._queue = queue.Queue()
+        threading.Thread(target=self._receive, daemon=True).start()
+        threading.Thread(target=self._send, daemon=True).start()
+
+    def _receive(self):
+        while True:
+            try:
+                data = self.src.recv(65536)
+            except OSError:
+                data = b""
+            self._queue.put((time.monotonic() + self.latency + random.uniform(0, self.jitter), data))
+            if not data:
+                return
+
+    def _send(self):
+        try:
+            while True:
+                due, data = self._queue.get()
+                delay = due - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+                if not data:
+                    self.dst.shutdown(socket.SHUT_WR)
+                    return
+                self.dst.sendall(data)
+                if self.on_sent is not None:
+                    self.on_sent(len(data))
+                if self.bandwidth:
+                    time.sleep(len(data) / self.bandwidth)  # Time to serialize the data on the link
+        except OSError:
+            pass
+        finally:
+            if self.on_closed is not None:
+                self.on_closed()
+
+
+def emulate_link(client_socket, link, station=None):
+    """
+    Put an emulated link between an accepted connection and the SSH server.
+    :param station: FakeStation whose traffic statistics are updated
+    :return: socket to give to the SSH server
+    """
+    station_side, server_side = socket.socketpair()
+    closed_lines = []
+
+    def on_closed():
+        closed_lines.append(True)
+        if len(closed_lines) == 2:
+            client_socket.close()
+            station_side.close()
+
+    def counter(name):
+        return (lambda count: station.count(name, count)) if station is not None else None
+
+    DelayLine(client_socket, station_side, link.latency, link.jitter,
+              on_sent=counter("bytes_received"), on_closed=on_closed)
+    DelayLine(station_side, client_socket, link.latency, link.jitter, link.bandwidth,
+              on_sent=counter("bytes_sent"), on_closed=on_closed)
+    return server_side
+
+
+def load_or_create_key(path):
+    if os.path.exists(path):
+        return paramiko.RSAKey(filename=path)
+    key = paramiko.RSAKey.generate(2048)
+    key.write_private_key_file(path)
+    return key
+
+
+class StationServer(paramiko.ServerInterface):
+    """SSH side of a station: any user and any key or password is accepted."""
+
+    def __init__(self, station):
+        self.station = station
+        self.username = None
+        self.pty_channels = set()
+
+    def get_allowed_auths(self, username):
+        return "publickey,password"
+
+    def check_auth_publickey(self, username, key):
+        self.username = username
+        return paramiko.AUTH_SUCCESSFUL
+
+    def check_auth_password(self, username, password):
+        self.username = username
+        return paramiko.AUTH_SUCCESSFUL
+
+    def check_channel_request(self, kind, chanid):
+        if kind == "session":
+            return paramiko.OPEN_SUCCEEDED
+        return paramiko.OPEN_FAILED_ADMINISTRATIVELY_PROHIBITED
+
+    def check_channel_pty_request(self, channel, term, width, height, pixelwidth, pixelheight, modes):
+        self.pty_channels.add(channel.get_id())
+        return True
+
+    def check_channel_exec_request(self, channel, command):
+        pty = channel.get_id() in self.pty_channels
+        threading.Thread(target=self.station.run_command, daemon=True,
+                         args=(channel, command.decode("utf-8", errors="replace"), self.username, pty)).start()
+        return True
+
+
+class StationHandle(paramiko.SFTPHandle):
+    def stat(self):
+        try:
+            file = getattr(self, "readfile", None) or self.writefile
+            return paramiko.SFTPAttributes.from_stat(os.fstat(file.fileno()))
+        except OSError as e:
+            return paramiko.SFTPServer.convert_errno(e.errno)
+
+
+class StationSFTP(paramiko.SFTPServerInterface):
+    """SFTP side of a station: /home/<user> is the home folder of the station, nothing outside of it is visible."""
+
+    def __init__(self, server, station):
+        super().__init__(server)
+        self.station = station
+        self.remote_home = f"/home/{server.username}"
+
+    def remote_path(self, path):
+        if not path.startswith("/"):
+            path = posixpath.join(self.remote_home, path)
+        return posixpath.normpath(path)
+
+    def local_path(self, path):
+        self.station.count("sftp_requests")
+        path = self.remote_path(path)
+        if path != self.remote_home and not path.startswith(self.remote_home + "/"):
+            raise PermissionError(errno.EACCES, "Outside of the home folder", path)
+        return self.station.home + path[len(self.remote_home):]
+
+    def canonicalize(self, path):
+        return self.remote_path(path)
+
+    def list_folder(self, path):
+        try:
+            folder = self.local_path(path)
+            entries = []
+            for filename in os.listdir(folder):
+                attributes = paramiko.SFTPAttributes.from_stat(os.lstat(os.path.join(folder, filename)))
+                attributes.filename = filename
+                entries.append(attributes)
+            return entries
+        except OSError as e:
+            return paramiko.SFTPServer.convert_errno(e.errno)
+
+    def stat(self, path):
+        try:
+            return paramiko.SFTPAttributes.from_stat(os.stat(self.local_path(path)))
+        except OSError as e:
+            return paramiko.SFTPServer.convert_errno(e.errno)
+
+    def lstat(self, path):
+        try:
+            return paramiko.SFTPAttributes.from_stat(os.lstat(self.local_path(path)))
+        except OSError as e:
+            return paramiko.SFTPServer.convert_errno(e.errno)
+
+    def open(self, path, flags, attr):
+        try:
+            fd = os.open(self.local_path(path), flags, getattr(attr, "st_mode", None) or 0o666)
+        except OSError as e:
+            return paramiko.SFTPServer.convert_errno(e.errno)
+
+        if flags & os.O_WRONLY:
+            mode = "ab" if flags & os.O_APPEND else "wb"
+        elif flags & os.O_RDWR:
+            mode = "a+b" if flags & os.O_APPEND else "r+b"
+        else:
+            mode = "rb"
+        handle = StationHandle(flags)
+        handle.filename = path
+        file = os.fdopen(fd, mode)
+        handle.readfile = file if "r" in mode or "+" in mode else None
+        handle.writefile = file if mode != "rb" else None
+        return handle
+
+    def remove(self, path):
+        return self._call(os.remove, path)
+
+    def rename(self, oldpath, newpath):
+        return self._call(os.rename, oldpath, newpath)
+
+    def posix_rename(self, oldpath, newpath):
+        return self._call(os.replace, oldpath, newpath)
+
+    def mkdir(self, path, attr):
+        return self._call(os.mkdir, path)
+
+    def rmdir(self, path):
+        return self._call(os.rmdir, path)
+
+    def chattr(self, path, attr):
+        try:
+            local_path = self.local_path(path)
+            if attr.st_mode is not None:
+                os.chmod(local_path, attr.st_mode)
+            if attr.st_atime is not None and attr.st_mtime is not None:
+                os.utime(local_path, (attr.st_atime, attr.st_mtime))
+            return paramiko.SFTP_OK
+        except OSError as e:
+            return paramiko.SFTPServer.convert_errno(e.errno)
+
+    def _call(self, operation, *paths):
+        try:
+            operation(*(self.local_path(path) for path in paths))
+            return paramiko.SFTP_OK
+        except OSError as e:
+            return paramiko.SFTPServer.convert_errno(e.errno)
+
+
+class FakeStation:
+    """A simulated WormStation listening on a localhost port."""
+
+    def __init__(self, home, host_key, port=0, host="127.0.0.1", profile=None, link=None, failures=None):
+        """
+        :param home: folder used as the home folder of the station, created if needed
+        :param port: TCP port, 0 for any free port
+        """
+        self.home = os.path.abspath(home)
+        self.host_key = host_key
+        self.host = host
+        self.port = port
+        self.profile = profile or StationProfile()
+        self.link = link or LinkProfile()
+        self.failures = failures or FailureProfile()
+        self.offline = False  # Connections are refused while True
+        # Traffic is only counted with an emulated link (see LinkProfile.is_ideal)
+        self.stats = {"connections": 0, "commands": 0, "sftp_requests": 0, "bytes_sent": 0, "bytes_received": 0}
+        self._socket = None
+        self._transports = []
+        self._lock = threading.Lock()
+
+    @property
+    def address(self):
+        """Entry of the hosts list file for this station."""
+        return f"{self.host}:{self.port}"
+
+    def start(self):
+        for folder in ("tmp", "piworm", ".config/wormstation", "wormstation_recordings"):
+            os.makedirs(os.path.join(self.home, folder), exist_ok=True)
+        if not self.profile.name:
+            self.profile.name = os.path.basename(self.home)
+        self.write_profile()
+
+        self._socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self._socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self._socket.bind((self.host, self.port))
+        self._socket.listen(64)
+        self.port = self._socket.getsockname()[1]
+        threading.Thread(target=self._accept_connections, name=f"station {self.port}", daemon=True).start()
+        return self
+
+    def stop(self):
+        if self._socket is not None:
+            self._socket.close()
+            self._socket = None
+        self.drop_connections()
+        subprocess.run(["pkill", "picam"], env=self.environment("pi"), cwd=self.home, capture_output=True)
+
+    def count(self, name, amount=1):
+        with self._lock:
+            self.stats[name] += amount
+
+    def write_profile(self):
+        with open(os.path.join(self.home, PROFILE_FILE), "w") as f:
+            json.dump(asdict(self.profile), f)
+
+    def update_profile(self, **changes):
+        """Change the simulated hardware, e.g. update_profile(camera=False)."""
+        for name, value in changes.items():
+            setattr(self.profile, name, value)
+        self.write_profile()
+
+    def set_offline(self, offline=True):
+        """Drop the current connections and refuse new ones, as if the station was unplugged."""
+        self.offline = offline
+        if offline:
+            self.drop_connections()
+
+    def drop_connections(self):
+        with self._lock:
+            transports, self._transports = self._transports, []
+        for transport in transports:
+            transport.close()
+
+    def _accept_connections(self):
+        while self._socket is not None:
+            try:
+                client_socket, _ = self._socket.accept()
+            except OSError:
+                return
+            if self.offline or random.random() < self.failures.refuse_connection:
+                client_socket.close()
+                continue
+            try:
+                self._serve(client_socket)
+            except (OSError, paramiko.SSHException) as e:
+                print(f"Station {self.port}: connection failed ({e})")
+                client_socket.close()
+
+    def _serve(self, client_socket):
+        self.count("connections")
+        server_socket = client_socket if self.link.is_ideal else emulate_link(client_socket, self.link, self)
+        transport = paramiko.Transport(server_socket)
+        transport.set_log_channel(SERVER_LOG_CHANNEL)
+        transport.add_server_key(self.host_key)
+        server = StationServer(self)
+        transport.set_subsystem_handler("sftp", paramiko.SFTPServer, StationSFTP, self)
+        transport.start_server(event=threading.Event(), server=server)  # Negotiated in the transport thread
+        with self._lock:
+            self._transports = [t for t in self._transports if t.is_active()] + [transport]
+
+    def environment(self, username):
+        environment = dict(os.environ)
+        environment.update(HOME=self.home, USER=username or "", LOGNAME=username or "", SHELL="/bin/sh",
+                           PATH=f"{BIN_FOLDER}{os.pathsep}{os.environ.get('PATH', '')}",
+                           FAKE_STATION_FRAME=FRAME_FILE)
+        return environment
+
+    def rewrite(self, data, username):
+        """Replace the home folder the controller expects by the one of the station."""
+        return data.replace(f"/home/{username}".encode(), self.home.encode())
+
+    def run_command(self, channel, command, username, pty):
+        """Execute a command received on channel and send its output and exit status back."""
+        self.count("commands")
+        failure = self.failures.pick_command_failure()
+        if failure == "drop_connection":
+            channel.get_transport().close()
+            return
+        if failure == "hang":
+            return
+
+        if failure == "fail_command":
+            channel.sendall(b"Simulated failure\n")
+            self._finish(channel, 255)
+            return
+
+        process = subprocess.Popen(self.rewrite(command.encode(), username), shell=True, cwd=self.home,
+                                   env=self.environment(username), start_new_session=True,
+                                   stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                                   stderr=subprocess.STDOUT if pty else subprocess.PIPE)
+        threading.Thread(target=self._forward_input, args=(channel, process, username), daemon=True).start()
+        stderr_thread = None
+        if not pty:
+            stderr_thread = threading.Thread(target=self._forward_output, daemon=True,
+                                             args=(process.stderr, channel.sendall_stderr))
+            stderr_thread.start()
+
+        self._forward_output(process.stdout, channel.sendall)
+        if stderr_thread is not None:
+            stderr_thread.join()
+        status = process.wait()
+        if status < 0:
+            status = 128 - status  # Killed by a signal, reported like a shell does
+        self._finish(channel, status)
+
+    @staticmethod
+    def _finish(channel, status):
+        try:
+            channel.send_exit_status(status)
+            channel.shutdown_write()
+        except (OSError, EOFError, paramiko.SSHException):
+            pass
+        threading.Timer(CLOSE_DELAY, channel.close).start()
+
+    @staticmethod
+    def _forward_output(pipe, send):
+        try:
+            for chunk in iter(lambda: pipe.read1(65536), b""):
+                send(chunk)
+        except (OSError, EOFError, paramiko.SSHException):
+            pass
+
+    def _forward_input(self, channel, process, username):
+        """Copy the input of the channel to the process, line by line so that paths can be rewritten."""
+        pending = b""
+        try:
+            for chunk in iter(lambda: channel.recv(65536), b""):
+                *lines, pending = (pending + chunk).split(b"\n")
+                for line in lines:
+                    process.stdin.write(self.rewrite(line, username) + b"\n")
+                process.stdin.flush()
+            if pending:
+                process.stdin.write(self.rewrite(pending, username))
+            process.stdin.close()
+        except (OSError, EOFError, paramiko.SSHException):
+            pass
+
+        # The controller closed the channel of a command still running (e.g. the remote agent or a frame stream)
+        if channel.closed and process.poll() is None:
+            try:
+                os.killpg(process.pid, 15)
+            except OSError:
+                pass
+
+
+class FakeStationFarm:
+    """Fake stations on consecutive localhost ports, with the hosts list file and the client key to reach them."""
+
+    def __init__(self, count, base_port=DEFAULT_BASE_PORT, root=DEFAULT_ROOT, link=None, failures=None):
+        """
+        :param base_port: port of the first station, 0 to use any free ports
+        :param root: folder holding the home folders of the stations, the keys and the hosts list file
+        """
+        self.count = count
+        self.base_port = base_port
+        self.root = os.path.abspath(root)
+        self.link = link or LinkProfile()
+        self.failures = failures or FailureProfile()
+        self.stations = []
+
+    @property
+    def hosts_file(self):
+        return os.path.join(self.root, "hosts_list.txt")
+
+    @property
+    def client_key_file(self):
+        return os.path.join(self.root, "client_key")
+
+    @property
+    def addresses(self):
+        return [station.address for station in self.stations]
+
+    def start(self):
+        os.makedirs(self.root, exist_ok=True)
+        # Kept between runs, so that known_hosts entries of previous runs stay valid
+        host_key = load_or_create_key(os.path.join(self.root, "host_key"))
+        load_or_create_key(self.client_key_file)
+
+        for i in range(self.count):
+            port = self.base_port + i if self.base_port else 0
+            station = FakeStation(os.path.join(self.root, f"station_{i:03d}"), host_key, port=port,
+                                  profile=StationProfile(name=f"fake-{i:03d}"), link=self.link, failures=self.failures)
+            self.stations.append(station.start())
+
+        with open(self.hosts_file, "w") as f:
+            f.write("# Fake WormStations\n")
+            f.write("\n".join(self.addresses) + "\n")
+        return self
+
+    def stop(self):
+        for station in self.stations:
+            station.stop()
+
+    def stats(self):
+        """Statistics summed over all stations."""
+        totals = {}
+        for station in self.stations:
+            for name, value in station.stats.items():
+                totals[name] = totals.get(name, 0) + value
+        return totals
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run fake WormStations on localhost")
+    parser.add_argument("--count", type=int, default=10, help="number of stations")
+    parser.add_argument("--base-port", type=int, default=DEFAULT_BASE_PORT, help="port of the first station")
+    parser.add_argument("--root", default=DEFAULT_ROOT, help="folder of the stations")
+    parser.add_argument("--latency-ms", type=float, default=0, help="one-way network delay")
+    parser.add_argument("--jitter-ms", type=float, default=0, help="random additional one-way delay")
+    parser.add_argument("--bandwidth-mbps", type=float, default=None, help="rate from each station, in Mbit/s")
+    parser.add_argument("--refuse-connection", type=float, default=0, help="probability to refuse a connection")
+    parser.add_argument("--drop-connection", type=float, default=0, help="probability to drop the connection on a command")
+    parser.add_argument("--hang", type=float, default=0, help="probability to never answer a command")
+    parser.add_argument("--fail-command", type=float, default=0, help="probability for a command to fail")
+    args = parser.parse_args()
+
+    link = LinkProfile(latency=args.latency_ms / 1000, jitter=args.jitter_ms / 1000,
+                       bandwidth=args.bandwidth_mbps * 1e6 / 8 if args.bandwidth_mbps else None)
+    failures = FailureProfile(refuse_connection=args.refuse_connection, drop_connection=args.drop_connection,
+                              hang=args.hang, fail_command=args.fail_command)
+
+    with FakeStationFarm(args.count, args.base_port, args.root, link, failures) as farm:
+        print(f"{args.count} fake stations running on ports {farm.stations[0].port}-{farm.stations[-1].port}")
+        print(f'"hosts_list_file": "{farm.hosts_file}"')
+        print(f'"ssh_key_file": "{farm.client_key_file}"')
+        print('Enter "stats" for the statistics of the stations, "quit" to stop', flush=True)
+        try:
+            # Also driven through stdin by fleet_benchmark
+            for line in sys.stdin:
+                if line.strip() == "stats":
+                    print(json.dumps(farm.stats()), flush=True)
+                elif line.strip() == "quit":
+                    break
+        except KeyboardInterrupt:
+            pass
+        print("Stopping the fake stations")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,341 @@
+"""
+Benchmark of the fleet operations against fake WormStations, see fake_station.py.
+
+For each fleet size, fake stations are started in a separate process and the controller runs headless against
+them: scan_devices (first scan, then a rescan keeping the connections), check_updates, refresh_view on every
+device, and the self-check tasks. Each operation records its wall time, the SSH round trips (commands and SFTP
+requests) and bytes seen by the stations, the connections opened and the peak number of threads of the controller.
+
+Usage:
+    python -m src.simulator.fleet_benchmark --sizes 1 10 50 200 --output results.json
+    python -m src.simulator.fleet_benchmark --compare baseline.json results.json
+
+The comparison exits with status 1 if an operation got slower than the threshold or needs more round trips.
+"""
+
+import argparse
+import contextlib
+import datetime
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+from src.simulator.fake_station import FRAME_FILE
+
+REPOSITORY_FOLDER = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+DEFAULT_SIZES = (1, 10, 50, 200)
+DEFAULT_LATENCY_MS = 1.0
+DEFAULT_THRESHOLD = 0.2  # Relative slowdown reported as a regression
+MIN_SLOWDOWN = 0.05  # Seconds, smaller differences are noise
+THREAD_SAMPLING_INTERVAL = 0.002
+FARM_STARTUP_TIMEOUT = 120
+USERNAME = "pi"
+RECORDING_FOLDER = "wormstation_recordings"
+SELF_CHECK_TASKS = ("CheckClientsSoftwareVersion", "CheckNasConnection", "CheckNasMount", "CheckDiskSpace",
+                    "CheckCamera", "AutoLedCheck", "GetTmpFiles")  # The others load the configuration and connect
+
+
+class FarmProcess:
+    """Fake stations running in a child process, so that their threads do not count as threads of the controller."""
+
+    def __init__(self, count, root, latency_ms=DEFAULT_LATENCY_MS):
+        self.count = count
+        self.root = root
+        self.latency_ms = latency_ms
+        self.process = None
+        self.hosts_file = None
+        self.client_key_file = None
+
+    def start(self):
+        self.process = subprocess.Popen(
+            [sys.executable, "-m", "src.simulator.fake_station", "--count", str(self.count), "--base-port", "0",
+             "--root", self.root, "--latency-ms", str(self.latency_ms)],
+            cwd=REPOSITORY_FOLDER, stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True, bufsize=1)
+
+        deadline = time.monotonic() + FARM_STARTUP_TIMEOUT
+        while time.monotonic() < deadline:
+            line = self.process.stdout.readline()
+            if not line:
+                raise RuntimeError(f"The fake stations exited with status {self.process.wait()}")
+            if line.startswith('"hosts_list_file"'):
+                self.hosts_file = json.loads("{" + line + "}")["hosts_list_file"]
+            elif line.startswith('"ssh_key_file"'):
+                self.client_key_file = json.loads("{" + line + "}")["ssh_key_file"]
+            elif line.startswith("Enter"):
+                return self
+        self.stop()
+        raise RuntimeError(f"The fake stations did not start within {FARM_STARTUP_TIMEOUT} s")
+
+    def stats(self):
+        """Statistics summed over all stations, see FakeStation.stats."""
+        self.process.stdin.write("stats\n")
+        while True:
+            line = self.process.stdout.readline()
+            if not line:
+                raise RuntimeError("The fake stations exited")
+            if line.startswith("{"):
+                return json.loads(line)
+
+    def stop(self):
+        if self.process is None:
+            return
+        try:
+            self.process.stdin.write("quit\n")
+            self.process.stdin.close()
+            self.process.wait(timeout=30)
+        except (OSError, subprocess.TimeoutExpired):
+            self.process.kill()
+            self.process.wait()
+        self.process = None
+
+
+class ThreadSampler:
+    """Peak number of threads of this process while a measure runs."""
+
+    def __init__(self, interval=THREAD_SAMPLING_INTERVAL):
+        self.interval = interval
+        self.peak = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def __enter__(self):
+        self.peak = threading.active_count()
+        self._thread = threading.Thread(target=self._sample, name="thread-sampler", daemon=True)
+        self._thread.start()
+        return self
+
+    def _sample(self):
+        while not self._stop.wait(self.interval):
+            self.peak = max(self.peak, threading.active_count() - 1)  # Without the sampler itself
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self._stop.set()
+        self._thread.join()
+
+
+class FleetBenchmark:
+    """Run the measured operations against one farm of fake stations, through the real controller window."""
+
+    def __init__(self, farm, work_folder, repeat=3, verbose=False):
+        self.farm = farm
+        self.work_folder = work_folder
+        self.repeat = repeat
+        self.verbose = verbose
+        self.window = None
+        self.results = []
+        self.quiet = None  # Output of the controller while quiet, see run
+
+    def measure(self, operation, func, prepare=None):
+        """
+        Run func repeat times and keep the run of median wall time.
+        :param prepare: called before each run, not measured
+        """
+        runs = []
+        for _ in range(self.repeat):
+            if prepare is not None:
+                with self.controller_output():
+                    prepare()
+            before = self.farm.stats()
+            with self.controller_output(), ThreadSampler() as sampler:
+                start = time.perf_counter()
+                failures = func()
+                wall_time = time.perf_counter() - start
+            after = self.farm.stats()
+            runs.append({
+                "operation": operation,
+                "devices": self.farm.count,
+                "wall_time": wall_time,
+                "round_trips": (after["commands"] - before["commands"]
+                                + after["sftp_requests"] - before["sftp_requests"]),
+                "bytes_sent": after["bytes_sent"] - before["bytes_sent"],
+                "bytes_received": after["bytes_received"] - before["bytes_received"],
+                "connections": after["connections"] - before["connections"],
+                "peak_threads": sampler.peak,
+                "failures": failures or 0,
+            })
+
+        result = sorted(runs, key=lambda run: run["wall_time"])[len(runs) // 2]
+        result["runs"] = [run["wall_time"] for run in runs]
+        self.results.append(result)
+        print(format_result(result))
+        return result
+
+    def controller_output(self):
+        """Context in which the prints of the controller are hidden, unless verbose."""
+        return contextlib.nullcontext() if self.verbose else contextlib.redirect_stdout(self.quiet)
+
+    def open_window(self):
+        """Controller window reading its configuration from the work folder, like a user with these stations."""
+        from PyQt5 import QtWidgets
+        from src.config_wizard import save_config
+        from src.QontrollerUI import QontrollerUI
+
+        self.app = QtWidgets.QApplication.instance() or QtWidgets.QApplication([])
+        os.chdir(self.work_folder)
+        save_config({"hosts_list_file": self.farm.hosts_file, "username": USERNAME,
+                     "ssh_key_file": self.farm.client_key_file, "recording_folder": RECORDING_FOLDER})
+        with self.controller_output():
+            self.window = QontrollerUI()
+        self.window.device_status_timer.stop()  # Only the measured operations talk to the stations
+
+    def new_device_manager(self):
+        from src.device_manager import DeviceManager
+
+        for device in self.window.dm.host_list:
+            device.close()
+        self.window.dm.shutdown()
+        self.window.dm = DeviceManager(key_filename=self.farm.client_key_file)
+
+    def scan_devices(self):
+        self.window.scan_devices()
+        return self.farm.count - len(self.window.dm.host_list)
+
+    def check_updates(self):
+        self.window.dm.check_updates()
+
+    def refresh_view(self):
+        """refresh_view on each device in turn, as when going through the device list."""
+        failures = 0
+        for device_id in range(len(self.window.dm.host_list)):
+            self.window.currentDeviceID = device_id
+            self.window.current_frame = None
+            self.window.refresh_view()
+            failures += self.window.current_frame is None
+        return failures
+
+    def self_check(self):
+        from src.config_wizard import load_config
+        from src.diagnostic_tools.diagnostic_manager import DiagnosticManager
+
+        manager = DiagnosticManager(recording_config={"local_tmp_dir": RECORDING_FOLDER})
+        manager.environment.config = load_config()
+        manager.environment.device_manager = self.window.dm
+        manager.environment.device_manager.push_config(manager.environment.recording_config)
+        failures = 0
+        for index, task in enumerate(manager.get_tasks()):
+            if task.name in SELF_CHECK_TASKS:
+                manager.run_task(index)
+                failures += task.status == task.STATUS_FAILURE
+        return failures
+
+    def run(self):
+        with open(os.devnull, "w") as self.quiet:
+            return self.run_measures()
+
+    def run_measures(self):
+        self.open_window()
+        try:
+            self.measure("scan_devices", self.scan_devices, prepare=self.new_device_manager)
+            self.measure("rescan_devices", self.scan_devices)
+            self.measure("check_updates", self.check_updates)
+            self.measure("refresh_view", self.refresh_view)
+            self.measure("self_check", self.self_check)
+        finally:
+            with self.controller_output():
+                for device in self.window.dm.host_list:
+                    device.close()
+            self.window.dm.shutdown()
+            self.window.async_bridge.stop()
+            os.chdir(REPOSITORY_FOLDER)
+        return self.results
+
+
+def format_result(result):
+    return (f"{result['operation']:<15} {result['devices']:>4} devices  {result['wall_time']:8.3f} s  "
+            f"{result['round_trips']:6d} round trips  {(result['bytes_sent'] + result['bytes_received']) / 1024:9.1f} kB  "
+            f"{result['connections']:4d} connections  {result['peak_threads']:4d} threads"
+            + (f"  {result['failures']} failed" if result["failures"] else ""))
+
+
+def current_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=REPOSITORY_FOLDER, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_benchmarks(sizes, latency_ms=DEFAULT_LATENCY_MS, repeat=3, verbose=False):
+    """:return: JSON-serializable results, see compare_results"""
+    if not os.path.isfile(FRAME_FILE):
+        raise FileNotFoundError(f"{FRAME_FILE} is needed by the fake stations")
+
+    results = []
+    for count in sizes:
+        root = tempfile.mkdtemp(prefix=f"fleet_benchmark_{count}_")
+        farm = FarmProcess(count, os.path.join(root, "stations"), latency_ms).start()
+        try:
+            results.extend(FleetBenchmark(farm, root, repeat, verbose).run())
+        finally:
+            farm.stop()
+            shutil.rmtree(root, ignore_errors=True)
+
+    return {"commit": current_commit(), "date": datetime.datetime.now().isoformat(timespec="seconds"),
+            "platform": platform.platform(), "python": platform.python_version(), "cpu_count": os.cpu_count(),
+            "latency_ms": latency_ms, "repeat": repeat, "results": results}
+
+
+def compare_results(baseline, current, threshold=DEFAULT_THRESHOLD):
+    """
+    Print the operations measured in both result files side by side.
+    :return: list of the regressions, as text
+    """
+    previous = {(result["operation"], result["devices"]): result for result in baseline["results"]}
+    regressions = []
+    print(f"{baseline.get('commit')} -> {current.get('commit')}")
+    for result in current["results"]:
+        key = (result["operation"], result["devices"])
+        old = previous.get(key)
+        if old is None:
+            continue
+        ratio = result["wall_time"] / old["wall_time"] if old["wall_time"] else float("inf")
+        print(f"{key[0]:<15} {key[1]:>4} devices  {old['wall_time']:8.3f} s -> {result['wall_time']:8.3f} s "
+              f"({ratio:5.2f}x)  {old['round_trips']:6d} -> {result['round_trips']:6d} round trips  "
+              f"{old['peak_threads']:4d} -> {result['peak_threads']:4d} threads")
+        if ratio > 1 + threshold and result["wall_time"] - old["wall_time"] > MIN_SLOWDOWN:
+            regressions.append(f"{key[0]} on {key[1]} devices is {ratio:.2f}x slower")
+        if result["round_trips"] > old["round_trips"]:
+            regressions.append(f"{key[0]} on {key[1]} devices needs {result['round_trips']} round trips "
+                               f"instead of {old['round_trips']}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the fleet operations against fake WormStations")
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES, help="numbers of stations")
+    parser.add_argument("--latency-ms", type=float, default=DEFAULT_LATENCY_MS, help="one-way network delay")
+    parser.add_argument("--repeat", type=int, default=3, help="runs of each operation, the median is kept")
+    parser.add_argument("--output", help="JSON file to write the results to")
+    parser.add_argument("--compare", nargs=2, metavar=("BASELINE", "RESULTS"), help="compare two result files")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                        help="relative slowdown reported as a regression")
+    parser.add_argument("--verbose", action="store_true", help="show the output of the controller")
+    args = parser.parse_args()
+
+    if args.compare:
+        with open(args.compare[0]) as f:
+            baseline = json.load(f)
+        with open(args.compare[1]) as f:
+            current = json.load(f)
+        regressions = compare_results(baseline, current, args.threshold)
+        for regression in regressions:
+            print(f"Regression: {regression}")
+        return 1 if regressions else 0
+
+    os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+    results = run_benchmarks(args.sizes, args.latency_ms, args.repeat, args.verbose)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=4)
+        print(f"Results written to {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,158 @@
+import posixpath
+import shlex
+import threading
+import time
+from dataclasses import dataclass
+
+FULL_REFRESH_INTERVAL = 600  # Seconds after which the whole folder is listed again, in case a change was missed
+MTIME_MARGIN = 1.0  # Seconds subtracted from the last device time, against coarse file system timestamps
+
+# Device time, then every entry of the folder: type (d or f), size, mtime and path
+FULL_LISTING_COMMAND = (
+    "date +%s.%N; cd {folder} 2>/dev/null || exit 0; "
+    "find . -mindepth 1 -printf 'M\\t%y\\t%s\\t%T@\\t%p\\n'"
+)
+# Device time, the entries modified since a time (M), and for every folder modified since then (D)
+# its current content (C), from which the deleted and moved entries are found
+INCREMENTAL_LISTING_COMMAND = (
+    "date +%s.%N; cd {folder} 2>/dev/null || exit 0; "
+    "find . -mindepth 1 -newermt @{since:.3f} -printf 'M\\t%y\\t%s\\t%T@\\t%p\\n'; "
+    "find . -type d -newermt @{since:.3f} -printf 'D\\t%p\\n' "
+    "-exec find {{}} -mindepth 1 -maxdepth 1 -printf 'C\\t%y\\t%s\\t%T@\\t%p\\n' \\;"
+)
+
+
+def relative_path(path):
+    """Path printed by find from the inventoried folder, './a/b' or '.', relative to that folder."""
+    return "" if path == "." else path[2:] if path.startswith("./") else path
+
+
+@dataclass
+class FileEntry:
+    path: str  # Relative to the inventoried folder
+    is_dir: bool
+    size: int
+    mtime: float
+
+    @classmethod
+    def from_fields(cls, file_type, size, mtime, path):
+        return cls(relative_path(path), file_type == "d", int(size), float(mtime))
+
+    @property
+    def parent(self):
+        return posixpath.dirname(self.path)
+
+    @property
+    def recording(self):
+        """Top-level entry this entry belongs to, each recording being a file or a folder of the inventoried folder."""
+        return self.path.split("/", 1)[0]
+
+
+@dataclass
+class RecordingTotals:
+    name: str
+    is_dir: bool
+    files: int
+    bytes: int
+    last_modified: float
+
+
+class TmpInventory:
+    """
+    Path, size and mtime of every file in a folder of a device, typically the folder where picam
+    writes its recordings. After a first full listing, refresh() only transfers what changed since the
+    previous refresh: the entries modified since then, and the content of the folders modified since then.
+    """
+
+    def __init__(self, device, folder, full_refresh_interval=FULL_REFRESH_INTERVAL):
+        self.device = device
+        self.folder = folder
+        self.full_refresh_interval = full_refresh_interval
+        self.entries = {}  # Relative path -> FileEntry
+        self.device_time = None  # Device clock when the last refresh started
+        self.last_full_refresh = None  # time.monotonic() of the last full listing
+        self._lock = threading.Lock()
+
+    def refresh(self, full=False):
+        """Bring the inventory up to date, with a full listing if required or if full is True."""
+        with self._lock:
+            if (full or self.device_time is None or
+                    time.monotonic() - self.last_full_refresh > self.full_refresh_interval):
+                self._full_refresh()
+            elif not self._incremental_refresh():
+                self._full_refresh()
+        return self
+
+    def _list(self, command):
+        status, output = self.device.run_command(command, op="tmp_inventory")
+        lines = [line.rstrip("\r") for line in output.splitlines()]
+        if status != 0 or not lines:
+            raise OSError(f"Could not list {self.folder} on {self.device.name}: {output.strip()}")
+        return float(lines[0]), [line.split("\t") for line in lines[1:] if line]
+
+    def _full_refresh(self):
+        device_time, records = self._list(FULL_LISTING_COMMAND.format(folder=shlex.quote(self.folder)))
+        self.entries = {}
+        for kind, *fields in records:
+            if kind == "M" and len(fields) == 4:
+                entry = FileEntry.from_fields(*fields)
+                self.entries[entry.path] = entry
+        self.device_time = device_time
+        self.last_full_refresh = time.monotonic()
+
+    def _incremental_refresh(self):
+        """:return: False if the changes cannot be applied incrementally and a full listing is needed"""
+        since = self.device_time - MTIME_MARGIN
+        device_time, records = self._list(INCREMENTAL_LISTING_COMMAND.format(folder=shlex.quote(self.folder),
+                                                                             since=since))
+        changed_folders = set()
+        modified = set()
+        children = {}  # Current content of each changed folder
+        for kind, *fields in records:
+            if kind == "D" and len(fields) == 1:
+                changed_folders.add(relative_path(fields[0]))
+            elif kind in ("M", "C") and len(fields) == 4:
+                entry = FileEntry.from_fields(*fields)
+                if kind == "M":
+                    modified.add(entry.path)
+                else:
+                    children.setdefault(entry.parent, set()).add(entry.path)
+                    if entry.is_dir and entry.path not in self.entries and entry.path not in modified:
+                        # Folder moved in from elsewhere: its content is older than the last refresh, list everything
+                        return False
+                self.entries[entry.path] = entry
+
+        for folder in changed_folders:
+            current = children.get(folder, set())
+            removed = [path for path, entry in self.entries.items() if entry.parent == folder and path not in current]
+            self.forget(removed)
+
+        self.device_time = device_time
+        return True
+
+    def forget(self, paths):
+        """Remove entries and everything below them from the inventory, e.g. after deleting them."""
+        for path in paths:
+            prefix = path + "/"
+            for subpath in [subpath for subpath in self.entries if subpath == path or subpath.startswith(prefix)]:
+                del self.entries[subpath]
+
+    @property
+    def top_level(self):
+        return sorted((entry for entry in self.entries.values() if entry.parent == ""), key=lambda entry: entry.path)
+
+    def recordings(self):
+        """Number of files, size and last modification of each top-level entry."""
+        totals = {entry.path: RecordingTotals(entry.path, entry.is_dir, 0, 0, entry.mtime) for entry in self.top_level}
+        for entry in self.entries.values():
+            recording = totals.get(entry.recording)
+            if recording is None or entry.is_dir:
+                continue
+            recording.files += 1
+            recording.bytes += entry.size
+            recording.last_modified = max(recording.last_modified, entry.mtime)
+        return list(totals.values())
+
+    @property
+    def total_bytes(self):
+        return sum(entry.size for entry in self.entries.values() if not entry.is_dir)
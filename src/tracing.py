@@ -0,0 +1,106 @@
+import itertools
+import json
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+
+TRACE_MAX_SPANS = 100000  # Spans kept in memory, older spans are dropped
+
+
+@dataclass
+class Span:
+    name: str
+    category: str
+    start: float  # time.perf_counter() in seconds
+    duration: float
+    thread_id: int
+    args: dict = field(default_factory=dict)
+
+
+class Tracer:
+    """
+    Timed spans of the work done by the application, kept in a fixed-size ring buffer and saved in the Chrome
+    trace event format (open the file in chrome://tracing or https://ui.perfetto.dev).
+    Spans opened inside a span of the same thread appear nested under it.
+    """
+
+    def __init__(self, max_spans=TRACE_MAX_SPANS):
+        self.enabled = True
+        self.spans = deque(maxlen=max_spans)
+        self.total_spans = 0  # Spans ever recorded, including the dropped ones
+        self.thread_names = {}  # Thread ident -> name, for the viewer
+        self._flow_ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def span(self, name, category="app", **args):
+        """
+        Record the time spent in the enclosed block. Yields the arguments of the span, to which the block
+        can add values known only at the end (e.g. a number of bytes).
+        """
+        if not self.enabled:
+            yield args
+            return
+
+        start = time.perf_counter()
+        try:
+            yield args
+        except BaseException as e:
+            args["error"] = repr(e)
+            raise
+        finally:
+            self.add(Span(name, category, start, time.perf_counter() - start, threading.get_ident(), args))
+
+    def add(self, span):
+        thread = threading.current_thread()
+        with self._lock:
+            self.spans.append(span)
+            self.total_spans += 1
+            self.thread_names.setdefault(thread.ident, thread.name)
+
+    def new_flow_id(self):
+        """Identifier linking spans of different threads, e.g. a frame fetched by a worker and displayed later."""
+        return next(self._flow_ids)
+
+    def clear(self):
+        with self._lock:
+            self.spans.clear()
+            self.total_spans = 0
+
+    def snapshot(self):
+        with self._lock:
+            return list(self.spans), dict(self.thread_names)
+
+    def to_chrome_trace(self):
+        spans, thread_names = self.snapshot()
+        pid = os.getpid()
+        events = [{"name": "thread_name", "ph": "M", "pid": pid, "tid": tid, "args": {"name": name}}
+                  for tid, name in thread_names.items()]
+        for span in spans:
+            events.append({"name": span.name, "cat": span.category, "ph": "X", "pid": pid, "tid": span.thread_id,
+                           "ts": span.start * 1e6, "dur": span.duration * 1e6,
+                           "args": {key: value if isinstance(value, (int, float, bool, str)) or value is None
+                                    else str(value) for key, value in span.args.items()}})
+            flow = span.args.get("flow")
+            if flow is not None:
+                # Arrows between the spans of the same flow, bound to the enclosing span
+                events.append({"name": "frame", "cat": "flow", "ph": "s" if span.args.get("flow_start") else "f",
+                               "bp": "e", "id": flow, "pid": pid, "tid": span.thread_id,
+                               "ts": (span.start + span.duration / 2) * 1e6})
+        return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+    def save(self, path):
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.to_chrome_trace(), f)
+
+
+# Shared by the whole application
+tracer = Tracer()
+
+
+def span(name, category="app", **args):
+    """Span of the shared tracer, see Tracer.span."""
+    return tracer.span(name, category, **args)